@@ -1,23 +1,37 @@
-import curses
+from .screen import A_ALTCHARSET, A_BOLD, A_DIM, A_NORMAL, A_UNDERLINE
+from .spatial import SpatialIndex
 
 
 class BaseTile(object):
 
-    def __init__(self):
+    """ Shared, immutable tile type.  One instance per subclass lives in
+    the tile registry (see tile_types), per-cell state is held in a
+    TileState side table """
+
+    __slots__ = ('tile_id', 'char', 'passable', 'opaque', 'color', 'a_mode',
+                 'mode', '_frozen')
+
+    def __init__(self, tile_id=0):
+        object.__setattr__(self, '_frozen', False)
+        self.tile_id = tile_id
         self.char = ' '
         self.passable = False   # allow/deny entity traversal of tile
-        self.visited = False    # indicate whether player has visited tile
-        self.items = []         # list of items on tile
-        self.entities = []      # contained entity list
+        self.opaque = None      # blocks sight, defaults to not passable
         self.color = None
-        self.a_mode = curses.A_NORMAL
+        self.a_mode = a_modes['normal']
         self.post_init()
-
-    @property
-    def has_player(self):
-        retval = True if any(e.__class__ == 'Player' for e in self.entities) \
-                else False
-        return retval
+        if self.opaque is None:
+            self.opaque = not self.passable
+        # Precomputed so drawing a tile never builds a new value
+        self.mode = self.a_mode if self.color is None \
+                    else self.a_mode | self.color
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError('{} is a shared tile type, {} is read-only'
+                                 .format(self.__class__.__name__, name))
+        super().__setattr__(name, value)
 
     def get_char(self, key):
         try:
@@ -27,36 +41,123 @@ class BaseTile(object):
             return '!'
 
     def get_col(self, col):
+        # Only tiles with a color need curses, headless runs never do
+        import curses
         try:
             # return the color pair curses.color_pair(X)
-            return col_pairs[col]
+            return curses.color_pair(col_pairs[col])
         except KeyError:
             return curses.color_pair(0)
 
     def post_init(self): pass
 
-    @property
-    def mode(self):
-        retval = self.a_mode if self.color is None \
-                 else self.a_mode | self.color
-        return retval
-
 
 class Wall(BaseTile):
 
+    __slots__ = ()
+
     def post_init(self):
         self.char = self.get_char('board')
-        self.a_mode = curses.A_DIM
-        self.color = curses.COLOR_GRAY
+        self.a_mode = a_modes['dim']
 
 
 class Hallway(BaseTile):
 
+    __slots__ = ()
+
     def post_init(self):
-        pass
+        self.passable = True
+
+
+class TileState(object):
+
+    """ Sparse per-cell state for one map, only cells that have been
+    visited or hold items/entities get an entry.  Every change is
+    recorded in the dirty set so the renderer can redraw just those
+    cells """
+
+    def __init__(self, dirty=None):
+        self.visited = set()
+        self.items = SpatialIndex()
+        self.entities = SpatialIndex()
+        self.dirty = set() if dirty is None else dirty
+
+    def load_tables(self, items, entities):
+        # Replace the item and entity tables with {pos: [objects]} dicts
+        self.items = SpatialIndex.from_table(items)
+        self.entities = SpatialIndex.from_table(entities)
+        self.dirty.update(pos for pos, _ in self.items.items())
+        self.dirty.update(pos for pos, _ in self.entities.items())
+
+    def visit(self, pos):
+        if pos not in self.visited:
+            self.visited.add(pos)
+            self.dirty.add(pos)
+
+    def is_visited(self, pos):
+        return pos in self.visited
+
+    def items_at(self, pos):
+        return self.items.at(pos)
+
+    def entities_at(self, pos):
+        return self.entities.at(pos)
+
+    def add_item(self, pos, item):
+        self.items.add(item, pos)
+        self.dirty.add(pos)
+
+    def remove_item(self, pos, item):
+        self.items.remove(item, pos)
+        self.dirty.add(pos)
+
+    def add_entity(self, pos, entity):
+        self.entities.add(entity, pos)
+        self.dirty.add(pos)
+
+    def remove_entity(self, pos, entity):
+        self.entities.remove(entity, pos)
+        self.dirty.add(pos)
+
+    def move_entity(self, entity, pos):
+        self.dirty.add(self.entities.move(entity, pos))
+        self.dirty.add(pos)
+
+    def where(self, entity):
+        return self.entities.where(entity)
+
+    def has_player(self, pos):
+        return self.entities.has_player(pos)
+
+
+TILES = [Wall, Hallway]
+_tile_types = []
+
+
+def tile_types():
+    """ Shared tile instances indexed by tile id, id 0 is the empty tile """
+    if not _tile_types:
+        # Built on first use rather than at import so tiles may call
+        # curses.color_pair, which needs an initialized screen
+        _tile_types.append(None)
+        for cls in TILES:
+            _tile_types.append(cls(len(_tile_types)))
+    return _tile_types
+
+
+def get_tile(key):
+    """ Look up a shared tile type by id, class or class name """
+    if isinstance(key, int):
+        return tile_types()[key]
+    name = key if isinstance(key, str) else key.__name__
+    for tile in tile_types()[1:]:
+        if tile.__class__.__name__ == name:
+            return tile
+    raise KeyError(name)
 
 def tile_test(scr):
     # Prints the acs_chars list of characters and exits
+    import curses
     win = scr.subwin(0, 0)
     win.keypad(1)
 
@@ -68,59 +169,71 @@ def tile_test(scr):
     win.refresh()
     win.getch()
 
+# curses.A_<key> values (from game.screen), so tiles can be built
+# without importing curses
+a_modes = {
+    'normal': A_NORMAL,
+    'underline': A_UNDERLINE,
+    'dim': A_DIM,
+    'bold': A_BOLD
+    }
+
 col_pairs = {
-    'cyan': curses.color_pair(1),
-    'red': curses.color_pair(2),
-    'green': curses.color_pair(3),
-    'highlight': curses.color_pair(4),
-    'bold': curses.color_pair(5)
+    'cyan': 1,
+    'red': 2,
+    'green': 3,
+    'highlight': 4,
+    'bold': 5
     }
 
+# curses.ACS_<key> values: the VT100 line-drawing character with
+# A_ALTCHARSET set
 acs_chars = {
-    'bbss': ('ACS_BBSS', 4194411),
-    'block': ('ACS_BLOCK', 4194352),
-    'board': ('ACS_BOARD', 4194408),
-    'bsbs': ('ACS_BSBS', 4194417),
-    'bssb': ('ACS_BSSB', 4194412),
-    'bsss': ('ACS_BSSS', 4194423),
-    'btee': ('ACS_BTEE', 4194422),
-    'bullet': ('ACS_BULLET', 4194430),
-    'ckboard': ('ACS_CKBOARD', 4194401),
-    'darrow': ('ACS_DARROW', 4194350),
-    'degree': ('ACS_DEGREE', 4194406),
-    'diamond': ('ACS_DIAMOND', 4194400),
-    'gequal': ('ACS_GEQUAL', 4194426),
-    'hline': ('ACS_HLINE', 4194417),
-    'lantern': ('ACS_LANTERN', 4194409),
-    'larrow': ('ACS_LARROW', 4194348),
-    'lequal': ('ACS_LEQUAL', 4194425),
-    'llcorner': ('ACS_LLCORNER', 4194413),
-    'lrcorner': ('ACS_LRCORNER', 4194410),
-    'ltee': ('ACS_LTEE', 4194420),
-    'nequal': ('ACS_NEQUAL', 4194428),
-    'pi': ('ACS_PI', 4194427),
-    'plminus': ('ACS_PLMINUS', 4194407),
-    'plus': ('ACS_PLUS', 4194414),
-    'rarrow': ('ACS_RARROW', 4194347),
-    'rtee': ('ACS_RTEE', 4194421),
-    's1': ('ACS_S1', 4194415),
-    's3': ('ACS_S3', 4194416),
-    's7': ('ACS_S7', 4194418),
-    's9': ('ACS_S9', 4194419),
-    'sbbs': ('ACS_SBBS', 4194410),
-    'sbsb': ('ACS_SBSB', 4194424),
-    'sbss': ('ACS_SBSS', 4194421),
-    'ssbb': ('ACS_SSBB', 4194413),
-    'ssbs': ('ACS_SSBS', 4194422),
-    'sssb': ('ACS_SSSB', 4194420),
-    'ssss': ('ACS_SSSS', 4194414),
-    'sterling': ('ACS_STERLING', 4194429),
-    'ttee': ('ACS_TTEE', 4194423),
-    'uarrow': ('ACS_UARROW', 4194349),
-    'ulcorner': ('ACS_ULCORNER', 4194412),
-    'urcorner': ('ACS_URCORNER', 4194411),
-    'vline': ('ACS_VLINE', 4194424)
+    'bbss': ('ACS_BBSS', A_ALTCHARSET | ord('k')),
+    'block': ('ACS_BLOCK', A_ALTCHARSET | ord('0')),
+    'board': ('ACS_BOARD', A_ALTCHARSET | ord('h')),
+    'bsbs': ('ACS_BSBS', A_ALTCHARSET | ord('q')),
+    'bssb': ('ACS_BSSB', A_ALTCHARSET | ord('l')),
+    'bsss': ('ACS_BSSS', A_ALTCHARSET | ord('w')),
+    'btee': ('ACS_BTEE', A_ALTCHARSET | ord('v')),
+    'bullet': ('ACS_BULLET', A_ALTCHARSET | ord('~')),
+    'ckboard': ('ACS_CKBOARD', A_ALTCHARSET | ord('a')),
+    'darrow': ('ACS_DARROW', A_ALTCHARSET | ord('.')),
+    'degree': ('ACS_DEGREE', A_ALTCHARSET | ord('f')),
+    'diamond': ('ACS_DIAMOND', A_ALTCHARSET | ord('`')),
+    'gequal': ('ACS_GEQUAL', A_ALTCHARSET | ord('z')),
+    'hline': ('ACS_HLINE', A_ALTCHARSET | ord('q')),
+    'lantern': ('ACS_LANTERN', A_ALTCHARSET | ord('i')),
+    'larrow': ('ACS_LARROW', A_ALTCHARSET | ord(',')),
+    'lequal': ('ACS_LEQUAL', A_ALTCHARSET | ord('y')),
+    'llcorner': ('ACS_LLCORNER', A_ALTCHARSET | ord('m')),
+    'lrcorner': ('ACS_LRCORNER', A_ALTCHARSET | ord('j')),
+    'ltee': ('ACS_LTEE', A_ALTCHARSET | ord('t')),
+    'nequal': ('ACS_NEQUAL', A_ALTCHARSET | ord('|')),
+    'pi': ('ACS_PI', A_ALTCHARSET | ord('{')),
+    'plminus': ('ACS_PLMINUS', A_ALTCHARSET | ord('g')),
+    'plus': ('ACS_PLUS', A_ALTCHARSET | ord('n')),
+    'rarrow': ('ACS_RARROW', A_ALTCHARSET | ord('+')),
+    'rtee': ('ACS_RTEE', A_ALTCHARSET | ord('u')),
+    's1': ('ACS_S1', A_ALTCHARSET | ord('o')),
+    's3': ('ACS_S3', A_ALTCHARSET | ord('p')),
+    's7': ('ACS_S7', A_ALTCHARSET | ord('r')),
+    's9': ('ACS_S9', A_ALTCHARSET | ord('s')),
+    'sbbs': ('ACS_SBBS', A_ALTCHARSET | ord('j')),
+    'sbsb': ('ACS_SBSB', A_ALTCHARSET | ord('x')),
+    'sbss': ('ACS_SBSS', A_ALTCHARSET | ord('u')),
+    'ssbb': ('ACS_SSBB', A_ALTCHARSET | ord('m')),
+    'ssbs': ('ACS_SSBS', A_ALTCHARSET | ord('v')),
+    'sssb': ('ACS_SSSB', A_ALTCHARSET | ord('t')),
+    'ssss': ('ACS_SSSS', A_ALTCHARSET | ord('n')),
+    'sterling': ('ACS_STERLING', A_ALTCHARSET | ord('}')),
+    'ttee': ('ACS_TTEE', A_ALTCHARSET | ord('w')),
+    'uarrow': ('ACS_UARROW', A_ALTCHARSET | ord('-')),
+    'ulcorner': ('ACS_ULCORNER', A_ALTCHARSET | ord('l')),
+    'urcorner': ('ACS_URCORNER', A_ALTCHARSET | ord('k')),
+    'vline': ('ACS_VLINE', A_ALTCHARSET | ord('x'))
     }
 
 if __name__=='__main__':
+    import curses
     curses.wrapper(tile_test)
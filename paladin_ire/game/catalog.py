@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+# Entity catalog
+# Index of the entity templates Menu.save_entity writes to
+# ./entities, GameSession.populate spawns the monsters of every level
+# from them.  The index (name, class, level per file) is kept in
+# .catalog.json beside the templates and refreshed by file mtime, so
+# a start only parses files that changed.  Full records load lazily.
+# entity_record / entity_from_record convert between entities and the
+# template form, encode_object / decode_object use it for the entities
+# in saved levels
+
+import json
+import os
+
+from .classes import CLASSES
+from .core import BaseEntity, Entity
+from .player import Player
+
+INDEX_FILE = '.catalog.json'
+INDEX_VERSION = 1
+CLASS_NAMES = {cls.__name__: cls for cls in CLASSES}
+ENTITY_TYPES = {cls.__name__: cls for cls in (Entity, Player)}
+
+
+def entity_record(entity):
+    """ Template record of <entity>, as Menu.save_entity writes it """
+    player_class = entity.player_class
+    return {
+        'name': entity.name,
+        'class': None if player_class is None
+                 else player_class.__class__.__name__,
+        'attributes': {attr: getattr(entity, attr)
+                       for attr in entity.attributes[0]},
+        'resists': {res: getattr(entity, res) for res in entity.resists[0]},
+        'meta': {fl: getattr(entity, fl)
+                 for fl in ('level', 'spells', 'sneaks', 'damage')},
+        'status': {st: getattr(entity, st)
+                   for st in entity.status_effects[0]}
+    }
+
+
+def entity_from_record(record, entity_cls=Entity, store=None):
+    """ New entity built from a template record, a StoredEntity view
+    of a new row when <store> is given """
+    entity = entity_cls() if store is None else store.new()
+    entity.name = record['name']
+    entity.level = record['meta']['level']
+    if record['class'] in CLASS_NAMES:
+        entity.player_class = CLASS_NAMES[record['class']]()
+    stored = set(entity.attributes[0] + entity.resists[0] +
+                 entity.status_effects[0])
+    for group in 'attributes', 'resists', 'status':
+        for key, value in record.get(group, {}).items():
+            if key in stored:
+                setattr(entity, key, value)
+    entity.damage = record['meta'].get('damage', 0)
+    entity.complete_init()
+    return entity
+
+
+def encode_object(obj):
+    """ JSON form of a level item or entity.  Entities are written as
+    template records, JSON scalars as they are, anything else raises
+    TypeError so nothing is written """
+    if isinstance(obj, BaseEntity):
+        # Store rows are read back as plain entities
+        name = type(obj).__name__
+        return {'entity': name if name in ENTITY_TYPES else 'Entity',
+                'record': entity_record(obj)}
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    raise TypeError('{!r} cannot be saved in a level'.format(obj))
+
+
+def decode_object(value):
+    """ Inverse of encode_object """
+    if isinstance(value, dict) and 'entity' in value:
+        return entity_from_record(value['record'],
+                                  ENTITY_TYPES[value['entity']])
+    return value
+
+
+class EntityCatalog(object):
+
+    """ Templates by file name, searchable by name, class and level """
+
+    def __init__(self, path='./entities'):
+        self.path = path
+        self.entries = {}       # file name -> name, class, level, mtime, size
+        self._records = {}      # file name -> (mtime, full record)
+        self._by = {'name': {}, 'class': {}, 'level': {}}
+        self._load_index()
+        self.refresh()
+
+    def __len__(self):
+        return sum(1 for e in self.entries.values() if 'error' not in e)
+
+    def __contains__(self, fname):
+        return fname in self.entries and 'error' not in self.entries[fname]
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as inf:
+                index = json.load(inf)
+        except (OSError, ValueError):
+            return
+        if index.get('version') == INDEX_VERSION:
+            for fname, entry in index['entries'].items():
+                self._add(fname, entry)
+
+    def _save_index(self):
+        tmp = '{}.tmp'.format(self.index_path)
+        with open(tmp, 'w') as outf:
+            json.dump({'version': INDEX_VERSION, 'entries': self.entries},
+                      outf)
+        os.replace(tmp, self.index_path)
+
+    def _add(self, fname, entry):
+        self.entries[fname] = entry
+        if 'error' in entry:
+            return
+        for key in self._by:
+            self._by[key].setdefault(entry[key], set()).add(fname)
+
+    def _remove(self, fname):
+        entry = self.entries.pop(fname)
+        self._records.pop(fname, None)
+        if 'error' in entry:
+            return
+        for key in self._by:
+            names = self._by[key][entry[key]]
+            names.discard(fname)
+            if not names:
+                del self._by[key][entry[key]]
+
+    def _read(self, fname):
+        with open(os.path.join(self.path, fname)) as inf:
+            return json.load(inf)
+
+    def refresh(self):
+        """ Re-index files added, changed or removed since the last
+        refresh, returns the number of files that were (re)parsed """
+        try:
+            found = {e.name: e.stat() for e in os.scandir(self.path)
+                     if e.is_file() and not e.name.startswith('.')}
+        except FileNotFoundError:
+            found = {}
+
+        changed = 0
+        for fname in set(self.entries) - set(found):
+            self._remove(fname)
+            changed += 1
+        for fname, stat in found.items():
+            entry = self.entries.get(fname)
+            if entry is not None and entry['mtime'] == stat.st_mtime_ns \
+                    and entry['size'] == stat.st_size:
+                continue
+            if entry is not None:
+                self._remove(fname)
+            entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+            try:
+                record = self._read(fname)
+                entry['name'] = record['name']
+                entry['class'] = record['class']
+                entry['level'] = record['meta']['level']
+            except (OSError, ValueError, KeyError, TypeError):
+                # Not a template, remembered so it is not parsed again
+                # until it changes
+                entry['error'] = True
+            self._add(fname, entry)
+            changed += 1
+
+        if changed and os.path.isdir(self.path):
+            self._save_index()
+        return changed
+
+    def find(self, name=None, player_class=None, level=None):
+        """ File names of the templates matching every given key,
+        player_class is a class name """
+        keys = [('name', name), ('class', player_class), ('level', level)]
+        matches = None
+        for key, value in keys:
+            if value is None:
+                continue
+            found = self._by[key].get(value, set())
+            matches = set(found) if matches is None else matches & found
+        if matches is None:
+            matches = set(f for f in self.entries if f in self)
+        return sorted(matches)
+
+    def load(self, fname):
+        """ Full record of template <fname>, read on first use """
+        entry = self.entries[fname]
+        cached = self._records.get(fname)
+        if cached is None or cached[0] != entry['mtime']:
+            cached = entry['mtime'], self._read(fname)
+            self._records[fname] = cached
+        return cached[1]
+
+    def spawn(self, fname, entity_cls=Entity, store=None):
+        """ New entity built from template <fname> """
+        return entity_from_record(self.load(fname), entity_cls, store)
@@ -2,13 +2,12 @@
 # -*- coding: utf-8 -*-
 
 # Parent classes for most game objects
-# Curses menu and game window superclasses
+# No curses here, see windows.py for the menu and game window
+# superclasses
 
-import curses
-import random
-from curses import panel
-
-from scripts.world_generation import MapGenerator
+from .dice import stream as dice_stream
+from .stat_blocks import StatBlockGenerator
+from .stats import StatGraph
 
 NAME_LIST=['Flargin', 'Dingo', 'Mypaltr', 'Pallyride', 'Pallindrome', 'Jeff', 'Chaz',
            'Molly', 'Martin', 'Grena', 'Palson', 'Rempo', 'Trixy', 'Mouse', 'Pal']
@@ -22,10 +21,14 @@ class RandomRoll(object):
     ADV = 1
     CRIT = 2
 
-    def __init__(self,player,ubound,lbound=1):
+    def __init__(self,player,ubound,lbound=1,dice=None):
         self.player = player
         self.ub = ubound    # Random roll range upper-bound
         self.lb = lbound    # Random roll range lower-bound
+        # Stream to roll from, e.g. dice.stream('entity', n) for a
+        # per-entity stream
+        self.dice = dice if dice is not None else dice_stream('rolls')
+        self.min_val = self.max_val = None
 
     def _calc_adv(self, skill):
         # Calculates skill checks
@@ -36,30 +39,47 @@ class RandomRoll(object):
 
     @property
     def possibles(self):
-        return list(range(self.min_val, self.max_val))
+        return range(self.min_val, self.max_val)
 
     def calc_bound(self,bound,mult=1.):
         assert isinstance(mult, float)
         return int(bound * mult)
 
     def execute(self):
-        return random.choice(self.possibles)
+        return self.dice.randint(self.min_val, self.max_val)
 
     def attr_roll(self, attr):
         return self._calc_adv(attr)
 
-    def roll(self,check,init=False):
-        self.max_val = self.calc_bound(self.ub, max(2., self.attr_roll(check)))
+    def _bounds(self, check, init):
+        # Sets and returns the [min_val, max_val) range of a roll, the
+        # same as calc_bound/attr_roll with attr_limit looked up once
+        player = self.player
+        limit = player.attr_limit
+        adv = 2. if check is None else getattr(player, check) / limit + 1.
+        self.max_val = int(self.ub * max(2., adv))
         if not init:
-            self.min_val = self.calc_bound(self.lb, self.attr_roll('luck'))
+            self.min_val = int(self.lb * (player.luck / limit + 1.))
         else:
             self.min_val = 1
+        return self.min_val, self.max_val
+
+    def roll(self,check,init=False):
+        self._bounds(check, init)
         return self.execute()
 
+    def rolls(self, check, n, init=False):
+        """ n rolls of check as an array, for AI and simulations """
+        return self.dice.rolls(*self._bounds(check, init), n)
+
+    def skill_max_val(self):
+        # Highest value the last roll could have returned
+        return self.max_val - 1
+
     def resist_roll(self, resist):
         adv = self._calc_adv(resist)
-        max_val = self.skill_max_val()
         result = self.roll(resist)
+        max_val = self.skill_max_val()
         return abs((result/max_val) - adv)
 
     def atk_roll(self, goal):
@@ -74,13 +94,24 @@ class RandomRoll(object):
         elif result < goal:
             return self.DISADV
 
-class Entity(object):
+class BaseEntity(object):
 
-    """ General attributes/properties/methods for PC/NPC Entities """
+    """ General attributes/properties/methods for PC/NPC Entities.
+    Entity keeps the attributes, resists and status effects in its own
+    slots, entity_store.StoredEntity in a row of an EntityStore """
 
     attributes = ["health", "attack", "defense", "focus", "strength", "wisdom", "luck"], 1
     resists = ["fire", "frost", "death", "detection"], 0
     status_effects = ["blind", "paralyzed", "invincible", "fast"], 0
+    is_player = False
+
+    # The other values shown on screen are versioned (see _versioned),
+    # except hitpoints and magic: combat changes them in its inner
+    # loop, they stay plain
+    shown = ['name', 'max_hp', 'max_mp']
+    __slots__ = ('_stat_cache', '_enabled', '_level', '_player_class',
+                 'init_complete', 'damage', 'version', 'hitpoints',
+                 'magic') + tuple('_' + n for n in shown)
     player_stats = {
                     'hitpoints':(['health', 'health', 'defense'], False),
                     'magic':(['wisdom', 'wisdom', 'focus'], False),
@@ -98,6 +129,10 @@ class Entity(object):
                     'max_damage':(['strength', 'attack', 'luck'], True)
                    }
     core_stats = ['carry', 'hitpoints', 'magic', 'evade', 'max_damage']
+    stat_graph = StatGraph(player_stats)
+    stat_blocks = StatBlockGenerator(attributes[0])
+    char = 'e'      # map symbol
+    speed = 10      # energy per tick, see TurnScheduler
 
     attr_desc = {
                  'health':'Contributes to\nplayer hit points',
@@ -110,6 +145,9 @@ class Entity(object):
                 }
 
     def __init__(self):
+        self.version = 0            # bumped by every change, see _invalidate
+        self._stat_cache = None     # stat -> value, see get_stat
+        self._enabled = None        # cached _skills_enabled
         self.alive = True
         self._attr_init()
         self.level = 1
@@ -139,13 +177,6 @@ class Entity(object):
         elif cls.spell_book_enable:
             return True
 
-    def _attr_init(self):
-        attrs = self.attributes, self.resists, self.status_effects
-        for group in attrs:
-            items, default = group
-            for item in items:
-                setattr(self, item, default)
-
     def complete_init(self):
         # Magic and hitpoints need to persist and not
         # calculate during gameplay
@@ -155,6 +186,50 @@ class Entity(object):
         self.max_mp = self.magic
         self.init_complete = True
 
+    def roll_attributes(self, dice=None):
+        """ Roll starting attributes and class resists, the free points
+        above 5 go to the preferred class attributes """
+        dice = dice if dice is not None else dice_stream('stat_blocks')
+        block = self.stat_blocks.sample(1, self.player_class, self.level,
+                                        dice.rng)[0]
+        self._apply_stat_block(block)
+
+    def _apply_stat_block(self, block):
+        for name, value in zip(self.attributes[0], block.tolist()):
+            setattr(self, name, value)
+        self._apply_class_resists()
+
+    def _apply_class_resists(self):
+        cls = self.player_class
+        if cls is not None:
+            for resist in cls.resists:
+                setattr(self, resist, cls.resists[resist])
+
+    @classmethod
+    def spawn(cls, n, player_class=None, level=1, store=None, dice=None):
+        """ n ready to play entities sharing the PlayerClass instance
+        <player_class>, their stat blocks are rolled in one call.  With
+        an EntityStore they are StoredEntity views of new rows """
+        dice = dice if dice is not None else dice_stream('stat_blocks')
+        blocks = cls.stat_blocks.sample(n, player_class, level, dice.rng)
+        entities = []
+        for block in blocks:
+            entity = cls() if store is None else store.new()
+            entity.level = level
+            entity.player_class = player_class
+            if store is None:
+                entity._apply_stat_block(block)
+            entities.append(entity)
+        if store is not None:
+            # One write for the whole population, then the resists
+            rows = [entity._row for entity in entities]
+            store.blocks['attributes'][rows] = blocks
+            for entity in entities:
+                entity._apply_class_resists()
+        for entity in entities:
+            entity.complete_init()
+        return entities
+
     def heal(self, pts=0):
         if pts == 0:
             self.hitpoints = self.max_hp
@@ -162,25 +237,60 @@ class Entity(object):
             self.hitpoints = min( self.max_hp, self.hitpoints + pts )
 
     def get_stat(self, stat):
+        # Cached, entries are dropped by _invalidate when an input changes
+        if self._stat_cache is None:
+            self._stat_cache = {}
+        try:
+            return self._stat_cache[stat]
+        except KeyError:
+            pass
         if stat not in self._skills_enabled:
-            return 1
-
-        calc_stat, lvl_based = self.player_stats[stat]
-        stat_val = sum([getattr(self, s) for s in calc_stat])
-        if not lvl_based:
-            return int((stat_val / float(self.attr_limit))*10 + stat_val)
+            value = 1
         else:
-            return self.level + stat_val
+            value = self.stat_graph.compute(self, stat)
+        self._stat_cache[stat] = value
+        return value
+
+    def _invalidate(self, name):
+        # Forget the cached stats that depend on attribute/level/class
+        # <name>.  Every change passes here, so panels showing this
+        # entity only redraw when version moves on
+        self.version += 1
+        cache = self._stat_cache
+        if cache:
+            for stat in self.stat_graph.affected(name):
+                cache.pop(stat, None)
+
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, value):
+        self._level = value
+        self._invalidate('level')
+
+    @property
+    def player_class(self):
+        return self._player_class
+
+    @player_class.setter
+    def player_class(self, cls):
+        self._player_class = cls
+        self._enabled = None
+        self._invalidate('player_class')
 
     @property
     def _skills_enabled(self):
-        base = self.core_stats
-        if self.player_class is not None:
-            base.extend(self.player_class.class_skills)
-        for sk in ['sneaks', 'spells']:
-            if getattr(self, sk):
-                base.append(sk)
-        return base
+        if self._enabled is None:
+            base = list(self.core_stats)
+            if self.player_class is not None:
+                base.extend(self.player_class.class_skills)
+            for sk in ['sneaks', 'spells']:
+                if getattr(self, sk):
+                    base.append(sk)
+            self._enabled = frozenset(base)
+        return self._enabled
 
     @_skills_enabled.setter
     def _skills_enabled(self,skill=None):
@@ -210,15 +320,6 @@ class Entity(object):
         # Return the number of attribute points not assigned
         return self.attr_limit - self.attr_sum
 
-    def pre_turn(self):
-        """ Pre-Turn hook, status effects decremented """
-        effects, _ = self.status_effects
-        for eff in effects:
-            val = getattr(self, eff)
-            if val > 0:
-                val -= 1
-                setattr(self, eff, val)
-
     @property
     def alive(self):
         if self.hitpoints > 0: return True
@@ -240,301 +341,53 @@ class Entity(object):
         return self.magic / self.max_mp
 
 
-class GameWindow(object):
-    def __init__(self, stdscreen, app):
-        self.stdscreen = stdscreen
-        self.window = stdscreen.subwin(0, 0)
-        self.set_styles()
-        self.window.keypad(1)
-        self._panel_init()
-        self.maxy, self.maxx = self.window.getmaxyx()
-        self.app = app
-        self.dbg_msg_list = []
-        self.current_msg = ''
-        self.over = None
-        self.last_keystroke = None
-        self.start_pos = 0
-        self._init_windows()
-
-    def _panel_init(self):
-        self.panel = panel.new_panel(self.window)
-        self.panel.hide()
-        panel.update_panels()
-
-    def _init_windows(self):
-        self.char_win, self.char_panel = self.side_panel(6, 29,
-                                                         self.maxy - 8, 2)
-        self.moves_win, self.moves_panel = self.side_panel(6, 45,
-                                                           self.maxy - 8, 31)
-        self.tile_win, self.tile_panel = self.side_panel(10, 25,
-                                                         2, self.maxx - 27)
-
-    def _refresh_subwindows(self):
-        self.draw_charinfo()
-        self.draw_moves()
-        self.draw_tileinfo()
-
-    def _overlay_subwindows(self):
-        for win in self.char_win, self.moves_win, self.tile_win:
-            win.overlay(self.window)
-
-    def draw_tileinfo(self):
-        self.tile_win.box()
-
-    def draw_moves(self):
-
-        def draw_arrows():
-            self.moves_win.addstr(1, 2, 'Moves', curses.A_UNDERLINE)
-            for ch in upch, dnch, lch, rch:
-                self.moves_win.addch(*ch)
-
-        for i in range(1,5):
-            self.moves_win.move(i,2)
-            self.moves_win.clrtoeol()
-
-        default_mode = curses.A_DIM
-        upch = 2, 4, curses.ACS_UARROW, default_mode
-        dnch = 4, 4, curses.ACS_DARROW, default_mode
-        lch = 3, 3, curses.ACS_LARROW, default_mode
-        rch = 3, 5, curses.ACS_RARROW, default_mode
-        draw_arrows()
-
-        self.moves_win.box()
-
-    def draw_charinfo(self):
-        win = self.char_win
-
-        for i in range(1, 5):
-            win.move(i, 2)
-            win.clrtoeol()
-
-        # Display player name
-        win.addstr(1, 2, 'Player :  {:>15}'.format(self.app.player.name))
-
-        # Display player class
-        cls = self.app.player.player_class
-        cls_str = 'None' if cls is None else cls.__class__.__name__
-        win.addstr(2, 2, 'Class  :  {:>15}'.format(cls_str))
-
-        # Display health indicator
-        hp_str = '*' * int(((self.app.player.hp_percent * 100) + 9) // 10)
-        win.addstr(3, 2, 'HP     :  ({:>2}) {:->10}'.format(
-            self.app.player.hitpoints,
-            hp_str
-        ))
-
-        # Display magic indicator
-        mp_str = '*' * int(((self.app.player.mp_percent * 100) + 9) // 10)
-        win.addstr(4, 2, 'MP     :  ({:>2}) {:->10}'.format(
-            self.app.player.magic,
-            mp_str
-        ))
-
-        win.box()
+class Entity(BaseEntity):
 
-    def execute(self):
-        while True:
-            self._loop_begin()
-            self._overlay_subwindows()
-            self._refresh_subwindows()
-            if not self.main_loop():
-                break
-            self._loop_end()
-
-    def main_loop(self):
-        input('continue')
-        return False
+    """ Entity with its attributes, resists and status effects in its
+    own "_<name>" slots """
 
-    def msg_bar_prompt(self, prompt, default=None):
-        # displays the prompt in the message bar and
-        # awaits user input, 15 characters max. A
-        # default value should be specified and in
-        # the prompt via format spec
-        self.msg_bar(prompt.format(default))
-        msg_len = len(self.current_msg)
-        entry = self.capture(self.maxy - 2, msg_len + 1, 15)
-        if not entry:
-            entry = default
-        return entry
-
-    def display(self):
-        self._pre_loop()
-        self.execute()
-        self._post_loop()
-        return self.current_msg
-
-    def clear_win(self, win):
-        for j in range(win.getmaxyx()[0]):
-            self._pre_draw(j, 1)
-
-    def side_panel(self, h, l, y, x):
-        win = curses.newwin(h, l, y, x)
-        # win.erase()
-        win.box()
-        panel = curses.panel.new_panel(win)
-        return win, panel
-
-    def set_styles(self):
-        self.info_msg = curses.color_pair(1)
-        self.err_msg = curses.color_pair(2)
-        self.hlt_msg = curses.color_pair(3)
-        self.margin = 3
-
-    def menu_bar(self, val_list=('S: Save', 'Q: Quit')):
-        if val_list:
-            menu = ' | '.join(val_list)
-            self._pre_draw(1, 2)
-            self.window.addstr(1, 2, menu, curses.color_pair(3))
-
-    def msg_bar(self, msg=None):
-        if msg is not None: self.current_msg = msg
-        if self.current_msg is None: self.current_msg = ''
-        yval, xval = self.window.getmaxyx()
-        col = self.hlt_msg
-        self.window.addstr(
-            yval - 2,
-            2,
-            self.current_msg.ljust(xval - 2),
-            col
-        )
-
-    def _loop_begin(self):
-        self.window.noutrefresh()
-        self.window.box()
-        curses.doupdate()
-
-    def _loop_end(self):
-        # Draw debug info, the top menu  bar, and the bottom msg bar
-        # at the end of each main_loop iteration
-        self.debug_info()
-        self.menu_bar()
-        self.msg_bar()
-
-    def _pre_draw(self, yv, xv):
-        win = self.window
-        win.move(yv, xv)
-        win.clrtoeol()
-        win.noutrefresh()
-
-    def capture(self, y, x, length):
-        # Capture user input for <length> chars at (y,x)
-        curses.echo()
-        self.window.move(y, x)
-        val = self.window.getstr(y, x, length)
-        curses.noecho()
-        self.window.move(0, 0)
-        return val.decode(encoding='utf-8')
-
-    def debug_info(self):
-
-        if self.app.args.debug or self.app.args.verbose:
-            yval, xval = curses.getsyx()
-            y = self.maxy - 6
-            x = self.maxx - 17
-
-            col = self.info_msg
-            self.msg_list = [
-                'pos:{}'.format(self.position),
-                'over:{}'.format(self.over),
-                'maxy:{}'.format(self.maxy),
-                'maxx:{}'.format(self.maxx),
-                'cursor:{},{}'.format(yval, xval),
-                'key:{}'.format(self.last_keystroke)
-            ]
-
-            for i, val in enumerate(self.msg_list):
-                self._pre_draw(y - i, x)
-                self.window.addstr(y - i, x, val, col)
-
-    def _parse_keystroke(self, key):
-        if key in [curses.KEY_ENTER, ord('\n')]:
-            return 'enter'
-        elif key in [curses.KEY_BACKSPACE, ord('\b'), 127]:
-            return 'backspace'
-        elif key in [curses.KEY_UP, 65]:
-            return 'up'
-        elif key in [curses.KEY_DOWN, 66]:
-            return 'down'
-        elif key in [curses.KEY_LEFT, 68]:
-            return 'left'
-        elif key in [curses.KEY_RIGHT, 67]:
-            return 'right'
-        elif key in [' ', ord(' ')]:
-            return 'space'
-        elif key in [113, ord('q'), 81, ord('Q')]:
-            return 'q'
-        else:
-            return r'{}'.format(key)
-
-
-class MapWindow(GameWindow):
-    def __init__(self, stdscreen, app):
-        super().__init__(stdscreen, app)
-        bounds = self.map_win_bounds()
-        self.map_gen = MapGenerator(bounds[0] - 1, bounds[2] - 1)
-        self.map_win, self.map_panel = self.side_panel(*bounds)
-        self.current_level = self.map_gen.add_map()
-        self.position = 0
-
-    def map_win_bounds(self):
-        self.maxy, self.maxx = self.window.getmaxyx()
-        map_minx = 1
-        map_maxx = 75
-        map_miny = 1
-        map_maxy = self.maxy - 8
-        return map_maxy - map_miny, map_maxx - map_minx, 2, 2
-
-    def draw_map(self):
-
-        def _clear():
-            wy, wx = self.map_win.getmaxyx()
-            for i in range(1, wy):
-                self.map_win.move(i, 1)
-                self.map_win.clrtoeol()
-
-        _clear()
-        self.map_win.box()
-        for y in range(1, self.map_gen.bounds[0]):
-            for x in range(1, self.map_gen.bounds[1]):
-                tile = self.current_level.grid[y, x]
-                if not tile:
-                    msg = ' '
-                    mode = curses.A_NORMAL
-                else:
-                    msg = tile.char
-                    mode = tile.mode
-                self.map_win.addch(y, x, msg, mode)
-
-    def main_loop(self):
-        self.menu_bar(val_list=['Q: Main Menu'])
-        self.draw_map()
-        self._refresh_subwindows()
-        self.msg_bar('Choose an action')
-        return self.process_selection(self.map_win.getch())
-
-    def process_selection(self, key):
-        self.last_keystroke = self._parse_keystroke(key)
-        if self.last_keystroke in ['enter']:
-            # Open doors and other actions
-            return True
-        elif self.last_keystroke in ['esc', 'q']:
-            # Exit to the menu
-            return False
-        elif self.last_keystroke in ['up', 'down', 'left', 'right']:
-            # Move the player
-            return True
-        elif self.last_keystroke in ['space']:
-            # Space to be used for picking up items
-            return True
+    __slots__ = tuple('_' + n for n in BaseEntity.attributes[0] +
+                      BaseEntity.resists[0] + BaseEntity.status_effects[0])
+
+    def _attr_init(self):
+        self._stat_cache = None
+        self.version += 1
+        for slot, default in self._defaults:
+            slot.__set__(self, default)
+
+    def pre_turn(self):
+        """ Pre-Turn hook, status effects decremented """
+        effects, _ = self.status_effects
+        for eff in effects:
+            val = getattr(self, eff)
+            if val > 0:
+                val -= 1
+                setattr(self, eff, val)
+
+
+def _slot(name, slot):
+    # Entity attribute kept in its "_<name>" slot
+    def fset(self, value):
+        slot.__set__(self, value)
+        self._invalidate(name)
+
+    return property(slot.__get__, fset)
 
-        self.draw_charinfo()
-        return True
 
-    def draw_entities(self):
-        pass
+def _versioned(slot):
+    # Plain value kept in its "_<name>" slot, setting it bumps version
+    def fset(self, value):
+        slot.__set__(self, value)
+        self.version += 1
 
-    def _pre_loop(self):
-        pass
+    return property(slot.__get__, fset)
 
-    def _post_loop(self):
-        pass
\ No newline at end of file
+Entity._defaults = []
+for _names, _default in Entity.attributes, Entity.resists, \
+        Entity.status_effects:
+    for _name in _names:
+        _slot_descr = Entity.__dict__['_' + _name]
+        setattr(Entity, _name, _slot(_name, _slot_descr))
+        Entity._defaults.append((_slot_descr, _default))
+for _name in BaseEntity.shown:
+    setattr(BaseEntity, _name, _versioned(BaseEntity.__dict__['_' + _name]))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Dice
+# Seeded random streams for every roll in the game.  Entities and
+# subsystems each draw from their own named stream, so what one of
+# them rolls never shifts another's results, and reseeding the root
+# makes a whole game repeatable
+
+import zlib
+
+import numpy as np
+
+
+def _key(part):
+    # Stream keys may be names or numbers, names are hashed stably
+    # (hash() of a str changes between runs)
+    if isinstance(part, str):
+        return zlib.crc32(part.encode('utf-8'))
+    return int(part)
+
+
+class Dice(object):
+
+    """ One seeded stream.  Single rolls come from a small buffer of
+    uniform floats, filled on the first roll, batches straight from
+    the generator as arrays """
+
+    BUFFER = 64
+
+    def __init__(self, seed=None):
+        # A missing seed is drawn once here so child streams stay
+        # reproducible from self.seed
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.rng = np.random.default_rng(self.seed)
+        self._buffer = []
+        self._streams = {}      # named streams, see stream
+
+    def stream(self, *key):
+        """ Child stream for key, e.g. stream('combat') or
+        stream('entity', 12).  A stream for a single name is kept, every
+        stream('combat') carries on with the same rolls.  Longer keys
+        name per-entity streams, which are not kept: each call starts
+        the stream over, its owner holds on to the one it was given """
+        key = tuple(_key(part) for part in key)
+        dice = self._streams.get(key)
+        if dice is None:
+            seed = list(self.seed) if isinstance(self.seed, list) \
+                   else [self.seed]
+            dice = Dice(seed + list(key))
+            if len(key) == 1:
+                self._streams[key] = dice
+        return dice
+
+    def random(self):
+        try:
+            return self._buffer.pop()
+        except IndexError:
+            # Reversed so pop() hands them out in the generator's order,
+            # the rolls do not depend on BUFFER
+            self._buffer = self.rng.random(self.BUFFER)[::-1].tolist()
+            return self._buffer.pop()
+
+    def randint(self, low, high):
+        """ Uniform integer in [low, high) """
+        if high <= low:
+            raise ValueError('Empty roll range [{}, {})'.format(low, high))
+        return low + int(self.random() * (high - low))
+
+    def choice(self, seq):
+        return seq[self.randint(0, len(seq))]
+
+    def rolls(self, low, high, n):
+        """ n uniform integers in [low, high) as an int64 array, low and
+        high may be arrays of n bounds """
+        return self.rng.integers(low, high, n)
+
+
+_root = Dice()
+
+
+def seed(value=None):
+    """ Reseed the root stream, streams taken before this keep their
+    old seed """
+    global _root
+    _root = Dice(value)
+
+
+def stream(*key):
+    """ Named child of the root stream, see Dice.stream """
+    return _root.stream(*key)
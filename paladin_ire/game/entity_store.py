@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# Entity store
+# Optional struct-of-arrays storage for entity attributes, resists
+# and status effects, so per-turn passes run once over every entity.
+# StoredEntity is the entity class for a row: it holds the row and
+# the values every entity has (stat cache, hitpoints...) but none of
+# the columns.  TurnScheduler.every_round runs the store's status
+# countdown once per round instead of once per entity
+
+import numpy as np
+
+from .core import BaseEntity, Entity
+
+GROUPS = ('attributes', 'resists', 'status_effects')
+
+
+class EntityStore(object):
+
+    """ One row per entity, one column per attribute/resist/effect.
+    Each group is a 2D block and its columns are views into it, so a
+    whole group can be updated in a single array operation """
+
+    def __init__(self, entity_cls=Entity, capacity=64):
+        self.groups = {g: getattr(entity_cls, g) for g in GROUPS}
+        self.size = 0           # rows handed out so far
+        self.free = []          # released rows, reused first
+        self.entities = []      # row -> entity
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = getattr(self, 'blocks', None)
+        self.entities.extend([None] * (capacity - len(self.entities)))
+        self.capacity = capacity
+        self.blocks = {}
+        self.columns = {}
+        for group, (names, default) in self.groups.items():
+            block = np.full((capacity, len(names)), default, dtype=np.int32)
+            if old is not None:
+                block[:self.size] = old[group][:self.size]
+            self.blocks[group] = block
+            for i, name in enumerate(names):
+                self.columns[name] = block[:, i]
+
+    def add(self, entity):
+        # Returns the row assigned to entity
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self._allocate(self.capacity * 2)
+            row = self.size
+            self.size += 1
+        self.entities[row] = entity
+        self.reset(row)
+        return row
+
+    def release(self, row):
+        self.entities[row] = None
+        self.reset(row)
+        self.free.append(row)
+
+    def reset(self, row):
+        for group, (_, default) in self.groups.items():
+            self.blocks[group][row] = default
+
+    def new(self):
+        """ StoredEntity on a new row """
+        return StoredEntity(self)
+
+    def get(self, row, name):
+        return self.columns[name].item(row)
+
+    def set(self, row, name, value):
+        self.columns[name][row] = value
+
+    def pre_turn(self, turns=1, rows=None):
+        """ Status effect countdown of <turns> turns for every row (or
+        just <rows>), what each entity's pre_turn does for itself.
+        Entities whose effects changed have their version bumped """
+        block = self.blocks['status_effects']
+        if rows is None:
+            rows = slice(0, self.size)
+        part = block[rows]
+        changed = np.flatnonzero(part.any(axis=1))
+        if not len(changed):
+            return
+        block[rows] = part - np.minimum(part, turns)
+        rows = np.arange(self.size)[rows] if isinstance(rows, slice) \
+            else np.asarray(rows)
+        for row in rows[changed].tolist():
+            entity = self.entities[row]
+            if entity is not None:
+                entity.version += 1
+
+
+class StoredEntity(BaseEntity):
+
+    """ Entity whose attributes, resists and status effects are a row
+    of <store>.  Status effects count down in EntityStore.pre_turn,
+    run for all rows at once (see TurnScheduler.every_round), so they
+    last a number of rounds rather than of the entity's own turns.
+    The same at base speed, a fast entity gets two turns a round """
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store):
+        self._store = store
+        self._row = store.add(self)
+        super(StoredEntity, self).__init__()
+
+    def _attr_init(self):
+        self._stat_cache = None
+        self.version += 1
+        self._store.reset(self._row)
+
+    def pre_turn(self):
+        # The store's batched pass counts the status effects down
+        pass
+
+
+def _column(name):
+    # StoredEntity attribute read from and written to its row
+    def fget(self):
+        return self._store.columns[name].item(self._row)
+
+    def fset(self, value):
+        self._store.columns[name][self._row] = value
+        self._invalidate(name)
+
+    return property(fget, fset)
+
+for _names, _ in (BaseEntity.attributes, BaseEntity.resists,
+                  BaseEntity.status_effects):
+    for _name in _names:
+        setattr(StoredEntity, _name, _column(_name))
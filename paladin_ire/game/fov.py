@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+# Field of view
+# Recursive shadowcasting over a precomputed opacity bitmap,
+# results are cached per (position, radius)
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Octant transforms (xx, xy, yx, yy)
+OCTANTS = [
+    (1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+    (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)
+]
+
+
+class Visibility(object):
+
+    """ Cells visible from one position, as a bitmask over the square
+    window of the map the radius can reach """
+
+    __slots__ = ('top', 'left', 'mask')
+
+    def __init__(self, top, left, mask):
+        self.top = top
+        self.left = left
+        self.mask = mask
+
+    def __contains__(self, pos):
+        y, x = pos[0] - self.top, pos[1] - self.left
+        h, w = self.mask.shape
+        return 0 <= y < h and 0 <= x < w and bool(self.mask[y, x])
+
+    def window(self):
+        # Slice of the full map covered by the mask
+        h, w = self.mask.shape
+        return (slice(self.top, self.top + h),
+                slice(self.left, self.left + w))
+
+    def cells(self):
+        ys, xs = np.nonzero(self.mask)
+        return set(zip((ys + self.top).tolist(), (xs + self.left).tolist()))
+
+
+class FieldOfView(object):
+
+    """ Cached, incrementally updated field of view for one Map.
+    visible is the last Visibility computed by update(), visited is a
+    bitmask the size of the map """
+
+    def __init__(self, level, cache_size=256):
+        self.level = level
+        # Empty cells are open space.  Chunked levels are read a chunk
+        # at a time as the view reaches it, so the rest of the level
+        # is never generated
+        self.chunk_size = getattr(level.grid, 'chunk_size', None)
+        self._read = set()      # chunks already in self.opaque
+        if self.chunk_size is None:
+            self.opaque = level.tile_mask('opaque', False)
+        else:
+            self.opaque = np.zeros(level.bounds, dtype=bool)
+        self.visited = np.zeros(self.opaque.shape, dtype=bool)
+        for pos in level.state.visited:
+            self.visited[pos] = True
+        self.visible = None
+        self.cache_size = cache_size
+        self._cache = OrderedDict()     # (pos, radius) -> Visibility
+
+    def refresh_cell(self, pos):
+        """ Re-read one cell's tile (a door or wall changed) and drop only
+        the cached results that cell could affect """
+        tile = self.level.grid[pos]
+        opaque = bool(tile) and tile.opaque
+        if opaque == self.opaque[pos]:
+            return
+        self.opaque[pos] = opaque
+        y, x = pos
+        for key in [k for k in self._cache
+                    if max(abs(k[0][0] - y), abs(k[0][1] - x)) <= k[1]]:
+            del self._cache[key]
+
+    def _read_window(self, top, bottom, left, right):
+        # Fill in the opacity of the chunks under the window
+        size = self.chunk_size
+        for cy in range(top // size, (bottom - 1) // size + 1):
+            for cx in range(left // size, (right - 1) // size + 1):
+                if (cy, cx) in self._read:
+                    continue
+                self._read.add((cy, cx))
+                window = (slice(cy * size, (cy + 1) * size),
+                          slice(cx * size, (cx + 1) * size))
+                self.level.tile_mask('opaque', False, window, self.opaque)
+
+    def compute(self, pos, radius):
+        key = pos, radius
+        try:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        except KeyError:
+            pass
+        retval = self._cast(pos, radius)
+        self._cache[key] = retval
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return retval
+
+    def update(self, pos, radius):
+        """ Compute the view from pos, mark newly seen cells visited and
+        return the cells whose visibility changed """
+        old = self.visible
+        self.visible = self.compute(pos, radius)
+        window = self.visible.window()
+        seen = self.visible.mask & ~self.visited[window]
+        if seen.any():
+            self.visited[window] |= seen
+            ys, xs = np.nonzero(seen)
+            for y, x in zip(ys.tolist(), xs.tolist()):
+                self.level.state.visit((y + self.visible.top,
+                                        x + self.visible.left))
+        if old is None:
+            return self.visible.cells()
+        return old.cells() ^ self.visible.cells()
+
+    def is_visible(self, pos):
+        return self.visible is not None and pos in self.visible
+
+    def is_visited(self, pos):
+        return bool(self.visited[pos])
+
+    def _cast(self, pos, radius):
+        cy, cx = pos
+        height, width = self.opaque.shape
+        top, left = max(0, cy - radius), max(0, cx - radius)
+        bottom = min(height, cy + radius + 1)
+        right = min(width, cx + radius + 1)
+        if self.chunk_size is not None:
+            self._read_window(top, bottom, left, right)
+        # Work on plain lists, per-cell numpy indexing is much slower
+        opaque = self.opaque[top:bottom, left:right].tolist()
+        lit = [[False] * (right - left) for _ in range(bottom - top)]
+        lit[cy - top][cx - left] = True
+        oy, ox = cy - top, cx - left
+        for octant in OCTANTS:
+            self._cast_light(opaque, lit, oy, ox, 1, 1.0, 0.0, radius,
+                             octant)
+        return Visibility(top, left, np.array(lit, dtype=bool))
+
+    def _cast_light(self, opaque, lit, cy, cx, row, start, end, radius,
+                    octant):
+        if start < end:
+            return
+        xx, xy, yx, yy = octant
+        h, w = len(opaque), len(opaque[0])
+        radius_sq = radius * radius
+        new_start = start
+        for j in range(row, radius + 1):
+            dx, dy = -j - 1, -j
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                x = cx + dx * xx + dy * xy
+                y = cy + dx * yx + dy * yy
+                l_slope = (dx - .5) / (dy + .5)
+                r_slope = (dx + .5) / (dy - .5)
+                if start < r_slope:
+                    continue
+                elif end > l_slope:
+                    break
+                inside = 0 <= y < h and 0 <= x < w
+                if inside and dx * dx + dy * dy <= radius_sq:
+                    lit[y][x] = True
+                # Cells outside the map block sight
+                wall = not inside or opaque[y][x]
+                if blocked:
+                    if wall:
+                        new_start = r_slope
+                        continue
+                    blocked = False
+                    start = new_start
+                elif wall and j < radius:
+                    blocked = True
+                    self._cast_light(opaque, lit, cy, cx, j + 1, start,
+                                     l_slope, radius, octant)
+                    new_start = r_slope
+            if blocked:
+                break
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# Key map
+# Key codes to the action names the windows dispatch on.  KEYMAP is
+# shared, a window copies it and may rebind keys (GameWindow.bind).
+# InputQueue reads every key waiting at once, so a held key is
+# handled in the frame it arrives instead of one frame per repeat.
+# Keys put back with Screen.ungetch are read first
+
+from .screen import KEY_BACKSPACE, KEY_DOWN, KEY_ENTER, KEY_LEFT, \
+    KEY_RIGHT, KEY_UP
+
+KEYMAP = {
+    KEY_ENTER: 'enter', ord('\n'): 'enter',
+    KEY_BACKSPACE: 'backspace', ord('\b'): 'backspace', 127: 'backspace',
+    KEY_UP: 'up', KEY_DOWN: 'down', KEY_LEFT: 'left', KEY_RIGHT: 'right',
+    # Last byte of an arrow key sequence curses did not decode
+    ord('A'): 'up', ord('B'): 'down', ord('C'): 'right', ord('D'): 'left',
+    ord(' '): 'space',
+    ord('q'): 'q', ord('Q'): 'q',
+    ord('n'): 'name', ord('N'): 'name',
+    ord('s'): 'save', ord('S'): 'save',
+    ord('y'): 'yes', ord('Y'): 'yes',
+}
+
+
+def action(keymap, key):
+    """ Action bound to <key>, unbound keys are their own code as a
+    string """
+    return keymap.get(key, str(key))
+
+
+class InputQueue(object):
+
+    """ Keys from <screen>, a batch per frame.  The game loop waits for
+    input to arrive, drain() never blocks """
+
+    def __init__(self, screen):
+        self.screen = screen
+
+    def drain(self):
+        """ Every key waiting now, an empty list when there is none """
+        keys = []
+        self.screen.timeout(0)
+        try:
+            key = self.screen.getch()
+            while key != -1:
+                keys.append(key)
+                key = self.screen.getch()
+        finally:
+            self.screen.timeout(-1)
+        return keys
+
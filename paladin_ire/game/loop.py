@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# Game loop
+# One asyncio event loop per screen runs the windows.  The active
+# window awaits keys() instead of blocking in getch, so timers and
+# background tasks run between keystrokes.  Input is watched with
+# add_reader on the backend's file descriptor.  Background work awaits
+# cooperate() between slices, which holds it back while keys wait to be
+# handled: a key is drawn after the slice running when it arrived, so
+# slices shorter than a frame keep input under a frame behind
+
+import asyncio
+import select
+import time
+import weakref
+
+from .keymap import InputQueue
+
+_loops = weakref.WeakKeyDictionary()
+
+
+def loop_for(screen):
+    """ The GameLoop shared by every window on <screen> """
+    try:
+        return _loops[screen]
+    except KeyError:
+        loop = _loops[screen] = GameLoop(screen)
+        return loop
+
+
+class GameLoop(object):
+
+    """ Input, timers and background tasks for the windows on <screen>.
+    Timers and tasks may only be added while the loop runs """
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.input = InputQueue(screen)
+        self.loop = None
+        self._wake = None
+        self._idle = None
+        self._redraw = False
+        self._tasks = set()
+
+    def run(self, coro):
+        """ Run <coro> (the outermost window's run()) to the end, then
+        cancel the background tasks """
+        # A new loop per run, as asyncio.run (Python 3.7) does
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._main(coro))
+        finally:
+            loop.close()
+
+    async def _main(self, coro):
+        self.loop = asyncio.get_event_loop()
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        fd = self.screen.fileno()
+        if fd is not None:
+            self.loop.add_reader(fd, self._wake.set)
+        try:
+            return await coro
+        finally:
+            if fd is not None:
+                self.loop.remove_reader(fd)
+            tasks = list(self._tasks)
+            for task in tasks:
+                task.cancel()
+            # Let them finish cancelling before the loop closes
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.loop = self._wake = self._idle = None
+
+    async def keys(self, next_frame=0.):
+        """ Keys that arrived since the last call, waiting until there
+        is at least one or a frame was requested.  A requested frame
+        is not returned before <next_frame> (a time.perf_counter
+        value), keys are returned at once """
+        polled = self.screen.fileno() is None
+        while True:
+            self._wake.clear()
+            keys = self.input.drain()
+            if keys:
+                return keys
+            if self._redraw:
+                wait = next_frame - time.perf_counter()
+                if wait <= 0:
+                    self._redraw = False
+                    return keys
+            elif not polled:
+                wait = None
+            else:
+                # Without a descriptor the backend already holds all of
+                # its input (NullBackend): a blocking read gives the next
+                # key, or raises EOFError once they are used up
+                key = self.screen.getch()
+                if key != -1:
+                    return [key]
+                wait = 1. / 30
+            # Nothing to handle, background work may run
+            self._idle.set()
+            try:
+                await asyncio.wait_for(self._wake.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _input_waiting(self):
+        if self.screen.pushback:
+            return True
+        fd = self.screen.fileno()
+        if fd is None:
+            return False
+        ready, _, _ = select.select([fd], [], [], 0)
+        return bool(ready)
+
+    async def cooperate(self):
+        """ Await between slices of background work instead of
+        asyncio.sleep(0): when keys are waiting it returns only after
+        the window handled them and drew the frame """
+        await asyncio.sleep(0)
+        if self._input_waiting():
+            self._idle.clear()
+            await self._idle.wait()
+
+    def request_frame(self):
+        """ Draw a frame soon, after state changed outside of input """
+        self._redraw = True
+        if self._wake is not None:
+            self._wake.set()
+
+    def frame_drawn(self):
+        """ Called by the window after every frame: a frame drawn for
+        keys also shows what was requested, so no second one follows """
+        self._redraw = False
+
+    def _call(self, callback, args):
+        callback(*args)
+        self.request_frame()
+
+    def call_later(self, delay, callback, *args):
+        """ callback(*args) in <delay> seconds, then a frame.  Returns
+        an asyncio.TimerHandle """
+        return self.loop.call_later(delay, self._call, callback, args)
+
+    def every(self, interval, callback, *args):
+        """ callback(*args) every <interval> seconds, each followed by a
+        frame, until the returned task is cancelled """
+        async def _repeat():
+            while True:
+                await asyncio.sleep(interval)
+                self._call(callback, args)
+        return self.spawn(_repeat())
+
+    def spawn(self, coro):
+        """ Background task, cancelled when the loop ends.  Input waits
+        for its next await, long work should await cooperate() often """
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def in_thread(self, func, *args):
+        """ func(*args) in a worker thread, for work that cannot yield """
+        return await self.loop.run_in_executor(None, func, *args)
@@ -1,15 +1,16 @@
 #!/usr/bin/env python3.6
 #-*- coding: utf-8 -*-
 
-import curses
+import inspect
 import json
 import random
-from curses import panel
 
 from .classes import CLASSES
-from .core import NAME_LIST, GameWindow
-from .core import RandomRoll
+from .core import NAME_LIST
+from .screen import A_BOLD, A_DIM, A_NORMAL, A_REVERSE, color_pair
+from .windows import GameWindow
 from .attributes import ATTRIBUTE_DESCRIPTIONS
+from .catalog import entity_record
 
 
 class Menu(GameWindow):
@@ -17,6 +18,15 @@ class Menu(GameWindow):
         super().__init__(stdscreen, app)
         self.first_pass = True
         self.show_stats = False
+        # Action -> handler for the keys every menu shares, a handler
+        # returning False closes the menu
+        self.handlers = {
+            'up': lambda: self.navigate(-1),
+            'down': lambda: self.navigate(1),
+            'name': self.choose_name,
+            'save': self.save_selected,
+            'q': self.quit,
+        }
 
     def navigate(self, n):
         self.position += n
@@ -28,42 +38,54 @@ class Menu(GameWindow):
     def refresh_attributes(self):
         pass
 
+    def _panels(self):
+        panels = super()._panels()
+        panels.insert(1, ('items', self._items_state, self.print_item_list))
+        return panels
+
+    def _items_state(self):
+        # Everything print_item_list reads
+        player = self.app.player
+        return (self.position, player.player_class is None, player.free_attr,
+                [getattr(item, 'label', item) for item in self.items])
+
     def menu_bar(self, val_list=('S: Save', 'Q: Quit', 'N: Name Player')):
         # Overriding this to extend the default menu options in the game menu
         if val_list:
             menu = ' | '.join(val_list)
             self._pre_draw(1, 2)
-            self.window.addstr(1, 2, menu, curses.color_pair(3))
+            self.window.addstr(1, 2, menu, color_pair(3))
 
-    def _default_selections(self, key):
-        if key == curses.KEY_UP:
-            self.navigate(-1)
-
-        elif key == curses.KEY_DOWN:
-            self.navigate(1)
-
-        elif key in [ord('N'), ord('n')]:
-            entry = self.msg_bar_prompt('Choose a name (Blank={}, 15 chars): ',
-                                        self.get_random_name)
-            self.app.player.name = entry
-            self.msg_bar('Name selected: {}'.format(entry))
-            self.draw_charinfo()
-
-        elif key in [ord('S'), ord('s')]:
-            if not self.app.player.init_complete:
-                self.current_msg = 'You must select Attributes before saving!'
-            else:
-                self.save_entity()
+    async def _default_selections(self, key):
+        handler = self.handlers.get(self._parse_keystroke(key))
+        if handler is None:
+            return True
+        result = handler()
+        if inspect.isawaitable(result):
+            # Prompts read their keys through the game loop
+            result = await result
+        return result is not False
+
+    async def choose_name(self):
+        entry = await self.msg_bar_prompt(
+            'Choose a name (Blank={}, 15 chars): ', self.get_random_name)
+        self.app.player.name = entry
+        self.msg_bar('Name selected: {}'.format(entry))
+
+    async def save_selected(self):
+        if not self.app.player.init_complete:
+            self.current_msg = 'You must select Attributes before saving!'
+        else:
+            await self.save_entity()
 
-        elif key in [ord('Q'), ord('q')]:
-            self.over = None
-            return False
-        return True
+    def quit(self):
+        self.over = None
+        return False
 
     def draw_sidewin(self, title, msg):
         self.clear_win(self.side_win)
         self.side_win.addstr(2, self.margin + 1, title,
-                             curses.A_BOLD | curses.color_pair(3)
+                             A_BOLD | color_pair(3)
                              )
         i = self.margin + 1
         for line in msg.split('\n'):
@@ -74,13 +96,17 @@ class Menu(GameWindow):
     def get_random_name(self):
         return random.choice(NAME_LIST)
 
-    def save_entity(self):
-        entry = self.msg_bar_prompt('Input a file name (Blank={}, 15 chars): ',
-                                    self.getfilename)
+    @property
+    def getfilename(self):
+        return random.choice(NAME_LIST)
+
+    async def save_entity(self):
+        entry = await self.msg_bar_prompt(
+            'Input a file name (Blank={}, 15 chars): ', self.getfilename)
         fname = './entities/{}'.format(entry)
         self.msg_bar('Save entity "{}"? (Y/n): '.format(fname))
-        key = self.window.getch()
-        if key in [ord('Y'), ord('y')]:
+        key = await self.read_key()
+        if self._parse_keystroke(key) == 'yes':
             self.app.player.name = entry
             attrs = self.app.player.attributes[0]
             with open(fname, 'w+') as outf:
@@ -90,25 +116,13 @@ class Menu(GameWindow):
                 )
             self.msg_bar('{} saved!'.format(fname))
             self.refresh_attributes()
-            self.draw_charinfo()
             return False
         else:
             self.msg_bar('Entity save aborted!')
             return True
 
     def package_entity(self):
-        return {
-            'name': self.app.player.name,
-            'class': self.app.player.player_class.__class__.__name__,
-            'attributes': {attr: getattr(self.app.player, attr)
-                           for attr in self.app.player.attributes[0]},
-            'resists': {res: getattr(self.app.player, res)
-                        for res in self.app.player.resists[0]},
-            'meta': {fl: getattr(self.app.player, fl)
-                     for fl in ('level', 'spells', 'sneaks', 'damage')},
-            'status': {st: getattr(self.app.player, st)
-                       for st in self.app.player.status_effects[0]}
-        }
+        return entity_record(self.app.player)
 
     def post_init(self, items):
         self.items = items
@@ -117,43 +131,36 @@ class Menu(GameWindow):
 
     def _pre_loop(self):
         self.maxy, self.maxx = self.window.getmaxyx()
-        self.panel.top()
-        self.panel.show()
+        self.show()
         self.window.clear()
         self.window.box()
         self.first_pass = True
         self.position = self.start_pos
 
     def _post_loop(self):
-        self.window.clear()
-        self.panel.hide()
-        panel.update_panels()
-        curses.doupdate()
+        self.hide()
 
     def print_item_list(self):
         for item in self.items:
             if item.index == self.position:
-                mode = curses.A_REVERSE
+                mode = A_REVERSE
             else:
                 if item.label == 'Set Attributes' and \
                     self.app.player.player_class is None:
-                    mode = curses.A_DIM
+                    mode = A_DIM
                 else:
-                    mode = curses.A_NORMAL
+                    mode = A_NORMAL
 
             self.window.addstr(self.margin + item.index, 2, item.label, mode)
 
     def _first_pass(self):
         self.first_pass = False
 
-    def main_loop(self):
-        self.print_item_list()
-        self.draw_charinfo()
-        if not self.first_pass:
-            return self.process_selection(self.window.getch())
-        else:
+    async def main_loop(self):
+        if self.first_pass:
             self._first_pass()
-        return True
+            return True
+        return await self.process_input()
 
     def _msg_bar_update(self):
         if self.position == len(self.items) - 1:
@@ -165,16 +172,19 @@ class Menu(GameWindow):
         else:
             self.msg_bar('Hit ENTER to choose this option')
 
-    def process_selection(self, key):
+    async def process_selection(self, key):
         self.last_keystroke = self._parse_keystroke(key)
-        if key in [curses.KEY_ENTER, ord('\n')]:
+        if self.last_keystroke == 'enter':
             if self.position == len(self.items) - 1:
                 return False
             else:
-                self.current_msg = self.items[self.position].hook()
-                self.window.box()
+                msg = self.items[self.position].hook()
+                if inspect.isawaitable(msg):
+                    # The hook opened a window, it returns when closed
+                    msg = await msg
+                self.current_msg = msg
 
-        result = self._default_selections(key)
+        result = await self._default_selections(key)
         self._msg_bar_update()
 
         return result
@@ -193,34 +203,16 @@ class MenuItem():
 class AttributeSelection(Menu):
     """ Player attribute selection and save functionality """
 
+    def __init__(self, stdscreen, app):
+        super().__init__(stdscreen, app)
+        # Item label -> handler for enter, see select
+        self.item_handlers = {'Re-roll': self.reroll, 'Done': self.done}
+        self.handlers['enter'] = self.select
+
     def attr_init(self, force=False):
         if not self.app.player.init_complete or force:
             # rolls initial player attributes
-            rr = RandomRoll(self.app.player, 7)
-            attr_list = self.app.player.attributes[0]
-
-            # Seed initial stats
-            while True:
-                for a in attr_list:
-                    result = rr.roll(None)
-                    setattr(self.app.player, a, result)
-                if self.app.player.free_attr < 16 and self.app.player.free_attr > 10:
-                    break
-
-            # Distribute remainder based on class
-            cls = self.app.player.player_class
-            if cls is not None:
-                preferred = [attr for attr in cls.preferred_attr]
-                # Set resists
-                for resist in cls.resists:
-                    setattr(self.app.player, resist, cls.resists[resist])
-            else:
-                preferred = []
-            preferred.append('health')
-            while self.app.player.free_attr > 5:
-                a = random.choice(attr_list)
-                if a in preferred:
-                    setattr(self.app.player, a, getattr(self.app.player, a) + 1)
+            self.app.player.roll_attributes()
 
         self.refresh_attributes()
 
@@ -235,17 +227,8 @@ class AttributeSelection(Menu):
         self.items = [(attr, getattr(self.app.player, attr)) for attr in attrs]
         self.items.extend([('Re-roll', ''), ('Done', '')])
 
-    def _post_loop(self):
-        self.window.clear()
-        self.panel.hide()
-        self.side_win.clear()
-        self.desc_panel.hide()
-        panel.update_panels()
-        curses.doupdate()
-
     def _pre_loop(self):
-        self.panel.top()
-        self.panel.show()
+        self.show()
         self.window.clear()
         self.window.box()
         self.position = self.start_pos
@@ -256,14 +239,15 @@ class AttributeSelection(Menu):
         self.side_win.clear()
         self.side_win.box()
 
-    def _loop_begin(self):
-        self.window.refresh()
-        self.window.box()
-        self.side_win.overlay(self.window)
-        self._draw_desc()
-        curses.doupdate()
+    def _panels(self):
+        panels = super()._panels()
+        panels.append(('side', None, self._draw_desc))
         if self.show_stats:
-            self._print_stats()
+            panels.append(('stats', self._stats_state, self._print_stats))
+        return panels
+
+    def _stats_state(self):
+        return self._player_version()
 
     def _print_stats(self):
         # Print resist values
@@ -279,35 +263,45 @@ class AttributeSelection(Menu):
 
     def process_selection(self, key):
         self.last_keystroke = self._parse_keystroke(key)
-        if key in [curses.KEY_ENTER, ord('\n')]:
-            if self.position == len(self.items) - 1:
-                if self.app.player.free_attr > 0:
-                    self.msg_bar('{} attribute points to assign!'.format(
-                        self.app.player.free_attr))
-                    return True
+        return self._default_selections(key)
 
+    def navigate(self, n):
+        super().navigate(n)
+        self._msg_bar_update()
+
+    def select(self):
+        # Enter runs the handler for the item under the cursor, the
+        # items without one share select_item
+        label = self.items[self.position][0]
+        return self.item_handlers.get(label, self.select_item)()
+
+    def select_item(self):
+        if self.app.player.free_attr > 0:
+            self.incr_attr()
+            if self.app.player.free_attr == 0:
                 self.app.player.complete_init()
-                self.over = None
-                return False
-            elif self.position == len(self.items) - 2:
-                self.over = 're-roll'
-                self.app.player._attr_init()
-                self.attr_init(True)
-                self.print_item_list()
-                self.msg_bar('Attributes re-rolled')
-                return True
-            else:
-                if self.app.player.free_attr > 0:
-                    self.incr_attr()
-                    if self.app.player.free_attr == 0:
-                        self.app.player.complete_init()
-                else:
-                    # self.current_msg = 'No remaining attribute points'
-                    self.msg_bar()
-                    return True
+            self._msg_bar_update()
+        else:
+            self.msg_bar()
 
-        result = self._default_selections(key)
+    def reroll(self):
+        self.over = 're-roll'
+        self.app.player._attr_init()
+        self.attr_init(True)
+        self.print_item_list()
+        self.msg_bar('Attributes re-rolled')
 
+    def done(self):
+        if self.app.player.free_attr > 0:
+            self.msg_bar('{} attribute points to assign!'.format(
+                self.app.player.free_attr))
+            return True
+
+        self.app.player.complete_init()
+        self.over = None
+        return False
+
+    def _msg_bar_update(self):
         if self.position < len(self.items) - 2:
             self.over = self.app.player.attributes[0][self.position]
             self.attribute_info()
@@ -320,8 +314,6 @@ class AttributeSelection(Menu):
             self.clear_win(self.side_win)
             self.over = 'done'
             self.current_msg = 'Hit ENTER to return to the previous menu'
-        self.draw_charinfo()
-        return result
 
     def incr_attr(self):
         self.debug_info()
@@ -337,59 +329,49 @@ class AttributeSelection(Menu):
         self.refresh_attributes()
 
     def print_item_list(self):
+        # Padded, the count is not cleared between frames
         self.window.addstr(self.margin, 2, 'Attributes ({})'.format(
-            self.app.player.free_attr),
-                           self.info_msg | curses.A_BOLD
+            self.app.player.free_attr).ljust(16),
+                           self.info_msg | A_BOLD
                            )
         for idx, item in enumerate(self.items):
             attr, val = item
             if idx == self.position:
-                mode = curses.A_REVERSE
+                mode = A_REVERSE
             else:
-                mode = curses.A_NORMAL
+                mode = A_NORMAL
 
             self.window.addstr(self.margin + idx + 1, 2, attr, mode)
             self.window.addstr(self.margin + idx + 1, 17, str(val).rjust(2),
                                mode)
 
+    def _resist_lines(self):
+        player = self.app.player
+        return ['{:<15}{:>2}'.format(resist, getattr(player, resist))
+                for resist in player.resists[0]]
+
     def print_resist_list(self):
         self.window.addstr(self.margin + 11, 2, 'Resists',
-                           self.info_msg | curses.A_BOLD)
-        for i, resist in enumerate(self.app.player.resists[0]):
-            self.window.addstr(
-                self.margin + 12 + i, 2,
-                resist,
-                curses.color_pair(1)
-            )
-            self.window.addstr(
-                self.margin + 12 + i, 17,
-                str(getattr(self.app.player, resist)).rjust(2),
-                curses.color_pair(1)
-            )
+                           self.info_msg | A_BOLD)
+        lines = self._cached_lines('resists', self._resist_lines)
+        for i, line in enumerate(lines):
+            self.window.addstr(self.margin + 12 + i, 2, line, color_pair(1))
+
+    def _stat_lines(self):
+        # Calculated stats first, then skills
+        player = self.app.player
+        stats = player.player_stats
+        names = [s for s in stats if not stats[s][1]] + \
+                [s for s in stats if stats[s][1]]
+        return ['{:<15}{:>2}'.format(s, player.get_stat(s)) for s in names]
 
     def print_player_stats(self):
-
-        def _print_stat(s):
-            self.window.addstr(self.margin + i, 22, s, mode)
-            self.window.addstr(
-                self.margin + i, 37,
-                str(self.app.player.get_stat(s)).rjust(2),
-                mode
-            )
-
-        mode = curses.color_pair(1)
         self.window.addstr(self.margin, 22, 'Player Stats',
-                           self.info_msg | curses.A_BOLD
+                           self.info_msg | A_BOLD
                            )
-        i = 1
-        __stats = self.app.player.player_stats
-        for calc_stat in [s for s in __stats if not __stats[s][1]]:
-            _print_stat(calc_stat)
-            i += 1
-
-        for stat in [s for s in __stats if __stats[s][1]]:
-            _print_stat(stat)
-            i += 1
+        lines = self._cached_lines('stats', self._stat_lines)
+        for i, line in enumerate(lines, 1):
+            self.window.addstr(self.margin + i, 22, line, color_pair(1))
 
     def attribute_info(self):
         title = self.over
@@ -398,6 +380,10 @@ class AttributeSelection(Menu):
 
 
 class ClassSelection(AttributeSelection):
+    def __init__(self, stdscreen, app):
+        super().__init__(stdscreen, app)
+        self.item_handlers = {'Done': self.quit}
+
     def post_init(self):
         self.side_win, self.desc_panel = self.side_panel(20, 60, 2, 40)
         self.items = [(pc.__name__, pc) for pc in CLASSES]
@@ -406,34 +392,26 @@ class ClassSelection(AttributeSelection):
 
     def print_item_list(self):
         self.window.addstr(self.margin, 2, 'Player Classes',
-                           self.info_msg | curses.A_BOLD)
+                           self.info_msg | A_BOLD)
         for idx, item in enumerate(self.items):
             cls_name, cls = item
             if idx == self.position:
-                mode = curses.A_REVERSE
+                mode = A_REVERSE
             else:
-                mode = curses.A_NORMAL
+                mode = A_NORMAL
 
             self.window.addstr(self.margin + idx + 2, 2, cls_name, mode)
 
     def _first_pass(self):
         self.first_pass = False
 
-    def process_selection(self, key):
-        self.last_keystroke = self._parse_keystroke(key)
-        if self.last_keystroke == 'enter':
-            if self.position == len(self.items) - 1:
-                self.over = None
-                return False
-            else:
-                self.app.player.player_class = self.items[self.position][1]()
-                self.current_msg = 'Class selected: {}'.format(
-                    self.items[self.position][0])
-                self.draw_charinfo()
-                return False
-
-        result = self._default_selections(key)
+    def select_item(self):
+        self.app.player.player_class = self.items[self.position][1]()
+        self.current_msg = 'Class selected: {}'.format(
+            self.items[self.position][0])
+        return False
 
+    def _msg_bar_update(self):
         if self.position < len(self.items) - 1:
             cls = self.items[self.position][1]
             self.over = cls.__name__
@@ -444,9 +422,6 @@ class ClassSelection(AttributeSelection):
             self.over = 'done'
             self.current_msg = 'Hit ENTER to return to the previous menu'
 
-        self.draw_charinfo()
-        return result
-
     def class_info(self, cls):
         title = self.over
         desc = cls.description
@@ -454,6 +429,11 @@ class ClassSelection(AttributeSelection):
 
 
 class OptionMenu(AttributeSelection):
+    def __init__(self, stdscreen, app):
+        super().__init__(stdscreen, app)
+        self.item_handlers = {'Done': self.quit}
+        self.handlers['backspace'] = self.select_item
+
     def post_init(self):
         args = self.app.args
         self._filter_printed_arguments()
@@ -462,21 +442,26 @@ class OptionMenu(AttributeSelection):
 
     def _filter_printed_arguments(self):
         # Filters and refreshes the argument list
-        exclude = ['create', 'dimensions', 'verbose']
+        exclude = ['create', 'dimensions', 'verbose', 'map_size', 'headless',
+                   'games', 'turns', 'script', 'seed', 'output']
         self.items = [(k, self.app.args.__dict__[k]) for k in
                       self.app.args.__dict__ if k not in exclude]
         self.items.append(('Done', ''))
 
+    def _items_state(self):
+        self._filter_printed_arguments()
+        return super()._items_state()
+
     def print_item_list(self):
         self._filter_printed_arguments()
         self.window.addstr(self.margin, 2, 'Game Options',
-                           self.info_msg | curses.A_BOLD)
+                           self.info_msg | A_BOLD)
         for idx, item in enumerate(self.items):
             option, value = item
             if idx == self.position:
-                mode = curses.A_REVERSE
+                mode = A_REVERSE
             else:
-                mode = curses.A_NORMAL
+                mode = A_NORMAL
 
             self.window.addstr(self.margin + idx + 2, 2, option, mode)
             self.window.addstr(self.margin + idx + 2, 17, str(value), mode)
@@ -500,25 +485,15 @@ class OptionMenu(AttributeSelection):
                     self.msg_bar('Already at 0!')
         return v
 
-    def process_selection(self, key):
-        self.last_keystroke = self._parse_keystroke(key)
-
-        if self.last_keystroke == 'enter':
-            if self.position == len(self.items) - 1:
-                self.over = None
-                return False
-
-        if self.last_keystroke in ['enter', 'backspace']:
-            for idx, item in enumerate(self.items):
-                if idx == self.position:
-                    setattr(self.app.args, item[0],
-                            self._increment_value(item[1]))
-                    return True
-
-            self.print_item_list()
-
-        result = self._default_selections(key)
+    def select_item(self):
+        # Enter raises the option under the cursor, backspace lowers it.
+        # The value is read from args, items is only refreshed per frame
+        option = self.items[self.position][0]
+        if option != 'Done':
+            value = getattr(self.app.args, option)
+            setattr(self.app.args, option, self._increment_value(value))
 
+    def _msg_bar_update(self):
         if self.position < len(self.items) - 1:
             self.over = self.items[self.position][0]
             self.option_info()
@@ -528,8 +503,6 @@ class OptionMenu(AttributeSelection):
             self.over = 'done'
             self.msg_bar('Hit ENTER to return to the previous menu')
 
-        return result
-
     def option_info(self):
         # Option menu side window descriptions
         descriptions = {
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+# Pathfinding
+# Single-pair A* and shared multi-source Dijkstra flow fields
+# over a passability plane read from the level on first use.
+# Searches only allocate for the window of the map they cover
+
+import heapq
+from array import array
+from collections import deque
+
+import numpy as np
+
+# 4-way movement, matching the player's arrow keys
+STEPS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+UNREACHED = -1
+
+
+class FlowField(object):
+
+    """ Step distances from a set of source cells, shared by every
+    monster heading toward them.  dist covers the window of the map at
+    (top, left) that the field can reach """
+
+    def __init__(self, sources, dist, top, left, height, width):
+        self.sources = sources
+        self.dist = dist
+        self.top, self.left = top, left
+        self.height, self.width = height, width
+
+    def distance(self, pos):
+        # Steps to the nearest source, None if out of range
+        y, x = pos[0] - self.top, pos[1] - self.left
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            return None
+        d = self.dist[y * self.width + x]
+        return None if d == UNREACHED else d
+
+    def next_step(self, pos):
+        """ Neighbouring cell one step closer to a source, or None """
+        best, best_d = None, self.distance(pos)
+        if best_d is None:
+            return None
+        for dy, dx in STEPS:
+            cell = pos[0] + dy, pos[1] + dx
+            d = self.distance(cell)
+            if d is not None and d < best_d:
+                best, best_d = cell, d
+        return best
+
+
+class Pathfinder(object):
+
+    """ Pathfinding service for one Map.  Nothing is read or allocated
+    until the first search.  A* searches reuse one arena of score
+    arrays, grown to the largest search window so far.  Flow fields
+    are cached until their sources move or the terrain changes """
+
+    def __init__(self, level, max_cost=64):
+        self.level = level
+        self.height, self.width = level.bounds
+        self.max_cost = max_cost    # flow fields stop at this distance
+        # Chunked levels are read a chunk at a time, as searches reach
+        # them (see FieldOfView)
+        self.chunk_size = getattr(level.grid, 'chunk_size', None)
+        self.passable = None    # bool plane, read on first search
+        self._read = set()      # chunks already in self.passable
+
+        # A* arena, a cell's scores are only valid when its stamp
+        # matches the current search so nothing is cleared between runs
+        self._g = array('i')
+        self._parent = array('i')
+        self._stamp = array('I')
+        self._search = 0
+        self._open = []
+
+        self._field = None
+
+    def refresh_cell(self, pos):
+        """ Re-read one cell's tile, cached fields are dropped only if its
+        passability changed """
+        if self.passable is None:
+            return      # the first search reads the current terrain
+        tile = self.level.grid[pos]
+        passable = bool(tile) and tile.passable
+        if self.passable[pos] != passable:
+            self.passable[pos] = passable
+            self._field = None
+
+    def _window(self, top, bottom, left, right):
+        # Passability of the cells in the window, flat row by row
+        if self.passable is None:
+            if self.chunk_size is None:
+                self.passable = self.level.tile_mask('passable')
+            else:
+                self.passable = np.zeros(self.level.bounds, dtype=bool)
+        if self.chunk_size is not None:
+            size = self.chunk_size
+            for cy in range(top // size, (bottom - 1) // size + 1):
+                for cx in range(left // size, (right - 1) // size + 1):
+                    if (cy, cx) in self._read:
+                        continue
+                    self._read.add((cy, cx))
+                    window = (slice(cy * size, (cy + 1) * size),
+                              slice(cx * size, (cx + 1) * size))
+                    self.level.tile_mask('passable', False, window,
+                                         self.passable)
+        return self.passable[top:bottom, left:right].ravel().tolist()
+
+    def _bounds(self, cells, reach):
+        # Window of the map within <reach> steps of <cells>
+        ys = [y for y, _ in cells]
+        xs = [x for _, x in cells]
+        return (max(0, min(ys) - reach), min(self.height, max(ys) + reach + 1),
+                max(0, min(xs) - reach), min(self.width, max(xs) + reach + 1))
+
+    @staticmethod
+    def _neighbours(index, height, width):
+        y, x = divmod(index, width)
+        if y > 0:
+            yield index - width
+        if y < height - 1:
+            yield index + width
+        if x > 0:
+            yield index - 1
+        if x < width - 1:
+            yield index + 1
+
+    def _arena(self, size):
+        # Grow the score arrays to cover <size> cells, new cells carry
+        # stamp 0 which no search uses
+        grow = size - len(self._stamp)
+        if grow > 0:
+            self._g.extend(array('i', [0]) * grow)
+            self._parent.extend(array('i', [0]) * grow)
+            self._stamp.extend(array('I', [0]) * grow)
+
+    def astar(self, start, goal):
+        """ Shortest 4-way path from start to goal, excluding start.
+        Returns None when goal cannot be reached """
+        # Search a window around start, widened until it holds the
+        # path found: every path of n steps stays within n of start,
+        # so a path no longer than the window's reach is the shortest
+        reach = max(2 * (abs(start[0] - goal[0]) + abs(start[1] - goal[1])),
+                    16)
+        while True:
+            bounds = self._bounds([start], reach)
+            path = self._astar(start, goal, *bounds)
+            if (path is not None and len(path) <= reach) or \
+                    bounds == (0, self.height, 0, self.width):
+                return path
+            reach *= 2
+
+    def _astar(self, start, goal, top, bottom, left, right):
+        height, width = bottom - top, right - left
+        passable = self._window(top, bottom, left, right)
+        goal_i = (goal[0] - top) * width + goal[1] - left
+        if not passable[goal_i]:
+            return None
+        self._arena(height * width)
+        self._search += 1
+        stamp, g, parent = self._stamp, self._g, self._parent
+        search = self._search
+        open_list = self._open
+        del open_list[:]
+
+        start_i = (start[0] - top) * width + start[1] - left
+        stamp[start_i] = search
+        g[start_i] = 0
+        parent[start_i] = -1
+        gy, gx = goal[0] - top, goal[1] - left
+        open_list.append((abs(start[0] - goal[0]) + abs(start[1] - goal[1]),
+                          0, start_i))
+
+        while open_list:
+            _, cost, index = heapq.heappop(open_list)
+            if index == goal_i:
+                return self._trace(goal_i, top, left, width)
+            if cost > g[index]:
+                continue    # stale entry
+            cost += 1
+            for nxt in self._neighbours(index, height, width):
+                if not passable[nxt]:
+                    continue
+                if stamp[nxt] != search or cost < g[nxt]:
+                    stamp[nxt] = search
+                    g[nxt] = cost
+                    parent[nxt] = index
+                    ny, nx = divmod(nxt, width)
+                    heapq.heappush(open_list,
+                                   (cost + abs(ny - gy) + abs(nx - gx),
+                                    cost, nxt))
+        return None
+
+    def _trace(self, index, top, left, width):
+        path = []
+        while self._parent[index] != -1:
+            y, x = divmod(index, width)
+            path.append((y + top, x + left))
+            index = self._parent[index]
+        path.reverse()
+        return path
+
+    def flow_field(self, sources):
+        """ Dijkstra map from one or more cells (usually the player),
+        rebuilt only when the sources or the terrain change.  It covers
+        the cells within max_cost of the sources """
+        sources = tuple(sources)
+        if self._field is not None and self._field.sources == sources:
+            return self._field
+
+        top, bottom, left, right = self._bounds(sources, self.max_cost) \
+            if sources else (0, 0, 0, 0)
+        height, width = bottom - top, right - left
+        passable = self._window(top, bottom, left, right) if sources else []
+        dist = array('i', [UNREACHED]) * (height * width)
+        frontier = deque()
+        for y, x in sources:
+            index = (y - top) * width + x - left
+            dist[index] = 0
+            frontier.append(index)
+        # Every step costs one, so a breadth-first sweep settles cells
+        # in Dijkstra order
+        while frontier:
+            index = frontier.popleft()
+            cost = dist[index] + 1
+            if cost > self.max_cost:
+                continue
+            for nxt in self._neighbours(index, height, width):
+                if passable[nxt] and dist[nxt] == UNREACHED:
+                    dist[nxt] = cost
+                    frontier.append(nxt)
+
+        self._field = FlowField(sources, dist, top, left, height, width)
+        return self._field
@@ -6,6 +6,10 @@ from .core import Entity
 class Player(Entity):
     """ Player class containing all methods and properties """
 
+    __slots__ = ('score', 'initialized')
+    char = '@'
+    is_player = True
+
     def __init__(self):
         self.score = 0
         self.initialized = False    # Set to true after CharCreate()
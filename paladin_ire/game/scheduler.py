@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Turn scheduler
+# Energy based turn order on a heap, only the actors that are due
+# get popped, so idle actors cost nothing per turn
+
+import heapq
+import itertools
+
+
+class TurnScheduler(object):
+
+    """ Each action costs ACTION_COST energy, an actor gains <speed>
+    energy per tick so it is due again ACTION_COST / speed ticks after
+    acting.  The fast status doubles speed, paralyzed actors lose their
+    turns until it wears off.  Actors with nothing to do should be
+    removed (and added back when woken) rather than left scheduled.
+    Hooks added with every_round run once per ROUND ticks, the time a
+    BASE_SPEED actor takes to act again """
+
+    ACTION_COST = 100
+    BASE_SPEED = 10
+    ROUND = ACTION_COST / float(BASE_SPEED)
+
+    def __init__(self):
+        self.time = 0.
+        self._heap = []         # [due, seq, actor], actor None if removed
+        self._entries = {}      # id(actor) -> heap entry
+        self._seq = itertools.count()   # keeps equal due times in order
+        self._stale = 0
+        self.round_hooks = []   # called with the number of rounds ended
+        self._rounds = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, actor):
+        return id(actor) in self._entries
+
+    def speed(self, actor):
+        speed = getattr(actor, 'speed', self.BASE_SPEED)
+        if getattr(actor, 'fast', 0) > 0:
+            speed *= 2
+        return speed
+
+    def add(self, actor, delay=0.):
+        self.remove(actor)
+        entry = [self.time + delay, next(self._seq), actor]
+        self._entries[id(actor)] = entry
+        heapq.heappush(self._heap, entry)
+
+    def remove(self, actor):
+        entry = self._entries.pop(id(actor), None)
+        if entry is not None:
+            # Lazy deletion, the heap is rebuilt once half of it is stale
+            entry[2] = None
+            self._stale += 1
+            if self._stale > len(self._heap) // 2:
+                self._heap = [e for e in self._heap if e[2] is not None]
+                heapq.heapify(self._heap)
+                self._stale = 0
+
+    def every_round(self, hook):
+        """ Call hook(rounds) whenever the clock passes the end of one
+        or more rounds, e.g. EntityStore.pre_turn to count the status
+        effects of every stored entity down at once """
+        self.round_hooks.append(hook)
+
+    def end_turn(self, actor, cost=ACTION_COST):
+        # Schedule the actor's next turn after an action of <cost>
+        self.add(actor, cost / float(self.speed(actor)))
+
+    def next_actor(self):
+        """ Pop the next due actor and run its pre_turn hook, after the
+        round hooks if a round just ended.  Paralyzed actors are
+        rescheduled without acting.  Returns None when no actors are
+        scheduled """
+        while self._heap:
+            due, _, actor = heapq.heappop(self._heap)
+            if actor is None:
+                self._stale -= 1
+                continue
+            del self._entries[id(actor)]
+            self.time = due
+            rounds = int(due // self.ROUND) - self._rounds
+            if rounds > 0:
+                self._rounds += rounds
+                for hook in self.round_hooks:
+                    hook(rounds)
+            paralyzed = getattr(actor, 'paralyzed', 0) > 0
+            if hasattr(actor, 'pre_turn'):
+                actor.pre_turn()
+            if paralyzed:
+                self.end_turn(actor)
+                continue
+            return actor
+        return None
+
+    def run_until(self, target, act):
+        """ Let every actor due before <target> act, calling act(actor)
+        for each.  act must call end_turn (or remove) for its actor.
+        Returns target once it is due, None if it is not scheduled """
+        while target in self:
+            actor = self.next_actor()
+            if actor is target or actor is None:
+                return actor
+            act(actor)
+        return None
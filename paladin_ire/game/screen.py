@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+
+# Screen
+# Off-screen cell buffer the game windows draw into.  Every window
+# keeps its own cells (character + curses attribute) like a curses
+# window, and windows are stacked like curses panels.  present()
+# composites the visible panels, compares the result with what the
+# terminal already shows and sends only the changed cells to a backend:
+#   CursesBackend   the game's curses screen
+#   AnsiBackend     plain escape sequences to any byte stream
+#   NullBackend     nothing, for tests and benchmarks
+# Attribute and key values are the curses ones, so drawing code may
+# use curses.A_* / curses.KEY_* without the backend being curses
+
+import os
+import select
+import sys
+import weakref
+
+import numpy as np
+
+# curses.A_<key> values
+A_NORMAL = 0
+A_ATTRIBUTES = ~0xff
+A_COLOR = 0xff00
+A_STANDOUT = 0x10000
+A_UNDERLINE = 0x20000
+A_REVERSE = 0x40000
+A_BLINK = 0x80000
+A_DIM = 0x100000
+A_BOLD = 0x200000
+A_ALTCHARSET = 0x400000
+
+# curses.KEY_<key> values
+KEY_DOWN = 258
+KEY_UP = 259
+KEY_LEFT = 260
+KEY_RIGHT = 261
+KEY_BACKSPACE = 263
+KEY_ENTER = 343
+
+# Colors by pair number as (foreground, background), curses.COLOR_*
+# numbers are the ANSI ones
+BLACK, RED, GREEN, YELLOW, BLUE, MAGENTA, CYAN, WHITE = range(8)
+COLOR_PAIRS = {
+    1: (CYAN, BLACK),
+    2: (RED, BLACK),
+    3: (GREEN, BLUE),
+    4: (WHITE, BLUE),
+    5: (BLACK, RED),
+}
+
+# Unicode for the vt100 alternate character set (curses.ACS_*)
+ACS_UNICODE = {
+    '+': '→', ',': '←', '-': '↑', '.': '↓',
+    '0': '█', '`': '◆', 'a': '▒', 'f': '°',
+    'g': '±', 'h': '▒', 'i': '§', 'j': '┘',
+    'k': '┐', 'l': '┌', 'm': '└', 'n': '┼',
+    'o': '⎺', 'p': '⎻', 'q': '─', 'r': '⎼',
+    's': '⎽', 't': '├', 'u': '┤', 'v': '┴',
+    'w': '┬', 'x': '│', 'y': '≤', 'z': '≥',
+    '{': 'π', '|': '≠', '}': '£', '~': '·',
+}
+
+BLANK = ord(' ')
+GAP = 4     # unchanged cells rewritten rather than moving the cursor
+
+
+def color_pair(n):
+    """ Same as curses.color_pair, without an initialized screen """
+    return (n << 8) & A_COLOR
+
+
+def _acs(ch):
+    return ord(ch) | A_ALTCHARSET
+
+
+def _split(args, count):
+    # curses style optional leading (y, x)
+    if len(args) > count:
+        return args[0], args[1], args[2:]
+    return None, None, args
+
+
+def _text(chars, attrs):
+    return ''.join(ACS_UNICODE.get(chr(c), chr(c)) if a & A_ALTCHARSET
+                   else chr(c) for c, a in zip(chars, attrs))
+
+
+class ScreenWindow(object):
+
+    """ A block of cells at (y, x) with the subset of the curses window
+    API the game uses.  Text running past the right edge wraps, text
+    past the last line is dropped """
+
+    def __init__(self, screen, height, width, y, x):
+        self.screen = screen
+        self.y, self.x = y, x
+        self.chars = np.full((height, width), BLANK, dtype=np.uint32)
+        self.attrs = np.zeros((height, width), dtype=np.int64)
+        self.cursor = 0, 0
+
+    def getmaxyx(self):
+        return self.chars.shape
+
+    def getbegyx(self):
+        return self.y, self.x
+
+    def getyx(self):
+        return self.cursor
+
+    def move(self, y, x):
+        self.cursor = y, x
+
+    def addstr(self, *args):
+        y, x, (text, *attr) = _split(args, 2)
+        if y is not None:
+            self.move(y, x)
+        attr = attr[0] if attr else A_NORMAL
+        height, width = self.chars.shape
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        y, x = self.cursor
+        while len(codes) and y < height:
+            part = codes[:width - x]
+            self.chars[y, x:x + len(part)] = part
+            self.attrs[y, x:x + len(part)] = attr
+            codes = codes[len(part):]
+            x += len(part)
+            if x >= width:
+                y, x = y + 1, 0
+        self.cursor = min(y, height - 1), x
+
+    def addch(self, *args):
+        y, x, (ch, *attr) = _split(args, 2)
+        if y is not None:
+            self.move(y, x)
+        attr = attr[0] if attr else A_NORMAL
+        if isinstance(ch, int):
+            # chtype, e.g. curses.ACS_HLINE or a tile character
+            ch, attr = chr(ch & 0xff), attr | (ch & A_ATTRIBUTES)
+        self.addstr(ch, attr)
+
+    def clrtoeol(self):
+        y, x = self.cursor
+        self.chars[y, x:] = BLANK
+        self.attrs[y, x:] = A_NORMAL
+
+    def erase(self):
+        self.chars.fill(BLANK)
+        self.attrs.fill(A_NORMAL)
+        self.cursor = 0, 0
+
+    clear = erase
+
+    def box(self):
+        height, width = self.chars.shape
+        self.chars[0, :] = self.chars[-1, :] = ord('q')
+        self.chars[:, 0] = self.chars[:, -1] = ord('x')
+        self.chars[0, 0], self.chars[0, -1] = ord('l'), ord('k')
+        self.chars[-1, 0], self.chars[-1, -1] = ord('m'), ord('j')
+        for edge in (self.attrs[0, :], self.attrs[-1, :], self.attrs[:, 0],
+                     self.attrs[:, -1]):
+            edge[:] = A_ALTCHARSET
+
+    def keypad(self, flag):
+        # Backends always decode keys
+        pass
+
+    def getch(self):
+        """ Like curses, shows pending changes before waiting """
+        self.screen.present()
+        return self.screen.getch()
+
+    def getstr(self, y, x, length):
+        """ Line input of up to <length> characters at (y, x), echoed
+        into this window """
+        chars = []
+        while True:
+            self.move(y, x + len(chars))
+            key = self.getch()
+            if key in (ord('\n'), ord('\r'), KEY_ENTER):
+                return ''.join(chars)
+            elif key in (KEY_BACKSPACE, ord('\b'), 127):
+                if chars:
+                    chars.pop()
+                    self.addch(y, x + len(chars), ' ')
+            elif 32 <= key < 0x110000 and chr(key).isprintable() and \
+                    len(chars) < length:
+                self.addch(y, x + len(chars), chr(key))
+                chars.append(chr(key))
+
+
+class ScreenPanel(object):
+
+    """ Stacking for one ScreenWindow, same calls as curses.panel """
+
+    def __init__(self, screen, window):
+        self.screen = screen
+        self._window = window
+        self._hidden = False
+
+    def window(self):
+        return self._window
+
+    def hidden(self):
+        return self._hidden
+
+    def hide(self):
+        self._hidden = True
+
+    def show(self):
+        self._hidden = False
+
+    def top(self):
+        self.screen._restack(self, top=True)
+
+    def bottom(self):
+        self.screen._restack(self, top=False)
+
+
+class Screen(object):
+
+    """ The panel stack and the cells last sent to the backend """
+
+    def __init__(self, height, width, backend):
+        self.height, self.width = height, width
+        self.backend = backend
+        self._stack = []        # weak references, bottom first
+        self.chars = np.full((height, width), BLANK, dtype=np.uint32)
+        self.attrs = np.zeros((height, width), dtype=np.int64)
+        self._front_chars = self.chars.copy()
+        self._front_attrs = self.attrs.copy()
+        self.frames = 0
+        self.cells_changed = 0      # in the last frame
+        self.bytes_written = 0      # in the last frame
+        self.pushback = []          # keys put back, read before new ones
+        self.invalidate()
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def window(self, height=0, width=0, y=0, x=0):
+        """ New window, a size of 0 reaches the screen edge (as
+        curses.newwin) """
+        height = height or self.height - y
+        width = width or self.width - x
+        return ScreenWindow(self, height, width, y, x)
+
+    def new_panel(self, window):
+        panel = ScreenPanel(self, window)
+        self._stack.append(weakref.ref(panel))
+        return panel
+
+    def _restack(self, panel, top):
+        refs = [r for r in self._stack if r() not in (None, panel)]
+        if top:
+            refs.append(weakref.ref(panel))
+        else:
+            refs.insert(0, weakref.ref(panel))
+        self._stack = refs
+
+    def panels(self):
+        """ Live panels, bottom first """
+        panels = [r() for r in self._stack]
+        self._stack = [r for r, p in zip(self._stack, panels) if p is not None]
+        return [p for p in panels if p is not None]
+
+    def invalidate(self):
+        """ Forget what the terminal shows, the next frame sends every
+        cell """
+        self._front_chars.fill(0xffffffff)
+
+    def compose(self):
+        self.chars.fill(BLANK)
+        self.attrs.fill(A_NORMAL)
+        for panel in self.panels():
+            if panel.hidden():
+                continue
+            win = panel.window()
+            y, x = win.y, win.x
+            h = min(win.chars.shape[0], self.height - y)
+            w = min(win.chars.shape[1], self.width - x)
+            if h > 0 and w > 0:
+                self.chars[y:y + h, x:x + w] = win.chars[:h, :w]
+                self.attrs[y:y + h, x:x + w] = win.attrs[:h, :w]
+
+    def present(self):
+        """ Composite the panels and send the cells that differ from the
+        last frame.  Returns the number of cells sent """
+        self.compose()
+        changed = (self.chars != self._front_chars) | \
+                  (self.attrs != self._front_attrs)
+        start = self.backend.bytes_written
+        for y in np.flatnonzero(changed.any(axis=1)):
+            cols = np.flatnonzero(changed[y])
+            # Runs of changed cells, short gaps are sent with them
+            breaks = np.flatnonzero(np.diff(cols) > GAP) + 1
+            for run in np.split(cols, breaks):
+                x0, x1 = run[0], run[-1] + 1
+                attrs = self.attrs[y, x0:x1]
+                # One write per attribute within the run
+                edges = np.flatnonzero(np.diff(attrs)) + 1
+                for a, b in zip(np.r_[0, edges], np.r_[edges, x1 - x0]):
+                    self.backend.draw(int(y), int(x0 + a),
+                                      self.chars[y, x0 + a:x0 + b],
+                                      int(attrs[a]))
+        self.backend.flush()
+        self._front_chars[:] = self.chars
+        self._front_attrs[:] = self.attrs
+        self.frames += 1
+        self.cells_changed = int(changed.sum())
+        self.bytes_written = self.backend.bytes_written - start
+        return self.cells_changed
+
+    def text(self):
+        """ Lines last sent to the backend """
+        return [_text(c, a) for c, a in zip(self._front_chars,
+                                              self._front_attrs)]
+
+    def getch(self):
+        if self.pushback:
+            return self.pushback.pop(0)
+        return self.backend.getch()
+
+    def ungetch(self, *keys):
+        """ Put <keys> back in front of the input, in order (as
+        curses.ungetch, which takes one key) """
+        self.pushback[:0] = keys
+
+    def timeout(self, delay):
+        self.backend.timeout(delay)
+
+    def fileno(self):
+        """ Descriptor keys arrive on, None when input is polled """
+        return self.backend.fileno()
+
+
+class NullBackend(object):
+
+    """ Draws nothing, keys come from <keys>.  Raises EOFError when a
+    blocking read finds no keys left, so a window waiting for more
+    input than the script gave ends the run instead of hanging """
+
+    def __init__(self, keys=()):
+        self.keys = list(keys)
+        self.bytes_written = 0
+        self._delay = -1
+
+    def draw(self, y, x, chars, attr):
+        pass
+
+    def flush(self):
+        pass
+
+    def timeout(self, delay):
+        self._delay = delay
+
+    def fileno(self):
+        return None
+
+    def getch(self):
+        if self.keys:
+            return self.keys.pop(0)
+        if self._delay < 0:
+            raise EOFError('No keys left')
+        return -1
+
+
+class CursesBackend(object):
+
+    """ Writes to the curses standard screen, curses works out the
+    escape sequences (bytes_written stays 0) """
+
+    def __init__(self, stdscr):
+        import curses
+        self.curses = curses
+        self.stdscr = stdscr
+        self.stdscr.keypad(1)
+        self.bytes_written = 0
+
+    def draw(self, y, x, chars, attr):
+        text = ''.join(map(chr, chars))
+        try:
+            self.stdscr.addstr(y, x, text, attr)
+        except self.curses.error:
+            # Writing the bottom right cell fails after the write,
+            # the cursor cannot move past it
+            pass
+
+    def flush(self):
+        self.stdscr.noutrefresh()
+        self.curses.doupdate()
+
+    def timeout(self, delay):
+        self.stdscr.timeout(delay)
+
+    def fileno(self):
+        return sys.stdin.fileno()
+
+    def getch(self):
+        return self.stdscr.getch()
+
+
+class AnsiBackend(object):
+
+    """ Escape sequences to the binary stream <out>, keys read from file
+    descriptor <infd> (put the terminal in cbreak mode first) """
+
+    SEQUENCES = {
+        b'\x1b[A': KEY_UP, b'\x1bOA': KEY_UP,
+        b'\x1b[B': KEY_DOWN, b'\x1bOB': KEY_DOWN,
+        b'\x1b[C': KEY_RIGHT, b'\x1bOC': KEY_RIGHT,
+        b'\x1b[D': KEY_LEFT, b'\x1bOD': KEY_LEFT,
+    }
+
+    def __init__(self, out, infd=None, pairs=COLOR_PAIRS):
+        self.out = out
+        self.infd = infd
+        self.pairs = pairs
+        self.bytes_written = 0
+        self._buffer = []
+        self._cursor = None
+        self._attr = None
+        self._delay = -1
+        self._pending = b''
+
+    def _sgr(self, attr):
+        codes = ['0']
+        for flag, code in ((A_BOLD, '1'), (A_DIM, '2'), (A_UNDERLINE, '4'),
+                           (A_BLINK, '5'), (A_REVERSE | A_STANDOUT, '7')):
+            if attr & flag:
+                codes.append(code)
+        pair = (attr & A_COLOR) >> 8
+        if pair in self.pairs:
+            fg, bg = self.pairs[pair]
+            codes.extend(['3{}'.format(fg), '4{}'.format(bg)])
+        return '\x1b[{}m'.format(';'.join(codes))
+
+    def draw(self, y, x, chars, attr):
+        if self._cursor != (y, x):
+            self._buffer.append('\x1b[{};{}H'.format(y + 1, x + 1))
+        if (attr & ~A_ALTCHARSET) != self._attr:
+            self._attr = attr & ~A_ALTCHARSET
+            self._buffer.append(self._sgr(attr))
+        self._buffer.append(_text(chars, [attr] * len(chars)))
+        self._cursor = y, x + len(chars)
+
+    def flush(self):
+        if self._buffer:
+            data = ''.join(self._buffer).encode('utf-8')
+            self._buffer = []
+            self.out.write(data)
+            self.out.flush()
+            self.bytes_written += len(data)
+
+    def timeout(self, delay):
+        self._delay = delay
+
+    def fileno(self):
+        return self.infd
+
+    def _read(self, delay):
+        wait = None if delay < 0 else delay / 1000.
+        ready, _, _ = select.select([self.infd], [], [], wait)
+        if ready:
+            self._pending += os.read(self.infd, 64)
+
+    def getch(self):
+        if self.infd is None:
+            raise EOFError('AnsiBackend has no input')
+        if not self._pending:
+            self._read(self._delay)
+        if self._pending[:1] == b'\x1b' and len(self._pending) < 3:
+            # The rest of an escape sequence follows at once
+            self._read(25)
+        if not self._pending:
+            return -1
+        for seq, key in self.SEQUENCES.items():
+            if self._pending.startswith(seq):
+                self._pending = self._pending[len(seq):]
+                return key
+        key, self._pending = self._pending[0], self._pending[1:]
+        return ord('\n') if key == ord('\r') else key
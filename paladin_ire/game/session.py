@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Game session
+# The state of one game (player, level, field of view and turn
+# order) with no curses dependency.  MapWindow draws a session,
+# headless runs drive one directly
+
+from scripts.world_generation import MapGenerator
+from .dice import stream as dice_stream
+from .entity_store import EntityStore
+from .fov import FieldOfView
+from .pathfinding import Pathfinder
+from .scheduler import TurnScheduler
+
+MOVES = {'up': (-1, 0), 'down': (1, 0), 'left': (0, -1), 'right': (0, 1)}
+ACTIONS = ('up', 'down', 'left', 'right', 'wait')
+MONSTERS = 4        # entities placed on each level, see populate
+
+
+class GameSession(object):
+
+    """ One game in progress.  The player's turn is always the current
+    one, act() performs it and runs every other actor until the player
+    is due again """
+
+    def __init__(self, player, map_size, seed=None, fov_radius=8,
+                 prefetch=False, catalog=None):
+        # prefetch builds the level after the current one in a worker
+        # process, worth it for interactive play but not for headless
+        # games that are over in milliseconds.  Levels are populated
+        # from the templates of an EntityCatalog when one is given
+        self.player = player
+        self.map_gen = MapGenerator(*map_size, compact=True, seed=seed,
+                                    prefetch=prefetch)
+        self.fov_radius = fov_radius
+        self.turns = 0
+        self.scheduler = TurnScheduler()
+        self.catalog = catalog
+        # Monsters are rows of one store, their status effects are
+        # counted down together once per round
+        self.store = EntityStore()
+        self.scheduler.every_round(self.store.pre_turn)
+        self.monsters = []
+        self.current_level = None
+        self.enter_level(self.map_gen.add_map())
+        self.scheduler.add(player)
+        self.scheduler.run_until(player, self.take_turn)
+
+    def enter_level(self, level):
+        if self.current_level is not None:
+            self.current_level.unwatch(self.fov.refresh_cell)
+            self.current_level.unwatch(self.pathfinder.refresh_cell)
+            self.clear_monsters()
+        self.current_level = level
+        self.player_pos = level.find_open()
+        level.state.add_entity(self.player_pos, self.player)
+        self.populate(level)
+        self.fov = FieldOfView(level)
+        # Paths and flow fields toward the player, for monster AI.
+        # Free until the first search, which reads the level
+        self.pathfinder = Pathfinder(level)
+        # Doors and walls changed with set_tile update both
+        level.watch(self.fov.refresh_cell)
+        level.watch(self.pathfinder.refresh_cell)
+        self.update_fov()
+
+    def populate(self, level, n=MONSTERS):
+        """ Place n entities spawned from random catalog templates on
+        free open cells of <level> and schedule them.  The catalog is
+        refreshed first, templates saved since the last level count """
+        if self.catalog is None:
+            return
+        self.catalog.refresh()
+        templates = self.catalog.find()
+        if not templates:
+            return
+        rng = dice_stream('monsters')
+        for _ in range(n):
+            pos = self._free_cell(level, rng)
+            if pos is None:
+                break
+            monster = self.catalog.spawn(rng.choice(templates),
+                                         store=self.store)
+            level.state.add_entity(pos, monster)
+            self.monsters.append(monster)
+            self.scheduler.add(monster)
+
+    def _free_cell(self, level, rng, tries=100):
+        # Random passable cell nobody stands on, None if none was found
+        height, width = level.bounds
+        for _ in range(tries):
+            pos = rng.randint(0, height), rng.randint(0, width)
+            if pos in level.grid and getattr(level.grid[pos], 'passable',
+                                             False) \
+                    and not level.state.entities_at(pos):
+                return pos
+        return None
+
+    def clear_monsters(self):
+        # The monsters are not kept once the player leaves a level
+        state = self.current_level.state
+        for monster in self.monsters:
+            self.scheduler.remove(monster)
+            state.remove_entity(state.where(monster), monster)
+            self.store.release(monster._row)
+        self.monsters = []
+
+    def set_tile(self, pos, tile):
+        """ Change the terrain at <pos> (a door opening, a wall dug
+        out), the view is recomputed if it could see the cell """
+        self.current_level.set_tile(pos, tile)
+        self.update_fov()
+
+    def update_fov(self):
+        # Cells that came into or went out of view need redrawing
+        self.current_level.dirty |= self.fov.update(self.player_pos,
+                                                    self.fov_radius)
+
+    def take_turn(self, actor):
+        # Monster AI hooks in here, until then other actors just wait
+        self.scheduler.end_turn(actor)
+
+    def end_player_turn(self):
+        # Run every other actor due before the player's next turn
+        self.turns += 1
+        self.scheduler.end_turn(self.player)
+        self.scheduler.run_until(self.player, self.take_turn)
+
+    def move_player(self, direction):
+        dy, dx = MOVES[direction]
+        y, x = self.player_pos
+        dest = y + dy, x + dx
+        level = self.current_level
+        if dest not in level.grid or not getattr(level.grid[dest],
+                                                 'passable', False):
+            return False
+        level.state.move_entity(self.player, dest)
+        self.player_pos = dest
+        self.update_fov()
+        return True
+
+    def act(self, action):
+        """ Perform one of ACTIONS for the player.  Returns False, without
+        using the turn, if the action was not possible """
+        if action != 'wait' and not self.move_player(action):
+            return False
+        self.end_player_turn()
+        return True
+
+    def close(self):
+        self.map_gen.close()
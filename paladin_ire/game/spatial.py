@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# Spatial index
+# Hash of map objects by cell and by coarse bucket, for O(1)
+# "what is at (y, x)" / "where is X" and cheap radius queries.
+# Objects are tracked by identity, so one object (an interned string
+# item from a loaded level, say) may sit on several cells
+
+
+class SpatialIndex(object):
+
+    """ Objects placed on map cells.  Cells are grouped into square
+    buckets so radius queries only look at nearby cells """
+
+    def __init__(self, bucket=16):
+        self.bucket = bucket
+        self._cells = {}        # pos -> list of objects on that cell
+        self._where = {}        # id(obj) -> cells it is on, oldest first
+        self._count = 0         # placements, an object on two cells is two
+        self._buckets = {}      # (by, bx) -> set of occupied cells
+        self._players = {}      # pos -> number of players on that cell
+
+    @classmethod
+    def from_table(cls, table, bucket=16):
+        # Build from a {pos: [objects]} mapping
+        retval = cls(bucket)
+        for pos, objs in table.items():
+            for obj in objs:
+                retval.add(obj, pos)
+        return retval
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, pos):
+        return pos in self._cells
+
+    def items(self):
+        # (pos, objects) pairs, like the dict tables this replaces
+        return self._cells.items()
+
+    def at(self, pos):
+        return self._cells.get(pos, ())
+
+    def where(self, obj):
+        # First cell the object was placed on, None if it is not placed
+        cells = self._where.get(id(obj))
+        return cells[0] if cells else None
+
+    def has_player(self, pos):
+        return pos in self._players
+
+    def _bucket(self, pos):
+        return pos[0] // self.bucket, pos[1] // self.bucket
+
+    def add(self, obj, pos):
+        cell = self._cells.get(pos)
+        if cell is None:
+            cell = self._cells[pos] = []
+            self._buckets.setdefault(self._bucket(pos), set()).add(pos)
+        cell.append(obj)
+        self._where.setdefault(id(obj), []).append(pos)
+        self._count += 1
+        if getattr(obj, 'is_player', False):
+            self._players[pos] = self._players.get(pos, 0) + 1
+
+    def remove(self, obj, pos=None):
+        # Removes one placement of obj, the first one when pos is None.
+        # Raises KeyError if obj is not on the cell
+        cells = self._where.get(id(obj))
+        if not cells or (pos is not None and pos not in cells):
+            raise KeyError((obj, pos))
+        if pos is None:
+            pos = cells[0]
+        cells.remove(pos)
+        if not cells:
+            del self._where[id(obj)]
+        self._count -= 1
+        cell = self._cells[pos]
+        # By identity, equal objects on the cell are left in place
+        del cell[next(i for i, o in enumerate(cell) if o is obj)]
+        if not cell:
+            # Drop empty cells and buckets to keep the index sparse
+            del self._cells[pos]
+            bucket = self._buckets[self._bucket(pos)]
+            bucket.discard(pos)
+            if not bucket:
+                del self._buckets[self._bucket(pos)]
+        if getattr(obj, 'is_player', False):
+            self._players[pos] -= 1
+            if not self._players[pos]:
+                del self._players[pos]
+        return pos
+
+    def move(self, obj, pos):
+        # Returns the cell the object left
+        old = self.remove(obj)
+        self.add(obj, pos)
+        return old
+
+    def within(self, pos, radius):
+        """ (pos, objects) for occupied cells within <radius> steps,
+        measured as the larger of the y and x distances """
+        y, x = pos
+        by0, bx0 = self._bucket((y - radius, x - radius))
+        by1, bx1 = self._bucket((y + radius, x + radius))
+        for by in range(by0, by1 + 1):
+            for bx in range(bx0, bx1 + 1):
+                for cell in self._buckets.get((by, bx), ()):
+                    if abs(cell[0] - y) <= radius and \
+                            abs(cell[1] - x) <= radius:
+                        yield cell, self._cells[cell]
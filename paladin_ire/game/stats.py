@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+# Derived stats
+# Entity.player_stats compiled into a dependency graph so cached
+# stat values are only recomputed when one of their inputs changes
+
+
+class StatGraph(object):
+
+    """ Stat formulas plus, for every input (attribute, level, class),
+    the set of stats that depend on it """
+
+    def __init__(self, player_stats):
+        self.formulas = {}
+        self.dependents = {'level': set(), 'player_class': set()}
+        for stat, (calc_stat, lvl_based) in player_stats.items():
+            self.formulas[stat] = tuple(calc_stat), lvl_based
+            for attr in calc_stat:
+                self.dependents.setdefault(attr, set()).add(stat)
+            # Level based stats add the level, the others divide by
+            # attr_limit, which grows with the level
+            self.dependents['level'].add(stat)
+            # The class decides which stats are enabled
+            self.dependents['player_class'].add(stat)
+
+    def compute(self, entity, stat):
+        calc_stat, lvl_based = self.formulas[stat]
+        stat_val = sum([getattr(entity, s) for s in calc_stat])
+        if not lvl_based:
+            return int((stat_val / float(entity.attr_limit))*10 + stat_val)
+        else:
+            return entity.level + stat_val
+
+    def affected(self, name):
+        return self.dependents.get(name, ())
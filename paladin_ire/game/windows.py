@@ -0,0 +1,548 @@
+#!/usr/bin/env python3.6
+# -*- coding: utf-8 -*-
+
+# Curses menu and game window superclasses
+# Windows draw into a game.screen.Screen, which sends each frame's
+# changed cells to its backend (curses in the game).  Windows run as
+# coroutines on the screen's game.loop.GameLoop: the outermost one is
+# started with display(), windows opened from it are awaited (run())
+
+import inspect
+import time
+
+from .base_tiles import acs_chars
+from .catalog import EntityCatalog
+from .keymap import KEYMAP, action
+from .loop import loop_for
+from .screen import A_BOLD, A_DIM, A_NORMAL, A_UNDERLINE, KEY_BACKSPACE, \
+    KEY_ENTER, color_pair
+from .session import GameSession
+
+
+class GameWindow(object):
+
+    FRAME_BUDGET = 1. / 30      # seconds, at most one frame per budget
+    keymap = KEYMAP             # copied per window, see bind
+    repeats = ()                # actions a held key repeats count once for
+
+    def __init__(self, stdscreen, app):
+        # stdscreen is a game.screen.Screen
+        self.stdscreen = self.screen = stdscreen
+        self.window = stdscreen.window()
+        self.keymap = dict(self.keymap)
+        self.game_loop = loop_for(stdscreen)
+        self.set_styles()
+        self._panel_init()
+        self.maxy, self.maxx = self.window.getmaxyx()
+        self.app = app
+        self.dbg_msg_list = []
+        self.current_msg = ''
+        self.over = None
+        self.last_keystroke = None
+        self.start_pos = 0
+        self.draw_calls = 0     # curses calls made drawing the last frame
+        self.layers = []        # side window panels, above self.panel
+        self.panels = []        # see _panels
+        self._painted = {}      # panel name -> state when last painted
+        self._lines = {}        # panel name -> (player version, lines)
+        self._last_frame = 0.
+        self._init_windows()
+
+    def _panel_init(self):
+        self.panel = self.screen.new_panel(self.window)
+        self.panel.hide()
+
+    def show(self):
+        # Raise the window, then its side windows above it
+        for win_panel in [self.panel] + self.layers:
+            win_panel.top()
+            win_panel.show()
+
+    def hide(self):
+        for win_panel in [self.panel] + self.layers:
+            win_panel.hide()
+
+    def _init_windows(self):
+        self.char_win, self.char_panel = self.side_panel(6, 29,
+                                                         self.maxy - 8, 2)
+        self.moves_win, self.moves_panel = self.side_panel(6, 45,
+                                                           self.maxy - 8, 31)
+        self.tile_win, self.tile_panel = self.side_panel(10, 25,
+                                                         2, self.maxx - 27)
+
+    def _panels(self):
+        # (name, state, paint) in paint order.  A panel is repainted when
+        # state() differs from its value after the last paint, panels
+        # without a state are painted once (until invalidated)
+        return [
+            ('char', self._char_state, self.draw_charinfo),
+            ('moves', None, self.draw_moves),
+            ('tile', None, self.draw_tileinfo),
+            ('menu', None, self.menu_bar),
+            ('msg', lambda: self.current_msg, self.msg_bar),
+            ('debug', self._debug_state, self.debug_info),
+            # Last, the bars above clear to the end of their line and
+            # invalidate it
+            ('border', None, self.window.box),
+        ]
+
+    def invalidate(self, *names):
+        """ Repaint the named panels (all of them when none are given) in
+        the next frame """
+        if not names:
+            self._painted.clear()
+        for name in names:
+            self._painted.pop(name, None)
+
+    def render_frame(self):
+        """ Repaint the panels whose state changed and push the frame to
+        the screen backend.  Returns True if any panel was repainted """
+        painted = False
+        for name, state, paint in self.panels:
+            if name in self._painted and \
+                    self._painted[name] == (state and state()):
+                continue
+            paint()
+            self._painted[name] = state and state()
+            painted = True
+        # Presented either way, input handlers may have drawn directly.
+        # Only cells that differ from the last frame are sent
+        self.screen.present()
+        self._last_frame = time.perf_counter()
+        self.game_loop.frame_drawn()
+        return painted
+
+    def bind(self, name, *keys):
+        """ Bind <keys> to action <name> in this window only """
+        for key in keys:
+            self.keymap[key] = name
+
+    async def process_input(self):
+        """ Wait for keys (timers and background tasks run meanwhile),
+        then handle every key that arrived, so a burst of input costs
+        one frame.  Repeats of the actions in self.repeats count once
+        per frame.  Returns False when a key closed the window, the
+        keys after it are left on the screen for the window below.
+        Wakes with no keys when a frame was requested
+        (GameLoop.request_frame), at most once per frame budget """
+        keys = await self.game_loop.keys(self._last_frame + self.FRAME_BUDGET)
+        # Keys are taken back one at a time: a window opened by a
+        # handler reads the ones after its key
+        self.screen.ungetch(*keys)
+        last = None
+        while self.screen.pushback:
+            key = self.screen.getch()
+            name = action(self.keymap, key)
+            if name in self.repeats and name == last:
+                continue
+            last = name
+            result = self.process_selection(key)
+            if inspect.isawaitable(result):
+                # Handlers that open another window await it
+                result = await result
+            if not result:
+                return False
+        return True
+
+    def _debug_state(self):
+        # The cursor line is left out, it moves with every draw
+        if not (self.app.args.debug or self.app.args.verbose):
+            return None
+        return (getattr(self, 'position', None), self.over, self.maxy,
+                self.maxx, self.last_keystroke, self.draw_calls)
+
+    def _char_state(self):
+        return self._player_version()
+
+    def _player_version(self):
+        # The player may be replaced, not just changed.  Hitpoints and
+        # magic are not versioned (see Entity)
+        player = self.app.player
+        return player, player.version, player.hitpoints, player.magic
+
+    def _cached_lines(self, name, build):
+        # Formatted lines of panel <name>, built again only when the
+        # player has changed since
+        version = self._player_version()
+        cached = self._lines.get(name)
+        if cached is None or cached[0] != version:
+            cached = self._lines[name] = version, build()
+        return cached[1]
+
+    def draw_tileinfo(self):
+        self.tile_win.box()
+
+    def draw_moves(self):
+
+        def draw_arrows():
+            self.moves_win.addstr(1, 2, 'Moves', A_UNDERLINE)
+            for ch in upch, dnch, lch, rch:
+                self.moves_win.addch(*ch)
+
+        for i in range(1,5):
+            self.moves_win.move(i,2)
+            self.moves_win.clrtoeol()
+
+        default_mode = A_DIM
+        upch = 2, 4, acs_chars['uarrow'][1], default_mode
+        dnch = 4, 4, acs_chars['darrow'][1], default_mode
+        lch = 3, 3, acs_chars['larrow'][1], default_mode
+        rch = 3, 5, acs_chars['rarrow'][1], default_mode
+        draw_arrows()
+
+        self.moves_win.box()
+
+    def _charinfo_lines(self):
+        player = self.app.player
+        cls = player.player_class
+        cls_str = 'None' if cls is None else cls.__class__.__name__
+        hp_str = '*' * int(((player.hp_percent * 100) + 9) // 10)
+        mp_str = '*' * int(((player.mp_percent * 100) + 9) // 10)
+        return [
+            'Player :  {:>15}'.format(player.name),
+            'Class  :  {:>15}'.format(cls_str),
+            'HP     :  ({:>2}) {:->10}'.format(player.hitpoints, hp_str),
+            'MP     :  ({:>2}) {:->10}'.format(player.magic, mp_str),
+        ]
+
+    def draw_charinfo(self):
+        # Lines are padded to the inside of the box, so neither the
+        # rows nor the border need clearing first
+        win = self.char_win
+        width = win.getmaxyx()[1] - 3
+        lines = self._cached_lines('char', self._charinfo_lines)
+        for i, line in enumerate(lines, 1):
+            win.addstr(i, 2, line.ljust(width))
+
+    async def execute(self):
+        self.panels = self._panels()
+        self.invalidate()
+        while True:
+            self.render_frame()
+            if not await self.main_loop():
+                break
+
+    async def main_loop(self):
+        input('continue')
+        return False
+
+    async def msg_bar_prompt(self, prompt, default=None):
+        # displays the prompt in the message bar and
+        # awaits user input, 15 characters max. A
+        # default value should be specified and in
+        # the prompt via format spec
+        self.msg_bar(prompt.format(default))
+        msg_len = len(self.current_msg)
+        entry = await self.capture(self.maxy - 2, msg_len + 1, 15)
+        if not entry:
+            entry = default
+        return entry
+
+    async def read_key(self, redraw=None):
+        """ Next key for a prompt, the rest of the batch being handled
+        first, then keys from the game loop: timers and background
+        tasks keep running while the player types.  Frames requested
+        meanwhile are drawn, followed by redraw() to put the prompt's
+        own drawing back """
+        while not self.screen.pushback:
+            self.screen.present()
+            keys = await self.game_loop.keys(self._last_frame +
+                                             self.FRAME_BUDGET)
+            if keys:
+                self.screen.ungetch(*keys)
+                continue
+            self.render_frame()
+            if redraw is not None:
+                redraw()
+        return self.screen.getch()
+
+    async def run(self):
+        """ Show the window until it closes, returns its last message """
+        self._pre_loop()
+        await self.execute()
+        self._post_loop()
+        return self.current_msg
+
+    def display(self):
+        """ Run the game loop with this window outermost.  Windows opened
+        while it runs are awaited instead (await window.run()) """
+        return self.game_loop.run(self.run())
+
+    def clear_win(self, win):
+        win.erase()
+        win.box()
+
+    def side_panel(self, h, l, y, x):
+        win = self.screen.window(h, l, y, x)
+        win.box()
+        panel = self.screen.new_panel(win)
+        self.layers.append(panel)
+        return win, panel
+
+    def set_styles(self):
+        self.info_msg = color_pair(1)
+        self.err_msg = color_pair(2)
+        self.hlt_msg = color_pair(3)
+        self.margin = 3
+
+    def menu_bar(self, val_list=('S: Save', 'Q: Quit')):
+        if val_list:
+            menu = ' | '.join(val_list)
+            self._pre_draw(1, 2)
+            self.window.addstr(1, 2, menu, color_pair(3))
+
+    def msg_bar(self, msg=None):
+        if msg is not None: self.current_msg = msg
+        if self.current_msg is None: self.current_msg = ''
+        yval, xval = self.window.getmaxyx()
+        col = self.hlt_msg
+        self.window.addstr(
+            yval - 2,
+            2,
+            self.current_msg.ljust(xval - 2),
+            col
+        )
+        # Also called directly, the next frame repaints the current
+        # message if it changes back to the one painted last
+        self.invalidate('msg', 'border')
+
+    def _pre_draw(self, yv, xv):
+        win = self.window
+        win.move(yv, xv)
+        win.clrtoeol()
+        self.invalidate('border')
+
+    async def capture(self, y, x, length):
+        # Capture user input for <length> chars at (y,x), as
+        # ScreenWindow.getstr does but without blocking the game loop
+        win = self.window
+        chars = []
+        # A frame repaints the message bar over the entry
+        redraw = lambda: win.addstr(y, x, ''.join(chars))
+        while True:
+            win.move(y, x + len(chars))
+            key = await self.read_key(redraw)
+            if key in (ord('\n'), ord('\r'), KEY_ENTER):
+                break
+            elif key in (KEY_BACKSPACE, ord('\b'), 127):
+                if chars:
+                    chars.pop()
+                    win.addch(y, x + len(chars), ' ')
+            elif 32 <= key < 0x110000 and chr(key).isprintable() and \
+                    len(chars) < length:
+                win.addch(y, x + len(chars), chr(key))
+                chars.append(chr(key))
+        win.move(0, 0)
+        return ''.join(chars)
+
+    def debug_info(self):
+
+        if self.app.args.debug or self.app.args.verbose:
+            yval, xval = self.window.getyx()
+            y = self.maxy - 6
+            x = self.maxx - 17
+
+            col = self.info_msg
+            self.msg_list = [
+                'pos:{}'.format(self.position),
+                'over:{}'.format(self.over),
+                'maxy:{}'.format(self.maxy),
+                'maxx:{}'.format(self.maxx),
+                'cursor:{},{}'.format(yval, xval),
+                'key:{}'.format(self.last_keystroke),
+                'calls:{}'.format(self.draw_calls)
+            ]
+
+            for i, val in enumerate(self.msg_list):
+                self._pre_draw(y - i, x)
+                self.window.addstr(y - i, x, val, col)
+
+    def _parse_keystroke(self, key):
+        return action(self.keymap, key)
+
+
+class Camera(object):
+
+    """ Visible slice of a map, scrolls to keep a target in view """
+
+    def __init__(self, view, bounds, margin=5):
+        self.height, self.width = view
+        self.bounds = bounds
+        self.margin = margin    # cells kept between the target and an edge
+        self.top = 0
+        self.left = 0
+
+    @property
+    def origin(self):
+        return self.top, self.left
+
+    def _scroll(self, start, pos, size, limit):
+        margin = min(self.margin, (size - 1) // 2)
+        if pos < start + margin:
+            start = pos - margin
+        elif pos > start + size - 1 - margin:
+            start = pos - size + 1 + margin
+        return max(0, min(start, limit - size))
+
+    def follow(self, pos):
+        # Returns True if the view scrolled
+        top = self._scroll(self.top, pos[0], self.height, self.bounds[0])
+        left = self._scroll(self.left, pos[1], self.width, self.bounds[1])
+        moved = (top, left) != (self.top, self.left)
+        self.top, self.left = top, left
+        return moved
+
+    def visible(self, pos):
+        y, x = pos
+        return self.top <= y < self.top + self.height and \
+               self.left <= x < self.left + self.width
+
+    def cells(self):
+        # Map positions in view, row by row
+        for y in range(self.top, min(self.top + self.height, self.bounds[0])):
+            for x in range(self.left,
+                           min(self.left + self.width, self.bounds[1])):
+                yield y, x
+
+    def to_screen(self, pos):
+        # Window coordinates, offset by one for the border
+        return pos[0] - self.top + 1, pos[1] - self.left + 1
+
+
+class MapWindow(GameWindow):
+
+    # Held arrow keys move once per frame, never behind the display
+    repeats = ('up', 'down', 'left', 'right')
+
+    def __init__(self, stdscreen, app, seed=None):
+        super().__init__(stdscreen, app)
+        bounds = self.map_win_bounds()
+        # Levels may be any size, the camera shows the part that fits
+        # inside the window border
+        view = bounds[0] - 2, bounds[1] - 2
+        map_size = getattr(self.app.args, 'map_size', None) or view
+        # The next level is generated in the background while this one
+        # is played, monsters come from the templates saved in the menus
+        self.session = GameSession(self.app.player, map_size, seed=seed,
+                                   prefetch=True, catalog=EntityCatalog())
+        self.map_win, self.map_panel = self.side_panel(*bounds)
+        self.camera = Camera(view, self.session.map_gen.bounds)
+        self.drawn_level = None     # level currently on screen
+        self.position = 0
+        self.current_msg = 'Choose an action'
+        # Action -> handler as in Menu, a handler returning False
+        # closes the window.  Enter (doors) and space (picking up
+        # items) have none yet
+        self.handlers = {
+            'up': lambda: self.move('up'),
+            'down': lambda: self.move('down'),
+            'left': lambda: self.move('left'),
+            'right': lambda: self.move('right'),
+            'q': self.quit,
+        }
+
+    def _panels(self):
+        panels = super()._panels()
+        panels.insert(1, ('map', self._map_state, self.draw_map))
+        return panels
+
+    def _map_state(self):
+        # Moves and turns leave cells in the level's dirty set
+        level = self.current_level
+        return level is self.drawn_level, bool(level.dirty)
+
+    def menu_bar(self, val_list=('Q: Main Menu',)):
+        super().menu_bar(val_list)
+
+    @property
+    def current_level(self):
+        return self.session.current_level
+
+    @property
+    def player_pos(self):
+        return self.session.player_pos
+
+    @property
+    def fov(self):
+        return self.session.fov
+
+    def map_win_bounds(self):
+        self.maxy, self.maxx = self.window.getmaxyx()
+        map_minx = 1
+        map_maxx = 75
+        map_miny = 1
+        map_maxy = self.maxy - 8
+        return map_maxy - map_miny, map_maxx - map_minx, 2, 2
+
+    def draw_map(self):
+        # Only cells in the level's dirty set are redrawn, the whole
+        # view is drawn when the level changes or the camera scrolls
+
+        def _clear():
+            wy, wx = self.map_win.getmaxyx()
+            for i in range(1, wy):
+                self.map_win.move(i, 1)
+                self.map_win.clrtoeol()
+            self.draw_calls += 2 * (wy - 1)
+
+        level = self.current_level
+        self.draw_calls = 0
+        scrolled = self.camera.follow(self.player_pos)
+        if level is not self.drawn_level or scrolled:
+            _clear()
+            self.map_win.box()
+            self.draw_calls += 1
+            cells = self.camera.cells()
+            self.drawn_level = level
+        else:
+            cells = [pos for pos in level.dirty if self.camera.visible(pos)]
+        for y, x in cells:
+            self.draw_tile(y, x)
+        level.dirty.clear()
+
+    def draw_tile(self, y, x):
+        # Unseen cells stay blank, seen cells out of view are dimmed
+        # and hide entities
+        visible = self.fov.is_visible((y, x))
+        entities = self.current_level.state.entities_at((y, x))
+        tile = self.current_level.grid[y, x]
+        if not visible and not self.fov.is_visited((y, x)):
+            msg = ' '
+            mode = A_NORMAL
+        elif entities and visible:
+            msg = entities[-1].char
+            mode = A_BOLD
+        elif not tile:
+            msg = ' '
+            mode = A_NORMAL
+        else:
+            msg = tile.char
+            mode = tile.mode if visible else tile.mode | A_DIM
+        self.map_win.addch(*self.camera.to_screen((y, x)), msg, mode)
+        self.draw_calls += 1
+
+    async def main_loop(self):
+        return await self.process_input()
+
+    def process_selection(self, key):
+        self.last_keystroke = self._parse_keystroke(key)
+        handler = self.handlers.get(self.last_keystroke)
+        return handler is None or handler() is not False
+
+    def move(self, direction):
+        # A blocked move does not use the turn
+        self.session.act(direction)
+
+    def quit(self):
+        # Back to the menu
+        return False
+
+    def draw_entities(self):
+        pass
+
+    def _pre_loop(self):
+        self.show()
+
+    def _post_loop(self):
+        self.hide()
+        self.session.close()
\ No newline at end of file
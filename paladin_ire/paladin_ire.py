@@ -1,14 +1,13 @@
 #!/usr/bin/env python3.6
 
 import argparse
-import curses
 import signal
 import sys
 import termios
 import tty
 
 from game.player import Player
-from scripts.player_creation import MainMenu
+from scripts.headless import simulate
 
 this = sys.modules[__name__]
 
@@ -41,6 +40,20 @@ def parse_args():
                         help='Console dimensions, defaults to 140x40, min 130x30')
     parser.add_argument('--difficulty', type=int, default=1,
                         help='Game difficulty (default=1:Easy)')
+    parser.add_argument('--map-size', nargs=2, type=int, default=None,
+                        help='Level height and width, defaults to the map window')
+    parser.add_argument('--headless', action='store_true',
+                        help='Simulate games without a terminal (no curses)')
+    parser.add_argument('--games', type=int, default=1,
+                        help='Headless games to play (default=1)')
+    parser.add_argument('--turns', type=int, default=500,
+                        help='Player actions per headless game (default=500)')
+    parser.add_argument('--script', default=None,
+                        help='File of actions to play instead of the random bot')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the first headless game (default=0)')
+    parser.add_argument('--output', default=None,
+                        help='Write per-game headless results to this CSV file')
     return _test_args(parser.parse_args())
 
 
@@ -87,6 +100,8 @@ class GameApp(object):
         self.args = parse_args()
 
     def __curses_init(self):
+        import curses
+        from game.screen import COLOR_PAIRS
 
         def resize_terminal():
             x, y = self.args.dimensions[0], self.args.dimensions[1]
@@ -103,11 +118,8 @@ class GameApp(object):
         def color_init():
             curses.start_color()
             curses.use_default_colors()
-            curses.init_pair(1, curses.COLOR_CYAN, curses.COLOR_BLACK)
-            curses.init_pair(2, curses.COLOR_RED, curses.COLOR_BLACK)
-            curses.init_pair(3, curses.COLOR_GREEN, curses.COLOR_BLUE)
-            curses.init_pair(4, curses.COLOR_WHITE, curses.COLOR_BLUE)
-            curses.init_pair(5, curses.COLOR_BLACK, curses.COLOR_RED)
+            for pair, (fg, bg) in COLOR_PAIRS.items():
+                curses.init_pair(pair, fg, bg)
 
         color_init()
         curses.curs_set(0)
@@ -120,7 +132,18 @@ class GameApp(object):
         target(stdscreen, player, self)
 
     def execute(self):
+        if self.args.headless:
+            # Each simulated game builds its own player
+            simulate(self.args)
+            # Returned rather than sys.exit(0), which the SystemExit
+            # handler below turns into exit status 1 with -v
+            return
+
         self.player = Player()
+
+        # Imported here so headless runs never load curses
+        import curses
+        from scripts.player_creation import MainMenu
         if self.args.create:
             curses.wrapper(self.__window_launcher, MainMenu, self.player)
             sys.exit(0)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3.6
+# -*- coding: utf-8 -*-
+
+#   Combat balance
+#   Monte Carlo duels between entities built from the CLASSES
+#   templates, spread over a process pool.  Run from the paladin_ire
+#   directory:
+#       python -m scripts.balance --levels 1 3 5 --fights 100000
+#
+#   There are no combat rules in the game yet, a duel here is:
+#       attacker atk_roll against the defender's evade
+#       CRIT/ADV hit for 1..max_damage (doubled on a CRIT)
+#       defender resist_roll('defense') takes off up to half of it
+#   until one side is out of hitpoints or max_rounds attacks are made
+
+import argparse
+import csv
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from game.classes import CLASSES
+from game.core import Entity, RandomRoll
+from game.dice import Dice
+
+MAX_DAMAGE = 256    # damage histogram size, larger hits share the last bin
+COUNTS = ('fights', 'wins', 'draws', 'attacks', 'hits', 'crits', 'zeros',
+          'misses')
+
+
+class Fighter(object):
+
+    """ An entity with its roller and the stats a duel reads """
+
+    def __init__(self, entity, ubound, dice):
+        self.entity = entity
+        self.roller = RandomRoll(entity, ubound, dice=dice)
+        self.evade = entity.get_stat('evade')
+        self.max_damage = entity.get_stat('max_damage')
+
+
+def _tally():
+    tally = dict.fromkeys(COUNTS, 0)
+    tally['damage'] = np.zeros(MAX_DAMAGE, dtype=np.int64)
+    return tally
+
+
+def duel(a, b, tallies, dice, max_rounds):
+    """ One duel between Fighters a and b, tallies are theirs in the
+    same order """
+    a.entity.heal()
+    b.entity.heal()
+    sides = [(a, b, tallies[0]), (b, a, tallies[1])]
+    turn = dice.randint(0, 2)   # who swings first
+    for _ in range(max_rounds):
+        attacker, defender, tally = sides[turn]
+        tally['attacks'] += 1
+        result = attacker.roller.atk_roll(defender.evade)
+        if result >= RandomRoll.ADV:
+            damage = dice.randint(1, attacker.max_damage + 1)
+            if result == RandomRoll.CRIT:
+                damage *= 2
+                tally['crits'] += 1
+            mitigation = min(defender.roller.resist_roll('defense'), 1.)
+            damage = max(1, int(damage * (1. - mitigation / 2.)))
+            tally['hits'] += 1
+            tally['damage'][min(damage, MAX_DAMAGE - 1)] += 1
+            defender.entity.hitpoints -= damage
+            if defender.entity.hitpoints <= 0:
+                tally['wins'] += 1
+                break
+        elif result == RandomRoll.ZERO:
+            tally['zeros'] += 1
+        else:
+            tally['misses'] += 1
+        turn = 1 - turn
+    else:
+        tallies[0]['draws'] += 1
+        tallies[1]['draws'] += 1
+    tallies[0]['fights'] += 1
+    tallies[1]['fights'] += 1
+
+
+def run_matchup(task):
+    """ Worker: task is (seed, level, class index a, class index b,
+    fights, roster, ubound, max_rounds).  Each side is a roster of
+    entities rolled from its class template, fighters rotate through
+    them.  Returns (level, a, b, tally a, tally b) """
+    seed, level, a, b, fights, roster, ubound, max_rounds = task
+    dice = Dice(seed)
+    teams = []
+    for side, index in enumerate((a, b)):
+        entities = Entity.spawn(roster, CLASSES[index](), level,
+                                dice=dice.stream('roster', side))
+        teams.append([Fighter(entity, ubound, dice.stream('rolls', side, i))
+                      for i, entity in enumerate(entities)])
+    tallies = _tally(), _tally()
+    fight_dice = dice.stream('fights')
+    for n in range(fights):
+        duel(teams[0][n % roster], teams[1][n % roster], tallies,
+             fight_dice, max_rounds)
+    return level, a, b, tallies[0], tallies[1]
+
+
+def _tasks(args):
+    # One task per matchup and chunk, seeded by position so results
+    # do not depend on the number of workers
+    pairs = list(itertools.combinations_with_replacement(
+        range(len(CLASSES)), 2))
+    matchups = [(level, a, b) for level in args.levels for a, b in pairs]
+    tasks = []
+    for level, a, b in matchups:
+        remaining = args.fights
+        while remaining > 0:
+            fights = min(args.chunk, remaining)
+            tasks.append([[args.seed, len(tasks)], level, a, b, fights,
+                          args.roster, args.ubound, args.max_rounds])
+            remaining -= fights
+    return tasks
+
+
+def _summary(level, cls, tally):
+    damage = tally['damage']
+    hits = int(damage.sum())
+    values = np.arange(MAX_DAMAGE)
+    mean = float((damage * values).sum() / hits) if hits else 0.
+    cumulative = np.cumsum(damage)
+
+    def _percentile(p):
+        if not hits:
+            return 0
+        return int(np.searchsorted(cumulative, p * hits))
+
+    row = {'level': level, 'class': cls.__name__}
+    row.update((name, tally[name]) for name in COUNTS)
+    row.update({
+        'win_rate': round(tally['wins'] / float(tally['fights']), 4),
+        'hit_rate': round(tally['hits'] / float(tally['attacks']), 4),
+        'crit_rate': round(tally['crits'] / float(tally['attacks']), 4),
+        'damage_mean': round(mean, 3),
+        'damage_p50': _percentile(.5),
+        'damage_p90': _percentile(.9),
+        'damage_max': int(np.flatnonzero(damage)[-1]) if hits else 0,
+    })
+    return row
+
+
+def run(args):
+    """ Runs every class pairing at every level, returns one summary
+    row per class and level plus its damage histogram """
+    tasks = _tasks(args)
+    totals = {}
+
+    def _merge(level, index, tally):
+        total = totals.setdefault((level, index), _tally())
+        for name in COUNTS:
+            total[name] += tally[name]
+        total['damage'] += tally['damage']
+
+    with ProcessPoolExecutor(args.workers) as pool:
+        for level, a, b, tally_a, tally_b in pool.map(run_matchup, tasks):
+            _merge(level, a, tally_a)
+            _merge(level, b, tally_b)
+
+    rows, histograms = [], []
+    for (level, index), tally in sorted(totals.items()):
+        rows.append(_summary(level, CLASSES[index], tally))
+        damage = tally['damage']
+        histograms.append({str(v): int(damage[v])
+                           for v in np.flatnonzero(damage)})
+    return rows, histograms
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--levels', nargs='+', type=int, default=[1],
+                        help='Entity levels to test (default 1)')
+    parser.add_argument('--fights', type=int, default=10000,
+                        help='Duels per class pairing and level')
+    parser.add_argument('--roster', type=int, default=4,
+                        help='Entities rolled per class for each task')
+    parser.add_argument('--ubound', type=int, default=7,
+                        help='RandomRoll upper bound for attack rolls')
+    parser.add_argument('--max-rounds', type=int, default=200,
+                        help='Attacks before a duel is a draw')
+    parser.add_argument('--chunk', type=int, default=5000,
+                        help='Duels per worker task')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default one per CPU)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Base seed, task n uses [seed, n]')
+    parser.add_argument('--csv', default=None,
+                        help='Write the summary rows to this CSV file')
+    parser.add_argument('--json', default=None,
+                        help='Write summary rows and damage histograms '
+                             'to this JSON file')
+    args = parser.parse_args()
+    # Caught here rather than as a traceback from every worker
+    for level in args.levels:
+        try:
+            Entity.stat_blocks.check_level(level)
+        except ValueError as e:
+            parser.error('--levels: {}'.format(e))
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    start = time.perf_counter()
+    rows, histograms = run(args)
+    elapsed = time.perf_counter() - start
+
+    fields = list(rows[0])
+    if args.csv:
+        with open(args.csv, 'w', newline='') as outf:
+            writer = csv.DictWriter(outf, fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    if args.json:
+        for row, histogram in zip(rows, histograms):
+            row['damage'] = histogram
+        with open(args.json, 'w') as outf:
+            json.dump({'args': vars(args), 'results': rows}, outf, indent=2)
+
+    print(' '.join('{:>10}'.format(f[:10]) for f in fields))
+    for row in rows:
+        print(' '.join('{:>10}'.format(row[f]) for f in fields))
+    attacks = sum(row['attacks'] for row in rows)
+    print('[*] {} attacks in {:.2f}s'.format(attacks, elapsed))
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3.6
+# -*- coding: utf-8 -*-
+
+#   Benchmarks
+#   Run from the paladin_ire directory:
+#       python -m scripts.benchmarks grid --sizes 100 1000
+
+import argparse
+import asyncio
+import bisect
+import gc
+import itertools
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from game import dice
+from game.base_tiles import Wall
+from game.core import Entity
+from game.entity_store import EntityStore
+from game.screen import (AnsiBackend, NullBackend, Screen, KEY_DOWN, KEY_LEFT,
+                         KEY_RIGHT, KEY_UP)
+from game.windows import MapWindow
+from .dungeon_generator import DungeonGenerator
+from .headless import new_player
+from .world_generation import Map, MapTile
+
+
+def _measure(build, scan=None):
+    # Returns (bytes allocated, build seconds, scan seconds) for the
+    # object returned by build(), scan(obj) is timed separately
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    obj = build()
+    build_time = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    scan_time = 0.
+    if scan is not None:
+        start = time.perf_counter()
+        scan(obj)
+        scan_time = time.perf_counter() - start
+    del obj
+    gc.collect()
+    return size, build_time, scan_time
+
+
+def _report(rows, header):
+    print(' '.join('{:>14}'.format(h) for h in header))
+    for row in rows:
+        print(' '.join('{:>14}'.format(v) for v in row))
+
+
+def bench_grid(args):
+    """ Dict grid vs compact TileGrid, memory and full-scan time """
+
+    def _scan(grid, dim):
+        # Same access pattern as MapWindow.draw_map
+        for y in range(dim):
+            for x in range(dim):
+                grid[y, x]
+
+    rows = []
+    per_cell = None
+    for dim in args.sizes:
+        cells = dim * dim
+        for mode, compact in ('dict', False), ('compact', True):
+            if not compact and cells > args.dict_limit:
+                # The dict grid at this size will not fit in memory on
+                # most machines, extrapolate from the last measured size
+                if per_cell is None:
+                    continue
+                rows.append((dim, mode + '(est)',
+                             int(per_cell[0] * cells),
+                             '{:.3f}'.format(per_cell[1] * cells), '-'))
+                continue
+            size, build_time, scan_time = _measure(
+                lambda: Map((dim, dim), compact),
+                lambda m: _scan(m.grid, dim) if args.scan else None
+            )
+            if not compact:
+                per_cell = size / cells, build_time / cells
+            rows.append((dim, mode, size, '{:.3f}'.format(build_time),
+                         '{:.3f}'.format(scan_time) if args.scan else '-'))
+
+    _report(rows, ('size', 'grid', 'bytes', 'build(s)', 'scan(s)'))
+
+
+def bench_generate(args):
+    """ Seeded level generation time per style, target < 1s at 1000 """
+    gen = DungeonGenerator(args.seed)
+    rows = []
+    for dim in args.sizes:
+        for style in DungeonGenerator.STYLES:
+            start = time.perf_counter()
+            ids = gen.generate((dim, dim), 0, style)
+            elapsed = time.perf_counter() - start
+            same = bool((ids == gen.generate((dim, dim), 0, style)).all())
+            rows.append((dim, style, '{:.3f}'.format(elapsed),
+                         '{:.2f}'.format((ids == gen.floor).mean()), str(same)))
+
+    _report(rows, ('size', 'style', 'time(s)', 'open', 'repeatable'))
+
+
+class _DictMapTile(object):
+    # MapTile before __slots__
+    def __init__(self, pos):
+        self.items = {}
+        self.items['character'] = ' '
+        self.items['mode'] = 0
+
+
+class _DictTile(object):
+    # BaseTile before the flyweight registry and __slots__
+    def __init__(self):
+        self.char = ' '
+        self.passable = False
+        self.visited = False
+        self.items = []
+        self.entities = []
+        self.color = None
+        self.a_mode = 0
+
+
+class _DictEntity(object):
+    # Entity before __slots__, every stat in the instance dict
+    def __init__(self):
+        for names, default in Entity.attributes, Entity.resists, \
+                Entity.status_effects:
+            for name in names:
+                setattr(self, name, default)
+        self.level = 1
+        self.player_class = None
+        self.init_complete = False
+        self.damage = 0
+        self.name = ''
+        self.max_hp = 1
+        self.max_mp = 1
+        self.hitpoints = 0
+        self.magic = 0
+
+
+def bench_objects(args):
+    """ Bytes per object for tiles and entities, dict vs compact layouts """
+
+    def _stored_entities(n):
+        store = EntityStore(capacity=n)
+        return store, [store.new() for _ in range(n)]
+
+    cases = [
+        ('MapTile', 'dict', args.tiles, lambda n: [_DictMapTile(0)
+                                                  for _ in range(n)]),
+        ('MapTile', 'slots', args.tiles, lambda n: [MapTile(0)
+                                                   for _ in range(n)]),
+        ('BaseTile', 'dict', args.tiles, lambda n: [_DictTile()
+                                                   for _ in range(n)]),
+        ('BaseTile', 'slots', args.tiles, lambda n: [Wall()
+                                                    for _ in range(n)]),
+        ('BaseTile', 'grid', args.tiles, lambda n: Map((n // 1000, 1000),
+                                                       True)),
+        ('Entity', 'dict', args.entities, lambda n: [_DictEntity()
+                                                    for _ in range(n)]),
+        ('Entity', 'slots', args.entities, lambda n: [Entity()
+                                                     for _ in range(n)]),
+        ('Entity', 'store', args.entities, _stored_entities),
+    ]
+    rows = []
+    for name, layout, count, build in cases:
+        size, build_time, _ = _measure(lambda: build(count))
+        rows.append((name, layout, count, '{:.1f}'.format(size / count),
+                     '{:.3f}'.format(build_time)))
+
+    _report(rows, ('object', 'layout', 'count', 'bytes/obj', 'build(s)'))
+
+
+def bench_screen(args):
+    """ Cells changed and bytes written per frame by the map window,
+    diffed against the last frame vs every cell resent """
+    keys = KEY_UP, KEY_DOWN, KEY_LEFT, KEY_RIGHT
+    rows = []
+    for backend in 'ansi', 'null':
+        for mode in 'diff', 'full':
+            dice.seed(args.seed)
+            out = open(os.devnull, 'wb')
+            screen = Screen(args.screen[0], args.screen[1],
+                            AnsiBackend(out) if backend == 'ansi'
+                            else NullBackend())
+            app = SimpleNamespace(
+                player=new_player(dice.stream('player')),
+                args=argparse.Namespace(debug=False, verbose=0,
+                                        map_size=None))
+            window = MapWindow(screen, app, seed=args.seed)
+            window._pre_loop()
+            window.panels = window._panels()
+            window.render_frame()
+            first = screen.bytes_written, screen.cells_changed
+
+            rng = dice.stream('keys')
+            cells = bytes_written = 0
+            start = time.perf_counter()
+            for _ in range(args.frames):
+                window.process_selection(rng.choice(keys))
+                if mode == 'full':
+                    screen.invalidate()
+                window.render_frame()
+                cells += screen.cells_changed
+                bytes_written += screen.bytes_written
+            elapsed = time.perf_counter() - start
+            window.session.close()
+            out.close()
+            rows.append((backend, mode, first[1], first[0],
+                         '{:.1f}'.format(cells / args.frames),
+                         '{:.1f}'.format(bytes_written / args.frames),
+                         '{:.3f}'.format(elapsed * 1000 / args.frames)))
+
+    _report(rows, ('backend', 'mode', 'first cells', 'first bytes',
+                   'cells/frame', 'bytes/frame', 'ms/frame'))
+
+
+def _typist(fd, keys, interval):
+    # Forks a process writing <keys> random arrow keys to <fd>,
+    # <interval> seconds apart, then q.  The returned future-like
+    # object's result() waits for it and returns the send times
+    # (time.perf_counter is system wide)
+    arrows = b'\x1b[A', b'\x1b[B', b'\x1b[C', b'\x1b[D'
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        rng = dice.stream('keys')
+        times = []
+        for _ in range(keys):
+            time.sleep(interval)
+            times.append(time.perf_counter())
+            os.write(fd, rng.choice(arrows))
+        # Long enough for the last key's frame
+        time.sleep(.5)
+        os.write(fd, b'q')
+        os.write(wfd, ' '.join(map(repr, times)).encode())
+        os._exit(0)
+    os.close(wfd)
+
+    def result():
+        with os.fdopen(rfd, 'rb') as inf:
+            times = inf.read().split()
+        os.waitpid(pid, 0)
+        return [float(t) for t in times]
+    return SimpleNamespace(result=result)
+
+
+def bench_latency(args):
+    """ Key press to presented frame on the game loop, while a
+    background task runs CPU work in slices of --slice-ms, yielding
+    with asyncio.sleep(0) vs GameLoop.cooperate() between slices.  A
+    child process types into a pipe, so keys arrive mid-slice like
+    from a tty """
+    rows = []
+    for slice_ms, mode in itertools.product(args.slice_ms,
+                                            ('sleep', 'cooperate')):
+        dice.seed(args.seed)
+        rfd, wfd = os.pipe()
+        out = open(os.devnull, 'wb')
+        screen = Screen(args.screen[0], args.screen[1],
+                        AnsiBackend(out, rfd))
+        app = SimpleNamespace(
+            player=new_player(dice.stream('player')),
+            args=argparse.Namespace(debug=False, verbose=0, map_size=None))
+        window = MapWindow(screen, app, seed=args.seed)
+
+        presented = []
+        present = screen.present
+
+        def _present():
+            cells = present()
+            presented.append(time.perf_counter())
+            return cells
+        screen.present = _present
+
+        slices = [0]
+
+        async def background():
+            while True:
+                end = time.perf_counter() + slice_ms / 1000.
+                while time.perf_counter() < end:
+                    pass
+                slices[0] += 1
+                if mode == 'sleep':
+                    await asyncio.sleep(0)
+                else:
+                    await window.game_loop.cooperate()
+
+        async def play():
+            window.game_loop.spawn(background())
+            return await window.run()
+
+        sent = _typist(wfd, args.keys, args.key_interval / 1000.)
+        window.game_loop.run(play())
+        os.close(rfd)
+        os.close(wfd)
+        out.close()
+
+        # The first frame presented after a key drew it
+        latencies = sorted(presented[bisect.bisect(presented, t)] - t
+                           for t in sent.result())
+        ms = [t * 1000 for t in latencies]
+        rows.append((slice_ms, mode, len(ms), slices[0],
+                     '{:.2f}'.format(sum(ms) / len(ms)),
+                     '{:.2f}'.format(ms[int(len(ms) * .95)]),
+                     '{:.2f}'.format(ms[-1]),
+                     '{:.2f}'.format(window.FRAME_BUDGET * 1000)))
+
+    _report(rows, ('slice(ms)', 'yield', 'keys', 'slices', 'mean(ms)',
+                   'p95(ms)', 'max(ms)', 'budget(ms)'))
+
+
+BENCHMARKS = {
+    'grid': bench_grid,
+    'generate': bench_generate,
+    'objects': bench_objects,
+    'screen': bench_screen,
+    'latency': bench_latency,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS),
+                        help='Benchmark to run')
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[100, 1000, 4000],
+                        help='Square map sizes to test (default 100 1000 4000)')
+    parser.add_argument('--dict-limit', type=int, default=4000000,
+                        help='Largest dict grid (in cells) actually built')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Generator seed')
+    parser.add_argument('--tiles', type=int, default=1000000,
+                        help='Tiles built by the objects benchmark')
+    parser.add_argument('--entities', type=int, default=100000,
+                        help='Entities built by the objects benchmark')
+    parser.add_argument('--no-scan', dest='scan', action='store_false',
+                        help='Skip the full-grid read pass')
+    parser.add_argument('--frames', type=int, default=500,
+                        help='Frames drawn by the screen benchmark')
+    parser.add_argument('--screen', nargs=2, type=int, default=[40, 140],
+                        help='Screen height and width for the screen '
+                             'benchmark')
+    parser.add_argument('--keys', type=int, default=100,
+                        help='Keys sent by the latency benchmark')
+    parser.add_argument('--key-interval', type=float, default=50,
+                        help='Milliseconds between keys (latency benchmark)')
+    parser.add_argument('--slice-ms', nargs='+', type=float,
+                        default=[0, 5, 20],
+                        help='Background work between awaits, in '
+                             'milliseconds (latency benchmark)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    BENCHMARKS[args.benchmark](args)
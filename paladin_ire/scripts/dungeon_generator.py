@@ -0,0 +1,138 @@
+#!/usr/bin/env python3.6
+# -*- coding: utf-8 -*-
+
+#   Dungeon Generator
+#   Seeded level layouts built as NumPy tile-id planes,
+#   the same seed and level always give the same layout
+
+import numpy as np
+
+from game.base_tiles import get_tile
+
+
+class DungeonGenerator(object):
+
+    """ Seeded level generator, BSP rooms-and-corridors or cellular caves """
+
+    STYLES = ('bsp', 'caves')
+
+    def __init__(self, seed=None, dtype=np.uint8):
+        # A missing seed is drawn once here so every level of this
+        # generator (and any worker given the seed) stays reproducible
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.dtype = dtype
+        self.wall = get_tile('Wall').tile_id
+        self.floor = get_tile('Hallway').tile_id
+
+    def rng(self, level):
+        # Independent stream per level, so levels can be generated in
+        # any order or in another process
+        return np.random.default_rng([self.seed, level])
+
+    def generate(self, bounds, level=0, style='bsp'):
+        if style not in self.STYLES:
+            raise ValueError('Unknown dungeon style: {}'.format(style))
+        return getattr(self, style)(bounds, level)
+
+    def chunk(self, bounds, origin, shape, level=0, style='bsp'):
+        """ Tile ids for the <shape> chunk at <origin> of a <bounds>
+        level.  Each chunk is laid out on its own and opened at the
+        middle of every side it shares with a neighbour, so chunks
+        generated in any order join up """
+        if style not in self.STYLES:
+            raise ValueError('Unknown dungeon style: {}'.format(style))
+        (y0, x0), (h, w) = origin, shape
+        rng = np.random.default_rng([self.seed, level, y0, x0])
+        ids = getattr(self, style)(shape, level, rng=rng)
+        floor = np.argwhere(ids == self.floor)
+        if len(floor):
+            # The floor cell nearest the middle joins the exits
+            near = np.abs(floor - (h // 2, w // 2)).sum(axis=1).argmin()
+            center = tuple(floor[near].tolist())
+        else:
+            center = h // 2, w // 2
+        exits = []
+        if y0 > 0:
+            exits.append((0, w // 2))
+        if y0 + h < bounds[0]:
+            exits.append((h - 1, w // 2))
+        if x0 > 0:
+            exits.append((h // 2, 0))
+        if x0 + w < bounds[1]:
+            exits.append((h // 2, w - 1))
+        for door in exits:
+            self._corridor(ids, center, door)
+        return ids
+
+    def caves(self, bounds, level=0, fill=.45, steps=5, birth=5, survive=4,
+              rng=None):
+        """ Cellular-automata caves, each step is a whole-grid update """
+        rng = self.rng(level) if rng is None else rng
+        solid = rng.random(bounds) < fill
+        self._seal(solid)
+        for _ in range(steps):
+            count = self._neighbours(solid)
+            solid = np.where(solid, count >= survive, count >= birth)
+            self._seal(solid)
+        return np.where(solid, self.wall, self.floor).astype(self.dtype)
+
+    def bsp(self, bounds, level=0, min_leaf=8, max_depth=10, rng=None):
+        """ Binary space partition into rooms joined by L-shaped halls """
+        rng = self.rng(level) if rng is None else rng
+        ids = np.full(bounds, self.wall, dtype=self.dtype)
+        self._split(rng, ids, 0, 0, bounds[0], bounds[1], max_depth, min_leaf)
+        return ids
+
+    def _split(self, rng, ids, y, x, h, w, depth, min_leaf):
+        # Returns the center of one room in this partition so the
+        # parent can connect it to its sibling
+        can_h, can_w = h >= 2 * min_leaf, w >= 2 * min_leaf
+        if depth == 0 or not (can_h or can_w):
+            return self._room(rng, ids, y, x, h, w)
+
+        if can_h and (not can_w or h > w or (h == w and rng.random() < .5)):
+            cut = int(rng.integers(min_leaf, h - min_leaf + 1))
+            a = self._split(rng, ids, y, x, cut, w, depth - 1, min_leaf)
+            b = self._split(rng, ids, y + cut, x, h - cut, w, depth - 1,
+                            min_leaf)
+        else:
+            cut = int(rng.integers(min_leaf, w - min_leaf + 1))
+            a = self._split(rng, ids, y, x, h, cut, depth - 1, min_leaf)
+            b = self._split(rng, ids, y, x + cut, h, w - cut, depth - 1,
+                            min_leaf)
+        self._corridor(ids, a, b)
+        return a if rng.random() < .5 else b
+
+    def _room(self, rng, ids, y, x, h, w):
+        # Leave a one tile wall margin inside the leaf
+        if h < 3 or w < 3:
+            return y + h // 2, x + w // 2
+        rh = int(rng.integers(max(1, (h - 2) // 2), h - 1))
+        rw = int(rng.integers(max(1, (w - 2) // 2), w - 1))
+        ry = y + 1 + int(rng.integers(0, h - 1 - rh))
+        rx = x + 1 + int(rng.integers(0, w - 1 - rw))
+        ids[ry:ry + rh, rx:rx + rw] = self.floor
+        return ry + rh // 2, rx + rw // 2
+
+    def _corridor(self, ids, a, b):
+        (y1, x1), (y2, x2) = a, b
+        ids[y1, min(x1, x2):max(x1, x2) + 1] = self.floor
+        ids[min(y1, y2):max(y1, y2) + 1, x2] = self.floor
+
+    @staticmethod
+    def _neighbours(solid):
+        # Count of solid cells among the 8 neighbours, cells outside
+        # the map count as solid
+        pad = np.pad(solid, 1, constant_values=True).view(np.uint8)
+        h, w = solid.shape
+        count = np.zeros(solid.shape, dtype=np.uint8)
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                if dy != 1 or dx != 1:
+                    count += pad[dy:dy + h, dx:dx + w]
+        return count
+
+    @staticmethod
+    def _seal(solid):
+        solid[[0, -1], :] = True
+        solid[:, [0, -1]] = True
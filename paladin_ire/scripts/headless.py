@@ -0,0 +1,124 @@
+#!/usr/bin/env python3.6
+# -*- coding: utf-8 -*-
+
+#   Headless simulation
+#   Plays whole games through GameSession without curses, each
+#   player action comes from a bot or a script of actions:
+#       python paladin_ire.py --headless --games 1000 --turns 500
+
+import csv
+import time
+
+from game import dice
+from game.classes import CLASSES
+from game.core import NAME_LIST
+from game.player import Player
+from game.session import ACTIONS, GameSession
+
+# Headless levels match the default map window
+MAP_SIZE = 30, 72
+FIELDS = ('game', 'seed', 'name', 'class', 'turns', 'blocked', 'explored',
+          'hitpoints')
+
+
+class RandomBot(object):
+
+    """ Picks a random action every turn """
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def __call__(self, session):
+        return self.rng.choice(ACTIONS)
+
+
+class ScriptBot(object):
+
+    """ Plays a fixed list of actions, the game ends when it runs out """
+
+    def __init__(self, actions):
+        self.actions = iter(actions)
+
+    def __call__(self, session):
+        return next(self.actions, None)
+
+
+def read_script(path):
+    # Whitespace separated action names, '#' starts a comment
+    actions = []
+    with open(path) as inf:
+        for line in inf:
+            actions.extend(line.split('#', 1)[0].split())
+    for action in actions:
+        if action not in ACTIONS:
+            raise ValueError('Unknown action in {}: {}'.format(path, action))
+    return actions
+
+
+def new_player(rng):
+    # Random name and class, attributes rolled as the creation menu does
+    player = Player()
+    player.name = rng.choice(NAME_LIST)
+    player.player_class = rng.choice(CLASSES)()
+    player.roll_attributes()
+    player.complete_init()
+    player.initialized = True
+    return player
+
+
+def play_game(seed, make_bot, turns, map_size=MAP_SIZE):
+    """ Play one game of at most <turns> player actions, make_bot() is
+    called once the game's dice are seeded.  Returns a row of FIELDS
+    (without the game number) """
+    dice.seed(seed)
+    player = new_player(dice.stream('player'))
+    bot = make_bot()
+    session = GameSession(player, map_size, seed=seed)
+    blocked = 0
+    for _ in range(turns):
+        action = bot(session)
+        if action is None:
+            break
+        if not session.act(action):
+            blocked += 1
+    session.close()
+    return {
+        'seed': seed,
+        'name': player.name,
+        'class': player.player_class.__class__.__name__,
+        'turns': session.turns,
+        'blocked': blocked,
+        'explored': len(session.current_level.state.visited),
+        'hitpoints': player.hitpoints
+    }
+
+
+def simulate(args):
+    """ Play args.games games, game n uses seed args.seed + n """
+    script = read_script(args.script) if args.script else None
+    map_size = args.map_size or MAP_SIZE
+    if script is not None:
+        make_bot = lambda: ScriptBot(script)
+    else:
+        make_bot = lambda: RandomBot(dice.stream('bot'))
+    rows = []
+    start = time.perf_counter()
+    for game in range(args.games):
+        seed = args.seed + game
+        row = play_game(seed, make_bot, args.turns, map_size)
+        row['game'] = game
+        rows.append(row)
+        if args.verbose > 0:
+            print(' '.join('{}:{}'.format(f, row[f]) for f in FIELDS))
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, 'w', newline='') as outf:
+            writer = csv.DictWriter(outf, FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    print('[*] {} games, {} turns in {:.2f}s ({:.0f} games/min)'.format(
+        args.games, sum(row['turns'] for row in rows), elapsed,
+        args.games * 60. / elapsed if elapsed else 0.))
+    return rows
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3.6
+# -*- coding: utf-8 -*-
+
+#   Level Format
+#   Binary on-disk levels:
+#       header | tile-id plane | visited bitplane | item/entity tables
+#   The tile plane is memory-mapped on load, so reopening a level
+#   is a header read rather than a regeneration
+
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'PIRELVL\x00'
+VERSION = 1
+
+# magic, version, id itemsize, reserved, height, width,
+# plane offset, visited offset, tables offset, tables length
+HEADER = struct.Struct('<8sHBBIIQQQQ')
+ALIGN = 64
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _pack_table(table, encode):
+    return [[y, x, [encode(obj) for obj in objs]]
+            for (y, x), objs in sorted(table.items())]
+
+
+def _unpack_table(rows, decode):
+    return {(y, x): [decode(obj) for obj in objs] for y, x, objs in rows}
+
+
+def write_level(path, ids, visited, items, entities, encode=None):
+    """ Write a level to path.  visited is a set of (y, x), items and
+    entities map (y, x) to lists, encode(obj) must return a JSON
+    serializable value for every item and entity """
+    encode = encode or (lambda obj: obj)
+    ids = np.ascontiguousarray(ids, dtype=ids.dtype.newbyteorder('<'))
+    height, width = ids.shape
+
+    plane = np.zeros(ids.shape, dtype=bool)
+    if visited:
+        ys, xs = zip(*visited)
+        plane[list(ys), list(xs)] = True
+    bits = np.packbits(plane, axis=None)
+
+    tables = json.dumps({
+        'items': _pack_table(items, encode),
+        'entities': _pack_table(entities, encode)
+    }).encode('utf-8')
+
+    plane_off = _align(HEADER.size)
+    visited_off = _align(plane_off + ids.nbytes)
+    tables_off = visited_off + bits.nbytes
+    header = HEADER.pack(MAGIC, VERSION, ids.dtype.itemsize, 0, height,
+                         width, plane_off, visited_off, tables_off,
+                         len(tables))
+
+    # Write beside the target and swap in, so a reader never maps a
+    # half-written file
+    tmp = '{}.tmp'.format(path)
+    with open(tmp, 'wb') as outf:
+        outf.write(header)
+        outf.seek(plane_off)
+        outf.write(ids.tobytes())
+        outf.seek(visited_off)
+        outf.write(bits.tobytes())
+        outf.write(tables)
+    os.replace(tmp, path)
+
+
+def read_header(path):
+    with open(path, 'rb') as inf:
+        fields = HEADER.unpack(inf.read(HEADER.size))
+    if fields[0] != MAGIC:
+        raise ValueError('{} is not a level file'.format(path))
+    if fields[1] != VERSION:
+        raise ValueError('{} has level format version {}, expected {}'
+                         .format(path, fields[1], VERSION))
+    return fields[2:]
+
+
+def read_level(path, decode=None):
+    """ Returns (ids, visited, items, entities) as passed to write_level.
+    ids is a copy-on-write memory map of the tile plane, edits stay in
+    memory until the level is written again """
+    itemsize, _, height, width, plane_off, visited_off, tables_off, \
+        tables_len = read_header(path)
+    dtype = np.dtype('<u{}'.format(itemsize))
+    decode = decode or (lambda obj: obj)
+
+    ids = np.memmap(path, dtype=dtype, mode='c', offset=plane_off,
+                    shape=(height, width))
+
+    with open(path, 'rb') as inf:
+        inf.seek(visited_off)
+        bits = np.frombuffer(inf.read(tables_off - visited_off),
+                             dtype=np.uint8)
+        tables = json.loads(inf.read(tables_len).decode('utf-8'))
+
+    # Only unpack the bytes that have a visited bit set
+    nonzero = np.flatnonzero(bits)
+    set_bits = np.unpackbits(bits[nonzero][:, None], axis=1).astype(bool)
+    cells = (nonzero[:, None] * 8 + np.arange(8))[set_bits]
+    ys, xs = np.divmod(cells, width)
+    visited = set(zip(ys.tolist(), xs.tolist()))
+    return (ids, visited, _unpack_table(tables['items'], decode),
+            _unpack_table(tables['entities'], decode))
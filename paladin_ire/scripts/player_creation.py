@@ -12,7 +12,8 @@ import curses
 
 # package
 from game.menu import Menu, MenuItem, AttributeSelection, ClassSelection, OptionMenu
-from game.core import MapWindow
+from game.screen import CursesBackend, Screen
+from game.windows import MapWindow
 from game.color import color_wrap, Color
 from game.player import Player
 from .world_generation import MapGenerator
@@ -22,7 +23,9 @@ class MainMenu(object):
     def __init__(self, stdscreen, player, parent):
         self.parent = parent
         self.args = parent.args
-        self.screen = stdscreen
+        # Every menu draws into the one Screen, which writes the changed
+        # cells to curses
+        self.screen = Screen(*stdscreen.getmaxyx(), CursesBackend(stdscreen))
         self.player = player
         self.map_generator = None
         self.menu_items=(
@@ -33,36 +36,36 @@ class MainMenu(object):
                 MenuItem('Options', self.opt_menu, 4)
                 )
         self.populate_menu()
+        # Runs the game loop, the hooks below await the windows they open
         self.main_menu.display()
 
     def recreate_player(self):
         self.parent.player = self.player = Player()
         self.main_menu.msg_bar('[*] Player refreshed')
-        self.main_menu.draw_charinfo()
 
-    def go(self):
+    async def go(self):
         game = MapWindow(self.screen, self.parent)
         # game.post_init()
-        return game.display()
+        return await game.run()
 
-    def opt_menu(self):
+    async def opt_menu(self):
         menu = OptionMenu(self.screen, self)
         menu.post_init()
-        return menu.display()
+        return await menu.run()
 
-    def class_select(self):
+    async def class_select(self):
         menu = ClassSelection(self.screen, self)
         menu.post_init()
-        return menu.display()
+        return await menu.run()
 
-    def attr_select(self):
+    async def attr_select(self):
         if self.player.player_class is None:
             self.main_menu.current_msg = 'Select a Class first!'
             self.main_menu.msg_bar()
             return
         menu = AttributeSelection(self.screen, self)
         menu.post_init()
-        return menu.display()
+        return await menu.run()
 
     def populate_menu(self):
         item_list = []
@@ -1,33 +1,489 @@
 #!/usr/bin/env python3.6
 
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from game.base_tiles import TileState, a_modes, tile_types
+from game.catalog import decode_object, encode_object
+from .dungeon_generator import DungeonGenerator
+from .level_format import read_level, write_level
+
+
+class TileGrid(object):
+
+    """ Compact map grid, one tile-type id per cell in a contiguous array """
+
+    def __init__(self, bounds, palette=None, dtype=np.uint8):
+        self.ids = np.zeros(bounds, dtype=dtype)
+        self._palette_init(palette, dtype)
+
+    @classmethod
+    def from_ids(cls, ids, palette=None):
+        # Wrap an existing id array without copying it
+        grid = cls.__new__(cls)
+        grid.ids = ids
+        grid._palette_init(palette, ids.dtype)
+        return grid
+
+    def _palette_init(self, palette, dtype):
+        self.dtype = np.dtype(dtype)
+        # Id 0 is always the empty tile, matching the falsy {} of
+        # the dict grid so draw_map's "if not tile" check still works
+        self.palette = [None] if palette is None else list(palette)
+        self._palette_ids = {id(t): i for i, t in enumerate(self.palette)}
+
+    @property
+    def shape(self):
+        return self.ids.shape
+
+    def tile_id(self, tile):
+        # Return the palette id for a tile, adding it if unseen
+        try:
+            return self._palette_ids[id(tile)]
+        except KeyError:
+            if len(self.palette) > np.iinfo(self.dtype).max:
+                raise ValueError('Tile palette full for {}'.format(
+                    self.dtype))
+            self.palette.append(tile)
+            self._palette_ids[id(tile)] = len(self.palette) - 1
+            return len(self.palette) - 1
+
+    def __getitem__(self, pos):
+        return self.palette[self.ids.item(pos)]
+
+    def __setitem__(self, pos, tile):
+        self.ids[pos] = self.tile_id(tile)
+
+    def __contains__(self, pos):
+        y, x = pos
+        return 0 <= y < self.ids.shape[0] and 0 <= x < self.ids.shape[1]
+
+    def __len__(self):
+        return self.ids.size
+
+
+class ChunkCache(object):
+
+    """ Bounded LRU of map chunks, shared by every level of a MapGenerator.
+    Cold chunks are written to an on-disk store and reloaded on demand """
+
+    def __init__(self, max_chunks=256, path=None):
+        self.max_chunks = max_chunks
+        self._owns_path = path is None
+        self.path = tempfile.mkdtemp(prefix='paladin_ire_') if path is None \
+                    else path
+        os.makedirs(self.path, exist_ok=True)
+        self._chunks = OrderedDict()    # key -> array, oldest first
+        self._dirty = set()             # keys changed since last stored
+        self._stored = set()            # keys with a file in the store
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def _file(self, key):
+        return os.path.join(self.path, '{}_{}_{}.npy'.format(*key))
+
+    def get(self, key, build):
+        # Return the chunk for key, loading it from the store or
+        # calling build() the first time it is touched
+        try:
+            self._chunks.move_to_end(key)
+            return self._chunks[key]
+        except KeyError:
+            pass
+        if key in self._stored:
+            chunk = np.load(self._file(key))
+        else:
+            chunk = build()
+            self._dirty.add(key)
+        self._chunks[key] = chunk
+        self._evict()
+        return chunk
+
+    def mark_dirty(self, key):
+        self._dirty.add(key)
+
+    def _evict(self):
+        while len(self._chunks) > self.max_chunks:
+            key, chunk = self._chunks.popitem(last=False)
+            if key in self._dirty:
+                np.save(self._file(key), chunk)
+                self._stored.add(key)
+                self._dirty.discard(key)
+
+    def close(self):
+        self._chunks.clear()
+        if self._owns_path:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ChunkedGrid(TileGrid):
+
+    """ TileGrid split into fixed-size chunks that are generated the
+    first time they are touched and kept in a shared ChunkCache """
+
+    def __init__(self, bounds, cache, level, palette=None, chunk_size=64,
+                 dtype=np.uint8, fill=None):
+        self.bounds = tuple(bounds)
+        self.cache = cache
+        self.level = level
+        self.chunk_size = chunk_size
+        # fill(y0, x0, shape) returns the tile ids for a new chunk
+        self.fill = fill
+        self._palette_init(palette, dtype)
+
+    @property
+    def shape(self):
+        return self.bounds
+
+    def chunk(self, cy, cx):
+        return self.cache.get((self.level, cy, cx),
+                              lambda: self._build(cy, cx))
+
+    def _build(self, cy, cx):
+        y0, x0 = cy * self.chunk_size, cx * self.chunk_size
+        shape = (min(self.chunk_size, self.bounds[0] - y0),
+                 min(self.chunk_size, self.bounds[1] - x0))
+        if self.fill is None:
+            return np.zeros(shape, dtype=self.dtype)
+        return np.asarray(self.fill(y0, x0, shape), dtype=self.dtype)
+
+    def chunks(self, window=None):
+        """ (map slices, tile ids) for the part of each chunk inside
+        <window>, a pair of slices (the whole map by default).  Only the
+        chunks the window overlaps are touched """
+        ys, xs = window if window is not None else (slice(None),) * 2
+        y_start, y_stop, _ = ys.indices(self.bounds[0])
+        x_start, x_stop, _ = xs.indices(self.bounds[1])
+        if y_stop <= y_start or x_stop <= x_start:
+            return
+        size = self.chunk_size
+        for cy in range(y_start // size, (y_stop - 1) // size + 1):
+            for cx in range(x_start // size, (x_stop - 1) // size + 1):
+                ids = self.chunk(cy, cx)
+                y0, x0 = cy * size, cx * size
+                y1, y2 = max(y_start, y0), min(y_stop, y0 + ids.shape[0])
+                x1, x2 = max(x_start, x0), min(x_stop, x0 + ids.shape[1])
+                yield ((slice(y1, y2), slice(x1, x2)),
+                       ids[y1 - y0:y2 - y0, x1 - x0:x2 - x0])
+
+    def _locate(self, pos):
+        y, x = pos
+        if not (0 <= y < self.bounds[0] and 0 <= x < self.bounds[1]):
+            raise IndexError('{} outside map bounds {}'.format(
+                pos, self.bounds))
+        size = self.chunk_size
+        return y // size, x // size, y % size, x % size
+
+    def __getitem__(self, pos):
+        cy, cx, y, x = self._locate(pos)
+        return self.palette[self.chunk(cy, cx).item(y, x)]
+
+    def __setitem__(self, pos, tile):
+        cy, cx, y, x = self._locate(pos)
+        self.chunk(cy, cx)[y, x] = self.tile_id(tile)
+        self.cache.mark_dirty((self.level, cy, cx))
+
+    def __contains__(self, pos):
+        y, x = pos
+        return 0 <= y < self.bounds[0] and 0 <= x < self.bounds[1]
+
+    def __len__(self):
+        return self.bounds[0] * self.bounds[1]
+
+
 class Map(object):
 
-    def __init__(self, bounds):
-        self.grid = { (y,x):{} for y in range(bounds[0]) for x in range(bounds[1]) }
+    def __init__(self, bounds, compact=False, grid=None):
+        self.bounds = tuple(bounds)
+        # Cells changed since the map was last drawn
+        self.dirty = set()
+        self.state = TileState(self.dirty)
+        # Called with the position of every set_tile change, for views
+        # of the terrain (field of view, pathfinding) to refresh
+        self.listeners = []
+        if grid is not None:
+            self.grid = grid
+        elif compact:
+            # Palette ids match the shared tile registry ids
+            self.grid = TileGrid(bounds, tile_types())
+        else:
+            self.grid = { (y,x):{} for y in range(bounds[0]) for x in range(bounds[1]) }
+
+    def set_tile(self, pos, tile):
+        # Use this rather than grid[pos] = tile for in-game changes
+        # (doors, digging) so the cell is redrawn and the listeners
+        # refresh it
+        self.grid[pos] = tile
+        self.dirty.add(pos)
+        for listener in self.listeners:
+            listener(pos)
+
+    def watch(self, listener):
+        self.listeners.append(listener)
+
+    def unwatch(self, listener):
+        self.listeners.remove(listener)
+
+    def tile_mask(self, attr, empty=False, window=None, out=None):
+        # Boolean plane of one tile attribute, <empty> for blank cells.
+        # <window> (a pair of slices) limits the cells read, a chunked
+        # grid then only generates the chunks it overlaps.  <out> is a
+        # plane to fill in place of a new one, only the window is written
+        grid = self.grid
+        if out is None:
+            out = np.full(self.bounds, empty, dtype=bool)
+        if hasattr(grid, 'palette'):
+            lookup = np.array([getattr(t, attr) if t else empty
+                               for t in grid.palette], dtype=bool)
+        if isinstance(grid, ChunkedGrid):
+            # One palette lookup per chunk, each chunk is read once
+            for cells, ids in grid.chunks(window):
+                out[cells] = lookup[ids]
+            return out
+        if window is None:
+            window = slice(None), slice(None)
+        if hasattr(grid, 'ids'):
+            out[window] = lookup[grid.ids[window]]
+            return out
+        ys, xs = window
+        for y in range(*ys.indices(self.bounds[0])):
+            for x in range(*xs.indices(self.bounds[1])):
+                tile = grid[y, x]
+                out[y, x] = getattr(tile, attr) if tile else empty
+        return out
+
+    def find_open(self):
+        # First passable cell in row-major order, None if there is none
+        if type(self.grid) is TileGrid:
+            passable = [i for i, t in enumerate(self.grid.palette)
+                        if getattr(t, 'passable', False)]
+            found = np.argwhere(np.isin(self.grid.ids, passable))
+            return tuple(found[0].tolist()) if len(found) else None
+        for y in range(self.bounds[0]):
+            for x in range(self.bounds[1]):
+                if getattr(self.grid[y, x], 'passable', False):
+                    return y, x
+        return None
+
+    def save(self, path, encode=None):
+        # Only whole compact grids have a tile plane to write
+        if type(self.grid) is not TileGrid:
+            raise TypeError('Only compact (TileGrid) maps can be saved')
+        write_level(path, self.grid.ids, self.state.visited,
+                    self.state.items, self.state.entities, encode)
+
+    @classmethod
+    def load(cls, path, palette=None, decode=None):
+        ids, visited, items, entities = read_level(path, decode)
+        grid = TileGrid.from_ids(ids, tile_types() if palette is None
+                                 else palette)
+        retval = cls(ids.shape, grid=grid)
+        retval.state.visited = visited
+        retval.state.load_tables(items, entities)
+        return retval
+
+def generate_level(bounds, level, dtype=np.uint8, seed=None, style=None):
+    """ Tile ids for a new level, also run by the prefetch worker """
+    if style is None:
+        return np.zeros(bounds, dtype=dtype)
+    return DungeonGenerator(seed, dtype).generate(bounds, level, style)
+
+
+def _prefetch_level(bounds, level, seed, style):
+    # Prefetch worker entry point, the tile plane is sent back as a
+    # compact byte buffer rather than a pickled grid
+    return generate_level(bounds, level, seed=seed, style=style).tobytes()
+
+
+class SlotView(MutableMapping):
+
+    """ Dict view of an object's slots, reads and writes go to the
+    object.  Keys cannot be added or removed """
+
+    __slots__ = ('_obj',)
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def __getitem__(self, key):
+        if key not in self._obj.__slots__:
+            raise KeyError(key)
+        return getattr(self._obj, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._obj.__slots__:
+            raise KeyError(key)
+        setattr(self._obj, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError('{} keys cannot be removed'.format(
+            type(self._obj).__name__))
+
+    def __iter__(self):
+        return iter(self._obj.__slots__)
+
+    def __len__(self):
+        return len(self._obj.__slots__)
+
 
 class MapTile(object):
 
+    __slots__ = ('character', 'mode')
+
     def __init__(self, pos):
-        self.items = {}
-        self.items['character'] = ' '           # Default to blank space
-        self.items['mode'] = curses.A_NORMAL    # Default to normal output mode
+        self.character = ' '            # Default to blank space
+        self.mode = a_modes['normal']   # Default to normal output mode
+
+    @property
+    def items(self):
+        # The old per-tile dict, tile.items['mode'] = x still sets mode
+        return SlotView(self)
 
 class MapGenerator(object):
 
-    def __init__(self, dimy, dimx):
+    def __init__(self, dimy, dimx, compact=False, chunked=False,
+                 chunk_size=64, max_chunks=256, store_path=None,
+                 prefetch=False, prefetch_prev=False, seed=None,
+                 style='bsp', level_cache=None):
+        if chunked and prefetch:
+            raise ValueError('Prefetch builds whole levels, it cannot be '
+                             'combined with the chunked world mode')
         self.map = {}
         self.next_map = 0
         self.bounds = dimy, dimx
+        self.chunked = chunked
+        self.chunk_size = chunk_size
+        # One cache for all levels, so memory stays flat however many
+        # levels a session visits
+        self.chunk_cache = ChunkCache(max_chunks, store_path) if chunked \
+                           else None
+        # Prefetched levels are always compact, generated one at a
+        # time in a single worker process
+        self.compact = compact or prefetch
+        self.prefetch_prev = prefetch_prev
+        self.executor = ProcessPoolExecutor(max_workers=1) if prefetch \
+                        else None
+        self._pending = {}      # level -> future of the tile-id buffer
+        # Resolve the seed once so in-process and prefetched levels
+        # match, style None keeps the old empty levels
+        self.seed = DungeonGenerator(seed).seed
+        self.style = style
+        # Directory of saved levels, dropped compact levels are written
+        # here and memory-mapped back instead of regenerated
+        self.level_cache = level_cache
+        if level_cache is not None:
+            os.makedirs(level_cache, exist_ok=True)
+
+    def _generate(self, level):
+        return generate_level(self.bounds, level, seed=self.seed,
+                              style=self.style)
+
+    def _chunk_fill(self, level):
+        # Per-chunk generator for a chunked level, None (blank chunks)
+        # without a style
+        if self.style is None:
+            return None
+        generator = DungeonGenerator(self.seed)
+
+        def fill(y0, x0, shape):
+            return generator.chunk(self.bounds, (y0, x0), shape, level,
+                                   self.style)
+        return fill
+
+    def _new_map(self, level):
+        if self.chunked:
+            grid = ChunkedGrid(self.bounds, self.chunk_cache, level,
+                               tile_types(), self.chunk_size,
+                               fill=self._chunk_fill(level))
+            return Map(self.bounds, grid=grid)
+        cached = self._cache_file(level)
+        if cached is not None and os.path.exists(cached):
+            return Map.load(cached, decode=decode_object)
+        if level in self._pending:
+            # Blocks only if the worker has not finished yet
+            buf = self._pending.pop(level).result()
+            ids = np.frombuffer(bytearray(buf), dtype=np.uint8)
+            grid = TileGrid.from_ids(ids.reshape(self.bounds), tile_types())
+            return Map(self.bounds, grid=grid)
+        if self.compact:
+            grid = TileGrid.from_ids(self._generate(level), tile_types())
+            return Map(self.bounds, grid=grid)
 
-    def add_map(self):
         retval = Map(self.bounds)
-        self.map[self.next_map] = retval
+        if self.style is not None:
+            palette = tile_types()
+            ids = self._generate(level)
+            ys, xs = np.nonzero(ids)
+            for y, x, t in zip(ys.tolist(), xs.tolist(), ids[ys, xs].tolist()):
+                retval.grid[y, x] = palette[t]
+        return retval
+
+    def add_map(self):
+        level = self.next_map
+        retval = self._new_map(level)
+        self.map[level] = retval
         self.next_map += 1
+        self.prefetch(level)
         return retval
 
     def get_map(self, level):
         if level in self.map:
-            return self.map[level]
+            retval = self.map[level]
         elif level == self.next_map:
-            self.add_map()
-            return self.map[level]
+            return self.add_map()
+        elif 0 <= level < self.next_map:
+            # Previously dropped level, rebuilt (or collected from
+            # the prefetch worker) on demand
+            retval = self.map[level] = self._new_map(level)
+        else:
+            return None
+        self.prefetch(level)
+        return retval
+
+    def _cache_file(self, level):
+        if self.level_cache is None:
+            return None
+        return os.path.join(self.level_cache, 'level_{}.lvl'.format(level))
+
+    def drop_map(self, level):
+        # Release a level, get_map will reload or rebuild it when
+        # revisited.  It is only released once it has been written,
+        # a failed save raises and leaves it loaded
+        retval = self.map.get(level)
+        if retval is not None and self.level_cache is not None \
+                and type(retval.grid) is TileGrid:
+            retval.save(self._cache_file(level), encode_object)
+        self.map.pop(level, None)
+
+    def prefetch(self, level):
+        # Start generating the levels next to <level> in the worker
+        if self.executor is None:
+            return
+        targets = [level + 1]
+        if self.prefetch_prev:
+            targets.append(level - 1)
+        for lvl in targets:
+            cached = self._cache_file(lvl)
+            if 0 <= lvl <= self.next_map and lvl not in self.map \
+                    and lvl not in self._pending \
+                    and not (cached and os.path.exists(cached)):
+                self._pending[lvl] = self.executor.submit(
+                    _prefetch_level, self.bounds, lvl, self.seed, self.style)
+
+    def close(self):
+        if self.chunk_cache is not None:
+            self.chunk_cache.close()
+        if self.executor is not None:
+            # shutdown(cancel_futures=True) needs Python 3.9
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self.executor.shutdown()
+            self.executor = None
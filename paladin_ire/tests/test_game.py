@@ -0,0 +1,751 @@
+# -*- coding: utf-8 -*-
+
+# Game tests
+# Game and world generation modules.  Windows run on a Screen with a
+# NullBackend: nothing is drawn and the keys come from a list, so
+# menus can be driven without a terminal
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+
+# The game packages are imported from paladin_ire/, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from game.base_tiles import get_tile
+from game.catalog import EntityCatalog, decode_object, encode_object, \
+    entity_from_record, entity_record
+from game.classes import CLASSES, Warrior
+from game.core import Entity
+from game.dice import Dice
+from game.entity_store import EntityStore
+from game.fov import FieldOfView
+from game.loop import GameLoop
+from game.menu import ClassSelection, Menu, MenuItem, OptionMenu
+from game.pathfinding import Pathfinder
+from game.player import Player
+from game.scheduler import TurnScheduler
+from game.session import GameSession
+from game.screen import A_BOLD, KEY_BACKSPACE, KEY_DOWN, KEY_LEFT, \
+    KEY_RIGHT, KEY_UP, NullBackend, Screen
+from game.spatial import SpatialIndex
+from game.windows import MapWindow
+from scripts.level_format import read_level, write_level
+from scripts.world_generation import Map, MapGenerator
+
+ENTER = ord('\n')
+
+
+class App(object):
+
+    """ The parts of the application the windows read """
+
+    def __init__(self):
+        self.args = argparse.Namespace(debug=False, verbose=False,
+                                       difficulty=1, map_size=(60, 60),
+                                       seed=1)
+        self.player = Player()
+
+
+class ScreenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.screen = Screen(4, 10, NullBackend())
+        self.window = self.screen.window(2, 5, 1, 2)
+        # The screen only holds weak references to its panels
+        self.panel = self.screen.new_panel(self.window)
+
+    def test_first_frame_sends_every_cell(self):
+        self.assertEqual(self.screen.present(), 40)
+
+    def test_only_changed_cells_are_sent(self):
+        self.screen.present()
+        self.assertEqual(self.screen.present(), 0)
+        self.window.addstr(0, 1, 'ab', A_BOLD)
+        self.assertEqual(self.screen.present(), 2)
+        self.assertEqual(self.screen.text()[1], '   ab     ')
+        self.assertEqual(self.screen.attrs[1, 3], A_BOLD)
+
+    def test_hidden_panels_are_not_drawn(self):
+        panel = self.screen.new_panel(self.screen.window(1, 3, 0, 0))
+        panel.window().addstr(0, 0, 'xyz')
+        panel.hide()
+        self.screen.present()
+        self.assertEqual(self.screen.text()[0], ' ' * 10)
+        panel.show()
+        self.assertEqual(self.screen.present(), 3)
+        self.assertEqual(self.screen.text()[0], 'xyz       ')
+
+    def test_pushback_is_read_first(self):
+        screen = Screen(4, 10, NullBackend([ord('b')]))
+        screen.ungetch(ord('a'))
+        self.assertEqual([screen.getch(), screen.getch()],
+                         [ord('a'), ord('b')])
+        self.assertRaises(EOFError, screen.getch)
+
+
+class KeyRoutingTest(unittest.TestCase):
+
+    def test_keys_after_a_window_opens_go_to_it(self):
+        app = App()
+        backend = NullBackend([ENTER, KEY_UP, ENTER, KEY_DOWN, ord('q')])
+        screen = Screen(40, 100, backend)
+
+        async def class_select():
+            menu = ClassSelection(screen, app)
+            menu.post_init()
+            return await menu.run()
+
+        menu = Menu(screen, app)
+        menu.post_init([MenuItem('Select Class', class_select, 0)])
+        menu.display()
+        # ClassSelection starts on the fourth class, up then enter
+        # picks the third.  Down and q reach the main menu
+        self.assertIsInstance(app.player.player_class, CLASSES[2])
+        self.assertEqual(menu.position, 1)
+        self.assertEqual(screen.pushback, [])
+
+    def test_keys_after_a_window_closes_stay_queued(self):
+        screen = Screen(40, 100, NullBackend([ord('q'), KEY_DOWN, ENTER]))
+        window = MapWindow(screen, App())
+        window.display()
+        self.assertEqual(screen.pushback, [KEY_DOWN, ENTER])
+
+    def test_map_keys(self):
+        keys = [KEY_UP, KEY_DOWN, ord(' '), 27, ENTER, KEY_LEFT, KEY_RIGHT,
+                ord('q'), KEY_DOWN]
+        screen = Screen(40, 100, NullBackend(keys))
+        window = MapWindow(screen, App())
+        acts = []
+        window.session.act = acts.append
+        window.display()
+        # Unbound keys (escape included) do nothing, q closes the map
+        self.assertEqual(acts, ['up', 'down', 'left', 'right'])
+        self.assertEqual(screen.pushback, [KEY_DOWN])
+
+    def test_option_keys_in_one_batch(self):
+        app = App()
+        keys = [KEY_UP, ENTER, ENTER, KEY_BACKSPACE, KEY_UP, ENTER,
+                KEY_DOWN, KEY_DOWN, ENTER]
+        menu = OptionMenu(Screen(40, 100, NullBackend(keys)), app)
+        menu.post_init()
+        menu.display()
+        self.assertEqual(app.args.difficulty, 2)
+        self.assertIs(app.args.debug, True)
+
+    def test_prompts_read_the_rest_of_the_batch(self):
+        app = App()
+        keys = [ord('n')] + list(b'Zed') + [ENTER, KEY_DOWN, ord('q')]
+        screen = Screen(40, 100, NullBackend(keys))
+        menu = Menu(screen, app)
+        menu.post_init([MenuItem('Play', None, 0)])
+        menu.display()
+        self.assertEqual(app.player.name, 'Zed')
+        self.assertEqual(menu.position, 1)
+
+    def test_save_entity(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(path)
+        os.mkdir('entities')
+        app = App()
+        app.player.player_class = Warrior()
+        app.player.roll_attributes()
+        app.player.complete_init()
+        keys = [ord('s')] + list(b'orcx') + [KEY_BACKSPACE, ENTER, ord('y'),
+                                              ord('q')]
+        menu = Menu(Screen(40, 100, NullBackend(keys)), app)
+        menu.post_init([])
+        menu.display()
+        catalog = EntityCatalog('entities')
+        self.assertEqual(catalog.find(player_class='Warrior'), ['orc'])
+        self.assertEqual(catalog.load('orc')['attributes']['health'],
+                         app.player.health)
+
+    def test_running_out_of_keys_raises_eoferror(self):
+        app = App()
+        screen = Screen(40, 100, NullBackend([KEY_DOWN]))
+        menu = Menu(screen, app)
+        menu.post_init([])
+        self.assertRaises(EOFError, menu.display)
+        self.assertEqual(menu.position, 0)
+
+
+class GameLoopTest(unittest.TestCase):
+
+    def test_frame_for_keys_covers_requested_frame(self):
+        screen = Screen(4, 10, NullBackend([KEY_UP]))
+        loop = GameLoop(screen)
+
+        async def frames():
+            loop.request_frame()
+            keys = await loop.keys()
+            loop.frame_drawn()
+            # Nothing left to draw, the next call waits for a key
+            await loop.keys()
+            return keys
+
+        self.assertRaises(EOFError, loop.run, frames())
+
+    def test_requested_frame_without_keys(self):
+        loop = GameLoop(Screen(4, 10, NullBackend()))
+
+        async def frames():
+            loop.request_frame()
+            return await loop.keys()
+
+        self.assertEqual(loop.run(frames()), [])
+
+
+
+def grid_ids(grid):
+    # Every tile id of a chunked grid as one array
+    ids = np.zeros(grid.shape, dtype=grid.dtype)
+    for window, chunk in grid.chunks():
+        ids[window] = chunk
+    return ids
+
+
+class ChunkedWorldTest(unittest.TestCase):
+
+    def setUp(self):
+        # Four 16x16 chunks fit in the cache, a 96x96 level has 36
+        self.gen = MapGenerator(96, 96, chunked=True, chunk_size=16,
+                                max_chunks=4, seed=3)
+        self.level = self.gen.add_map()
+
+    def tearDown(self):
+        self.gen.close()
+
+    def test_memory_stays_bounded(self):
+        grid_ids(self.level.grid)
+        self.assertEqual(len(self.gen.chunk_cache), 4)
+
+    def test_evicted_chunks_reload_the_same(self):
+        first = grid_ids(self.level.grid)
+        np.testing.assert_array_equal(grid_ids(self.level.grid), first)
+        other = MapGenerator(96, 96, chunked=True, chunk_size=16,
+                             max_chunks=64, seed=3)
+        try:
+            np.testing.assert_array_equal(
+                grid_ids(other.add_map().grid), first)
+        finally:
+            other.close()
+
+    def test_changes_survive_eviction(self):
+        wall, floor = get_tile('Wall'), get_tile('Hallway')
+        tile = floor if self.level.grid[1, 1] is wall else wall
+        self.level.set_tile((1, 1), tile)
+        grid_ids(self.level.grid)
+        self.assertNotIn((0, 0, 0), self.gen.chunk_cache._chunks)
+        self.assertIs(self.level.grid[1, 1], tile)
+
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def test_prefetched_levels_match(self):
+        prefetched = MapGenerator(40, 60, seed=5, prefetch=True)
+        local = MapGenerator(40, 60, compact=True, seed=5)
+        try:
+            prefetched.add_map()
+            self.assertIn(1, prefetched._pending)
+            prefetched.add_map()
+            local.add_map()
+            local.add_map()
+            np.testing.assert_array_equal(prefetched.map[1].grid.ids,
+                                          local.map[1].grid.ids)
+            self.assertNotIn(1, prefetched._pending)
+        finally:
+            prefetched.close()
+            local.close()
+
+
+
+class LevelFormatTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'level')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        ids = np.arange(12 * 9, dtype=np.uint16).reshape(12, 9)
+        visited = {(0, 0), (3, 8), (11, 4)}
+        items = {(1, 2): ['potion', 'potion'], (5, 5): ['key']}
+        entities = {(2, 3): [{'name': 'rat'}]}
+        write_level(self.path, ids, visited, items, entities)
+        r_ids, r_visited, r_items, r_entities = read_level(self.path)
+        self.assertEqual(r_ids.dtype, ids.dtype)
+        np.testing.assert_array_equal(r_ids, ids)
+        self.assertEqual(r_visited, visited)
+        self.assertEqual(r_items, items)
+        self.assertEqual(r_entities, entities)
+
+    def test_encode_and_decode(self):
+        ids = np.zeros((3, 3), dtype=np.uint8)
+        write_level(self.path, ids, set(), {(1, 1): [7]}, {},
+                    encode=lambda n: {'n': n})
+        _, visited, items, _ = read_level(self.path,
+                                          decode=lambda obj: obj['n'])
+        self.assertEqual(visited, set())
+        self.assertEqual(items, {(1, 1): [7]})
+
+    def test_not_a_level(self):
+        with open(self.path, 'wb') as outf:
+            outf.write(b'\x00' * 128)
+        self.assertRaises(ValueError, read_level, self.path)
+
+
+class FieldOfViewTest(unittest.TestCase):
+
+    def setUp(self):
+        # 7x9 open map, empty cells are open space
+        self.level = Map((7, 9), compact=True)
+        self.wall = get_tile('Wall')
+
+    def test_open_map_sees_the_whole_radius(self):
+        view = FieldOfView(self.level).compute((3, 3), 2)
+        expected = set((y, x) for y in range(7) for x in range(9)
+                       if (y - 3) ** 2 + (x - 3) ** 2 <= 4)
+        self.assertEqual(view.cells(), expected)
+
+    def test_walls_cast_shadows(self):
+        for y in (2, 3, 4):
+            self.level.set_tile((y, 5), self.wall)
+        view = FieldOfView(self.level).compute((3, 3), 4)
+        # The wall is seen, the cells behind it are not
+        for y in (2, 3, 4):
+            self.assertIn((y, 5), view)
+        for x in (6, 7):
+            self.assertNotIn((3, x), view)
+        self.assertIn((3, 4), view)
+        self.assertIn((0, 5), view)
+
+    def test_set_tile_updates_the_view(self):
+        fov = FieldOfView(self.level)
+        self.level.watch(fov.refresh_cell)
+        fov.update((3, 3), 4)
+        far = fov.compute((0, 0), 1)
+        self.assertTrue(fov.is_visible((3, 6)))
+        self.level.set_tile((3, 5), self.wall)
+        changed = fov.update((3, 3), 4)
+        self.assertFalse(fov.is_visible((3, 6)))
+        self.assertIn((3, 6), changed)
+        self.assertTrue(fov.is_visited((3, 6)))
+        # Results the wall cannot affect stay cached
+        self.assertIs(fov.compute((0, 0), 1), far)
+
+
+
+class PathfinderTest(unittest.TestCase):
+
+    def setUp(self):
+        # 7x9 floor split by a wall down column 4, open at the bottom
+        self.level = Map((7, 9), compact=True)
+        self.floor, self.wall = get_tile('Hallway'), get_tile('Wall')
+        for y in range(7):
+            for x in range(9):
+                self.level.grid[y, x] = self.wall if x == 4 and y < 6 \
+                    else self.floor
+        self.paths = Pathfinder(self.level)
+        self.level.watch(self.paths.refresh_cell)
+
+    def test_nothing_is_read_before_a_search(self):
+        self.assertIsNone(self.paths.passable)
+        self.assertEqual(len(self.paths._stamp), 0)
+
+    def test_shortest_path(self):
+        path = self.paths.astar((0, 0), (0, 8))
+        # Down to the gap, across and back up
+        self.assertEqual(len(path), 6 + 8 + 6)
+        self.assertEqual(path[-1], (0, 8))
+        self.assertIn((6, 4), path)
+
+    def test_unreachable(self):
+        self.level.set_tile((6, 4), self.wall)
+        self.assertIsNone(self.paths.astar((0, 0), (0, 8)))
+        self.assertIsNone(self.paths.astar((0, 0), (0, 4)))
+        self.assertIsNone(self.paths.flow_field([(0, 0)]).distance((0, 8)))
+
+    def test_arena_is_reused(self):
+        self.paths.astar((0, 0), (0, 8))
+        arena, search = self.paths._stamp, self.paths._search
+        size = len(arena)
+        self.assertEqual(len(self.paths.astar((6, 0), (6, 8))), 8)
+        self.assertEqual(len(self.paths.astar((0, 0), (0, 8))), 20)
+        self.assertIs(self.paths._stamp, arena)
+        self.assertEqual(len(arena), size)
+        self.assertEqual(self.paths._search, search + 2)
+
+    def test_set_tile_refreshes_paths_and_fields(self):
+        field = self.paths.flow_field([(0, 0)])
+        self.assertEqual(field.distance((0, 8)), 20)
+        self.assertIs(self.paths.flow_field([(0, 0)]), field)
+        self.level.set_tile((0, 4), self.floor)
+        self.assertEqual(len(self.paths.astar((0, 0), (0, 8))), 8)
+        field = self.paths.flow_field([(0, 0)])
+        self.assertEqual(field.distance((0, 8)), 8)
+        self.assertEqual(field.next_step((0, 8)), (0, 7))
+
+
+
+class Marker(object):
+
+    def __init__(self, is_player=False):
+        self.is_player = is_player
+
+
+class SpatialIndexTest(unittest.TestCase):
+
+    def test_equal_objects_are_placed_apart(self):
+        index = SpatialIndex()
+        potion = 'potion'
+        index.add(potion, (1, 1))
+        index.add(potion, (2, 2))
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.remove(potion, (2, 2)), (2, 2))
+        self.assertEqual(index.where(potion), (1, 1))
+        self.assertNotIn((2, 2), index)
+        self.assertRaises(KeyError, index.remove, potion, (2, 2))
+
+    def test_remove_is_by_identity(self):
+        index = SpatialIndex()
+        a, b = [1000], [1000]
+        index.add(a, (0, 0))
+        index.add(b, (0, 0))
+        index.remove(b)
+        self.assertIs(index.at((0, 0))[0], a)
+
+    def test_players(self):
+        index = SpatialIndex()
+        player = Marker(is_player=True)
+        index.add(Marker(), (4, 4))
+        index.add(player, (3, 3))
+        self.assertTrue(index.has_player((3, 3)))
+        self.assertEqual(index.move(player, (4, 4)), (3, 3))
+        self.assertFalse(index.has_player((3, 3)))
+        self.assertTrue(index.has_player((4, 4)))
+
+    def test_within(self):
+        index = SpatialIndex(bucket=4)
+        for pos in [(0, 0), (5, 5), (9, 9), (20, 20)]:
+            index.add(Marker(), pos)
+        found = sorted(pos for pos, _ in index.within((6, 6), 3))
+        self.assertEqual(found, [(5, 5), (9, 9)])
+
+
+class EntityStoreTest(unittest.TestCase):
+
+    effects = [(3, 0, 1, 0), (0, 0, 0, 0), (1, 2, 0, 5), (0, 4, 0, 1)]
+
+    def pair(self, effects):
+        plain, stored = Entity(), self.store.new()
+        for entity in plain, stored:
+            for name, value in zip(Entity.status_effects[0], effects):
+                setattr(entity, name, value)
+        return plain, stored
+
+    def setUp(self):
+        self.store = EntityStore(capacity=2)
+        self.pairs = [self.pair(effects) for effects in self.effects]
+
+    def assertSameEffects(self):
+        for plain, stored in self.pairs:
+            for name in Entity.status_effects[0]:
+                self.assertEqual(getattr(plain, name), getattr(stored, name))
+
+    def test_batch_pass_matches_pre_turn(self):
+        names = Entity.status_effects[0]
+        for _ in range(6):
+            before = [(stored.version,
+                       any(getattr(stored, name) for name in names))
+                      for _, stored in self.pairs]
+            self.store.pre_turn()
+            for plain, _ in self.pairs:
+                plain.pre_turn()
+            self.assertSameEffects()
+            # Only entities with an effect still running changed
+            for (_, stored), (version, active) in zip(self.pairs, before):
+                self.assertEqual(stored.version != version, active)
+        self.assertEqual(self.store.blocks['status_effects'].sum(), 0)
+
+    def test_several_turns_and_rows(self):
+        self.store.pre_turn(turns=2, rows=[0, 2])
+        for plain, _ in self.pairs[0], self.pairs[2]:
+            plain.pre_turn()
+            plain.pre_turn()
+        self.assertSameEffects()
+
+    def test_stored_entities_keep_turn_order(self):
+        # At base speed one round is one turn, store rows counted down
+        # once per round act on the same ticks as entities counting
+        # down in their own pre_turn
+        self.pairs = [self.pair((blind, paralyzed, 0, 0))
+                      for blind, paralyzed in [(0, 3), (2, 1), (0, 0)]]
+        scheduler = TurnScheduler()
+        scheduler.every_round(self.store.pre_turn)
+        for plain, stored in self.pairs:
+            scheduler.add(plain)
+            scheduler.add(stored)
+        turns = {}
+        for _ in range(40):
+            actor = scheduler.next_actor()
+            turns.setdefault(id(actor), []).append(scheduler.time)
+            scheduler.end_turn(actor)
+        for plain, stored in self.pairs:
+            self.assertEqual(turns[id(plain)], turns[id(stored)])
+        self.assertEqual(turns[id(self.pairs[0][0])][0], 30.)
+
+    def test_stored_entities_are_smaller(self):
+        self.assertLess(sys.getsizeof(self.store.new()),
+                        sys.getsizeof(Entity()))
+        self.assertFalse(hasattr(self.store.new(), '__dict__'))
+
+
+class StatCacheTest(unittest.TestCase):
+
+    def entities(self):
+        yield Entity()
+        yield EntityStore().new()
+
+    def test_attribute_change_drops_its_stats_only(self):
+        for entity in self.entities():
+            entity.player_class = Warrior()
+            stats = sorted(entity._skills_enabled)
+            for stat in stats:
+                entity.get_stat(stat)
+            entity.strength += 2
+            dropped = {'carry', 'kick', 'bash', 'block', 'max_damage'}
+            self.assertEqual(sorted(entity._stat_cache),
+                             sorted(set(stats) - dropped))
+            # Recomputed from the new value on the next read
+            self.assertEqual(entity.get_stat('kick'), entity.level +
+                             entity.strength)
+
+    def test_level_change_drops_every_stat(self):
+        for entity in self.entities():
+            entity.player_class = Warrior()
+            for stat in entity._skills_enabled:
+                entity.get_stat(stat)
+            version = entity.version
+            entity.level += 1
+            self.assertEqual(entity._stat_cache, {})
+            self.assertGreater(entity.version, version)
+
+
+class Actor(object):
+
+    def __init__(self, name, speed=TurnScheduler.BASE_SPEED):
+        self.name = name
+        self.speed = speed
+        self.fast = 0
+        self.paralyzed = 0
+
+
+class TurnSchedulerTest(unittest.TestCase):
+
+    def turns(self, scheduler, n):
+        names = []
+        for _ in range(n):
+            actor = scheduler.next_actor()
+            names.append(actor.name)
+            scheduler.end_turn(actor)
+        return names
+
+    def test_faster_actors_act_more_often(self):
+        scheduler = TurnScheduler()
+        scheduler.add(Actor('slow'))
+        scheduler.add(Actor('quick', speed=20))
+        self.assertEqual(self.turns(scheduler, 6),
+                         ['slow', 'quick', 'quick', 'slow', 'quick',
+                          'quick'])
+
+    def test_paralyzed_actors_lose_turns(self):
+        scheduler = TurnScheduler()
+        stuck, free = Actor('stuck'), Actor('free')
+        stuck.paralyzed = 1
+        scheduler.add(stuck)
+        scheduler.add(free)
+        self.assertEqual(self.turns(scheduler, 2), ['free', 'free'])
+        self.assertIn(stuck, scheduler)
+
+    def test_removed_actors_are_skipped(self):
+        scheduler = TurnScheduler()
+        gone = Actor('gone')
+        scheduler.add(gone)
+        scheduler.add(Actor('left'))
+        scheduler.remove(gone)
+        self.assertEqual(len(scheduler), 1)
+        self.assertEqual(self.turns(scheduler, 2), ['left', 'left'])
+
+    def test_round_hooks(self):
+        scheduler = TurnScheduler()
+        rounds = []
+        scheduler.every_round(rounds.append)
+        scheduler.add(Actor('slow', speed=4))
+        self.assertEqual(self.turns(scheduler, 3), ['slow'] * 3)
+        # Turns at 0, 25 and 50 ticks, rounds end every 10
+        self.assertEqual(rounds, [2, 3])
+
+
+
+class DiceTest(unittest.TestCase):
+
+    def test_same_seed_same_rolls(self):
+        a, b = Dice(7).stream('combat'), Dice(7).stream('combat')
+        self.assertEqual([a.randint(0, 100) for _ in range(200)],
+                         [b.randint(0, 100) for _ in range(200)])
+        self.assertEqual(a.rolls(0, 6, 10).tolist(),
+                         b.rolls(0, 6, 10).tolist())
+        self.assertNotEqual(Dice(8).stream('combat').random(),
+                            Dice(7).stream('combat').random())
+
+    def test_rolls_do_not_depend_on_the_buffer(self):
+        dice = Dice(3)
+        expected = np.random.default_rng(dice.seed).random(150).tolist()
+        self.assertEqual([dice.random() for _ in range(150)], expected)
+
+    def test_streams_are_independent(self):
+        root = Dice(5)
+        one = root.stream('entity', 1)
+        rolls = [one.random() for _ in range(5)]
+        # Rolling from other streams does not shift this one
+        for key in ('entity', 2), ('combat',):
+            other = root.stream(*key)
+            for _ in range(500):
+                other.random()
+        one = root.stream('entity', 1)
+        self.assertEqual([one.random() for _ in range(5)], rolls)
+        two = root.stream('entity', 2)
+        self.assertNotEqual([two.random() for _ in range(5)], rolls)
+
+    def test_only_named_streams_are_kept(self):
+        root = Dice(5)
+        self.assertIs(root.stream('combat'), root.stream('combat'))
+        for i in range(100):
+            root.stream('entity', i).random()
+        self.assertEqual(list(root._streams), [(zlib.crc32(b'combat'),)])
+
+    def test_roll_ranges(self):
+        dice = Dice(11)
+        rolls = [dice.randint(3, 7) for _ in range(1000)]
+        self.assertEqual(sorted(set(rolls)), [3, 4, 5, 6])
+        self.assertIn(dice.choice('abc'), 'abc')
+        batch = dice.rolls(np.zeros(500, int), np.arange(1, 501), 500)
+        self.assertTrue((batch >= 0).all() and
+                        (batch < np.arange(1, 501)).all())
+        self.assertRaises(ValueError, dice.randint, 4, 4)
+
+
+class StatBlockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blocks = Entity.stat_blocks
+
+    def test_bounds(self):
+        rng = np.random.default_rng(1)
+        for level in (1, 5):
+            blocks = self.blocks.sample(500, level=level, rng=rng)
+            self.assertEqual(blocks.shape, (500, len(self.blocks.names)))
+            self.assertTrue((blocks >= self.blocks.values[0]).all())
+            # Everything but keep_free points is spent
+            self.assertTrue((blocks.sum(axis=1) ==
+                             self.blocks.attr_limit(level) -
+                             self.blocks.keep_free).all())
+
+    def test_unreachable_level(self):
+        self.assertRaises(ValueError, self.blocks.check_level, 10)
+        self.assertRaises(ValueError, self.blocks.sample, 1, level=10)
+
+
+class EntityCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def template(self, name, level=1, player_class=Warrior, mtime=None):
+        entity = Entity()
+        entity.name = name
+        entity.level = level
+        entity.player_class = player_class()
+        entity.roll_attributes()
+        entity.paralyzed = 2
+        entity.complete_init()
+        fname = os.path.join(self.path, name)
+        with open(fname, 'w') as outf:
+            json.dump(entity_record(entity), outf)
+        if mtime is not None:
+            os.utime(fname, ns=(mtime, mtime))
+        return entity
+
+    def assertSameEntity(self, a, b):
+        self.assertEqual(entity_record(a), entity_record(b))
+        self.assertEqual((a.hitpoints, a.max_hp, a.magic),
+                         (b.hitpoints, b.max_hp, b.magic))
+
+    def test_round_trip(self):
+        entity = self.template('orc', level=3)
+        record = entity_record(entity)
+        self.assertSameEntity(entity_from_record(record), entity)
+        stored = entity_from_record(record, store=EntityStore())
+        self.assertSameEntity(stored, entity)
+        decoded = decode_object(json.loads(json.dumps(encode_object(stored))))
+        self.assertIs(type(decoded), Entity)
+        self.assertSameEntity(decoded, entity)
+        self.assertSameEntity(EntityCatalog(self.path).spawn('orc'), entity)
+
+    def test_refresh_by_mtime(self):
+        self.template('orc', mtime=10 ** 18)
+        self.template('imp', level=2, player_class=CLASSES[1])
+        catalog = EntityCatalog(self.path)
+        self.assertEqual(catalog.find(player_class='Mage', level=2), ['imp'])
+        self.assertEqual(catalog.refresh(), 0)
+        # A new catalog reads the index, not the templates
+        reopened = EntityCatalog(self.path)
+        self.assertEqual(reopened.entries, catalog.entries)
+        self.template('orc', level=4, mtime=10 ** 18 + 1)
+        os.remove(os.path.join(self.path, 'imp'))
+        self.assertEqual(catalog.refresh(), 2)
+        self.assertEqual(catalog.find(), ['orc'])
+        self.assertEqual(catalog.find(level=4), ['orc'])
+        self.assertEqual(catalog.load('orc')['meta']['level'], 4)
+
+    def test_levels_are_populated(self):
+        self.template('orc')
+        session = GameSession(Player(), (30, 30), seed=1,
+                              catalog=EntityCatalog(self.path))
+        self.addCleanup(session.close)
+        state = session.current_level.state
+        self.assertEqual(len(session.monsters), 4)
+        for monster in session.monsters:
+            self.assertEqual(monster.name, 'orc')
+            self.assertIn(monster, session.scheduler)
+            self.assertTrue(session.current_level.grid[
+                state.where(monster)].passable)
+        # Stored status effects wear off a round at a time
+        for _ in range(2):
+            session.act('wait')
+        self.assertEqual([m.paralyzed for m in session.monsters], [0] * 4)
+        # The next level's monsters reuse the rows freed by these
+        left = session.monsters
+        session.enter_level(session.map_gen.add_map())
+        self.assertEqual(len(session.monsters), 4)
+        self.assertEqual(session.store.size, 4)
+        self.assertFalse(any(m in session.scheduler for m in left))
+
+
+if __name__ == '__main__':
+    unittest.main()
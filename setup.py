@@ -19,6 +19,7 @@ setup(
         ],
     py_modules=['paladin_ire'],
     packages=find_packages(),
+    install_requires=['numpy'],
     entry_points="""
         [console_scripts]
         paladin_ire=paladin_ire